@@ -7,7 +7,7 @@ from globaleaks import models
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.user import db_get_users
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_batch
 from globaleaks.rest.cache import Cache
 from globaleaks.state import State
 from globaleaks.transactions import db_schedule_email
@@ -22,6 +22,9 @@ ANOMALY_MAP = {
     'successful_logins': 20
 }
 
+# Sliding window in seconds over which the events are compared with the thresholds
+ANOMALY_WINDOW = 3600
+
 
 def get_disk_anomaly_conditions(free_workdir_bytes, total_workdir_bytes):
     free_disk_megabytes = free_workdir_bytes / (1024 * 1024)
@@ -74,7 +77,7 @@ def generate_admin_alert_mail(session, tid, alert):
         db_schedule_email(session, tid, user_desc['mail_address'], subject, body)
 
 
-@transact
+@transact_batch
 def save_anomalies(session):
     for tid in State.tenant_state:
         for anomaly in State.tenant_state[tid].AnomaliesQ:
@@ -113,9 +116,7 @@ class Alarm(object):
 
         self.event_matrix.clear()
 
-        for event in State.tenant_state[tid].RecentEventQ:
-            self.event_matrix.setdefault(event.event_type, 0)
-            self.event_matrix[event.event_type] += 1
+        self.event_matrix.update(State.tenant_state[tid].EventCounters.counts(ANOMALY_WINDOW))
 
         for event_name, threshold in ANOMALY_MAP.items():
             if event_name in self.event_matrix:
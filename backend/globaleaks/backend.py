@@ -1,14 +1,19 @@
 # -*- coding: utf-8
 #   backend
 #   *******
+import signal
 import sys
 import traceback
+from io import BytesIO
 
 from twisted.application import service
 from twisted.internet import reactor, defer
 from twisted.python.log import ILogObserver
 from twisted.web import server
 
+from globaleaks import orm
+from globaleaks.handlers import staticfile
+from globaleaks.handlers.base import StreamingUpload
 from globaleaks.jobs import job, jobs_list
 from globaleaks.services import onion
 
@@ -18,6 +23,7 @@ from globaleaks.rest.api import APIResourceWrapper
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils.log import log, openLogFile, logFormatter, LogObserver
+from globaleaks.utils.multipart import parse_header
 from globaleaks.utils.process import disable_swap, drop_privileges, set_proc_title
 from globaleaks.utils.sock import listen_tcp_on_sock, listen_tls_on_sock, reserve_port_for_ip
 from globaleaks.utils.utility import fix_file_permissions
@@ -34,6 +40,54 @@ def fail_startup(excep):
 class Request(server.Request):
     current_user = None
     log_ip_and_ua = False
+    upload = None
+
+    def gotLength(self, length):
+        content_type = self.requestHeaders.getRawHeaders(b'content-type', [b''])[0]
+        key, pdict = parse_header(content_type.decode('latin-1'))
+
+        if key != 'multipart/form-data' or not pdict.get('boundary'):
+            return server.Request.gotLength(self, length)
+
+        # The multipart bodies are parsed while received instead of being
+        # buffered and the file uploads are encrypted straight to disk.
+        # The tenant is not known yet so the streamed file is limited to
+        # the greatest size allowed; the limit of the tenant and the route
+        # are checked once the request is processed.
+        max_size = max([x.maximum_filesize for x in State.tenant_cache.values()], default=0) * 1024 * 1024
+
+        self.content = BytesIO()
+        self.upload = StreamingUpload(pdict['boundary'].encode('latin-1'), max_size)
+
+    def handleContentChunk(self, data):
+        if self.upload is None:
+            return server.Request.handleContentChunk(self, data)
+
+        self.upload.feed(data)
+
+    def requestReceived(self, command, path, version):
+        if self.upload is not None:
+            self.upload.close()
+
+        server.Request.requestReceived(self, command, path, version)
+
+    def process(self):
+        if self.upload is not None:
+            self.args.update(self.upload.fields)
+
+        server.Request.process(self)
+
+        # The data streamed by the requests that have not been accepted by
+        # an upload handler, e.g. directed to other resources or refused,
+        # is discarded
+        if self.upload is not None and not self.upload.consumed:
+            self.upload.abort()
+
+    def connectionLost(self, reason):
+        if self.upload is not None and not self.upload.complete:
+            self.upload.abort()
+
+        server.Request.connectionLost(self, reason)
 
 
 class Site(server.Site):
@@ -109,6 +163,12 @@ class Service(service.Service):
 
             self._shutdown = True
             self.state.orm_tp.stop()
+            self.state.write_scheduler.stop()
+            self.state.kdf.stop()
+            self.state.pgp_keyring.close()
+            self.state.delivery_tp.stop()
+            self.state.decryption_pool.stop()
+            self.state.secure_deletion.stop()
             d.callback(None)
 
         reactor.callLater(30, _shutdown, None)
@@ -156,8 +216,20 @@ class Service(service.Service):
 
         self.state.orm_tp.start()
 
+        if Settings.enable_write_scheduler:
+            self.state.write_scheduler.start()
+            orm.set_write_scheduler(self.state.write_scheduler)
+
+        self.state.kdf.start()
+        self.state.delivery_tp.start()
+        self.state.decryption_pool.start()
+        self.state.secure_deletion.start()
+
         reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
 
+        staticfile.get_asset_index(Settings.client_path)
+        signal.signal(signal.SIGHUP, lambda sig, frm: reactor.callFromThread(staticfile.reload_asset_indexes))
+
         for sock in self.state.http_socks:
             listen_tcp_on_sock(reactor, sock.fileno(), self.api_factory)
 
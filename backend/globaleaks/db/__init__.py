@@ -9,13 +9,14 @@ from sqlalchemy import exc as sa_exc
 from globaleaks import models, DATABASE_VERSION
 from globaleaks.handlers.admin import tenant
 from globaleaks.handlers.admin.https import load_tls_dict_list
+from globaleaks.handlers.file import db_mark_file_for_secure_deletion
 from globaleaks.models import Base, Config
 from globaleaks.models.config_desc import ConfigFilters
 from globaleaks.orm import get_engine, get_session, make_db_uri, transact, transact_sync
 from globaleaks.sessions import Session
 from globaleaks.settings import Settings
 from globaleaks.state import State, TenantState
-from globaleaks.utils import fs
+from globaleaks.utils.ip import IPFilter
 from globaleaks.utils.log import log
 from globaleaks.utils.objectdict import ObjectDict
 
@@ -118,15 +119,14 @@ def sync_clean_untracked_files(session):
     Transaction for removing files that are not tracked by the application database
     :param session: An ORM session
     """
-    tracked_files = db_get_tracked_files(session)
+    tracked_files = set(db_get_tracked_files(session))
+    queued_files = set(x[0] for x in session.query(models.SecureFileDelete.filepath))
     for filesystem_file in os.listdir(Settings.attachments_path):
         if filesystem_file not in tracked_files:
             file_to_remove = os.path.join(Settings.attachments_path, filesystem_file)
-            log.debug('Removing untracked file: %s', file_to_remove)
-            try:
-                fs.overwrite_and_remove(file_to_remove)
-            except OSError:
-                log.err('Failed to remove untracked file', file_to_remove)
+            if file_to_remove not in queued_files:
+                log.debug('Marking untracked file for secure deletion: %s', file_to_remove)
+                db_mark_file_for_secure_deletion(session, Settings.attachments_path, filesystem_file)
 
 
 @transact_sync
@@ -173,6 +173,9 @@ def db_refresh_tenant_cache(session, tid_list):
     for tid, lang in models.EnabledLanguage.tid_list(session, tid_list):
         State.tenant_cache[tid].setdefault('languages_enabled', []).append(lang)
 
+    # The IP filters are compiled once per refresh and shared among tenants
+    ip_filters = {}
+
     for tid in tid_list:
         State.tenant_cache[tid]['ip_filter'] = {}
         State.tenant_cache[tid]['https_allowed'] = {}
@@ -182,8 +185,12 @@ def db_refresh_tenant_cache(session, tid_list):
                   ('custodian', 'ip_filter_custodian_enable', 'ip_filter_custodian'),
                   ('receiver', 'ip_filter_receiver_enable', 'ip_filter_receiver'),
                   ('whistleblower', 'ip_filter_whistleblower_enable', 'ip_filter_whistleblower')]:
-            if State.tenant_cache[tid].get(x[1], False) and State.tenant_cache[1][x[2]]:
-                State.tenant_cache[tid]['ip_filter'][x[0]] = State.tenant_cache[1][x[2]]
+            ip_filter = State.tenant_cache[1][x[2]]
+            if State.tenant_cache[tid].get(x[1], False) and ip_filter:
+                if ip_filter not in ip_filters:
+                    ip_filters[ip_filter] = IPFilter(ip_filter)
+
+                State.tenant_cache[tid]['ip_filter'][x[0]] = ip_filters[ip_filter]
 
         for x in ['admin', 'custodian', 'receiver', 'whistleblower']:
             State.tenant_cache[tid]['https_allowed'][x] = State.tenant_cache[tid].get('https_' + x, True)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import sqlite3
+
 from globaleaks import DATABASE_VERSION, FIRST_DATABASE_VERSION_SUPPORTED
 from globaleaks.db.appdata import load_appdata
 from globaleaks.settings import Settings
@@ -12,6 +14,14 @@ class MigrationBase(object):
     skip_count_check = {}
     renamed_attrs = {}
 
+    # The tables not needing a specific migration function are copied in
+    # SQL by means of batched INSERT ... SELECT statements; the ORM copy
+    # is kept for reference and comparison
+    bulk_migration = True
+
+    # Number of rows copied by each batch of the bulk migration
+    bulk_batch_size = 10000
+
     def __init__(self, migration_mapping, start_version, session_old, session_new):
         self.appdata = load_appdata()
 
@@ -69,6 +79,164 @@ class MigrationBase(object):
 
             self.session_new.add(new_obj)
 
+    def get_bulk_connection(self):
+        """
+        Return a connection to the new database with the old one attached
+        """
+        conn = sqlite3.connect(self.session_new.bind.url.database, timeout=30)
+        conn.execute('ATTACH DATABASE ? AS old', (self.session_old.bind.url.database,))
+        return conn
+
+    def get_bulk_columns(self, model_name):
+        """
+        Map each column of the new table to its source
+
+        As done by the ORM, the default of a column is used both for the
+        columns missing in the old table and in place of the NULL values.
+
+        :return: A tuple (columns, exact) where columns is a list of tuples
+                 (column, old_column, default, per_row) and exact tells if the
+                 rows could be copied in SQL
+        """
+        dialect = self.session_new.bind.dialect
+        old_columns = {c.key: c for c in self.model_from[model_name].__table__.columns}
+
+        columns = []
+        exact = True
+
+        for c in self.model_to[model_name].__table__.columns:
+            old_key = self.renamed_attrs.get(model_name, {}).get(c.key, c.key)
+            old_column = old_columns.get(old_key)
+
+            if old_column is not None and type(old_column.type) is not type(c.type):
+                exact = False
+
+            default, per_row = None, False
+            if c.default is not None:
+                if c.default.is_callable and (c.primary_key or c.unique):
+                    # values unique for each row are computed for each row
+                    exact = False
+                    per_row = True
+                else:
+                    default = c.default.arg(None) if c.default.is_callable else c.default.arg
+                    processor = c.type.bind_processor(dialect)
+                    if processor is not None:
+                        default = processor(default)
+
+            columns.append((c, old_column, default, per_row))
+
+        return columns, exact
+
+    def bulk_migration_function(self, model_name):
+        """
+        Copy a table whose columns are a plain mapping of the old ones
+
+        The rows are copied in batches by rowid in SQL; when some column
+        needs a conversion or a value for each row, the rows are streamed
+        from the old table and inserted in batches by means of executemany.
+        """
+        # the rows added by the prologue are committed so that the
+        # database is not locked
+        self.session_new.commit()
+
+        table_to = self.model_to[model_name].__table__
+        table_from = self.model_from[model_name].__table__
+        columns, exact = self.get_bulk_columns(model_name)
+
+        total = self.entries_count[model_name]
+        done = 0
+
+        names = ', '.join('"%s"' % c.name for c, _, _, _ in columns)
+
+        conn = self.get_bulk_connection()
+        try:
+            if exact:
+                select = []
+                params = []
+                for c, old, default, _ in columns:
+                    if old is None:
+                        select.append('?')
+                        params.append(default)
+                    elif c.default is not None:
+                        select.append('coalesce("%s", ?)' % old.name)
+                        params.append(default)
+                    else:
+                        select.append('"%s"' % old.name)
+
+                sql = 'INSERT INTO main."%s" (%s) SELECT %s FROM old."%s" WHERE rowid > ? AND rowid <= ?' % \
+                      (table_to.name, names, ', '.join(select), table_from.name)
+
+                start, end = conn.execute('SELECT min(rowid) - 1, max(rowid) FROM old."%s"' % table_from.name).fetchone()
+                while start is not None and start < end:
+                    with conn:
+                        done += conn.execute(sql, params + [start, start + self.bulk_batch_size]).rowcount
+
+                    start += self.bulk_batch_size
+                    self.print_progress(model_name, done, total)
+            else:
+                dialect = self.session_new.bind.dialect
+
+                converters = []
+                for c, old, default, per_row in columns:
+                    result_processor = bind_processor = None
+
+                    if old is not None and type(old.type) is not type(c.type):
+                        result_processor = old.type.result_processor(dialect, None)
+                        bind_processor = c.type.bind_processor(dialect)
+                    elif per_row:
+                        bind_processor = c.type.bind_processor(dialect)
+
+                    converters.append((result_processor, bind_processor))
+
+                sql = 'INSERT INTO main."%s" (%s) VALUES (%s)' % \
+                      (table_to.name, names, ', '.join('?' for _ in columns))
+
+                sources = [old for _, old, _, _ in columns if old is not None]
+                cursor = conn.execute('SELECT %s FROM old."%s"' %
+                                      (', '.join('"%s"' % old.name for old in sources), table_from.name))
+
+                while True:
+                    rows = cursor.fetchmany(self.bulk_batch_size)
+                    if not rows:
+                        break
+
+                    batch = []
+                    for row in rows:
+                        values = iter(row)
+                        new_row = []
+
+                        for (c, old, default, per_row), (result_processor, bind_processor) in zip(columns, converters):
+                            value = next(values) if old is not None else None
+
+                            if value is None:
+                                if per_row:
+                                    value = c.default.arg(None)
+                                    if bind_processor is not None:
+                                        value = bind_processor(value)
+                                else:
+                                    value = default
+                            else:
+                                if result_processor is not None:
+                                    value = result_processor(value)
+                                if bind_processor is not None:
+                                    value = bind_processor(value)
+
+                            new_row.append(value)
+
+                        batch.append(new_row)
+
+                    with conn:
+                        conn.executemany(sql, batch)
+
+                    done += len(batch)
+                    self.print_progress(model_name, done, total)
+        finally:
+            conn.close()
+
+    def print_progress(self, model_name, done, total):
+        if total > self.bulk_batch_size:
+            Settings.print_msg('   %s: %d/%d (%d%%)' % (model_name, done, total, done * 100 // total))
+
     def migrate_model(self, model_name):
         if self.entries_count[model_name] <= 0 or self.skip_model_migration.get(model_name, False):
             return
@@ -76,7 +244,9 @@ class MigrationBase(object):
         Settings.print_msg(' * %s [#%d]' % (model_name, self.entries_count[model_name]))
 
         specific_migration_function = getattr(self, 'migrate_%s' % model_name, None)
-        if specific_migration_function is None:
-            self.generic_migration_function(model_name)
-        else:
+        if specific_migration_function is not None:
             specific_migration_function()
+        elif self.bulk_migration:
+            self.bulk_migration_function(model_name)
+        else:
+            self.generic_migration_function(model_name)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8
+import itertools
 
 from globaleaks.state import State
 from globaleaks.utils.utility import datetime_now
@@ -41,21 +42,24 @@ events_monitored = [
 
 class Event(object):
     """
-    Every event that is kept in memory, is a temporary object.
-    Once a while, they disappear. The statistics just take
-    account of the expiration of the events collected, once a while.
+    Every event is accounted in the event counters of the tenant
+    and only a bounded sample of the most recent ones is kept.
 
-    - Anomaly check is based on those elements.
-    - Real-time analysis is based on these, too.
+    - Anomaly check is based on the counters of the last hour.
+    - Real-time analysis is based on the sample.
     """
 
+    sequence = itertools.count(1)
+
     def __init__(self, event_obj, request_time):
+        self.id = next(self.sequence)
         self.event_type = event_obj['name']
         self.creation_date = datetime_now()
         self.request_time = round(request_time.total_seconds(), 1)
 
     def serialize(self):
         return {
+            'id': self.id,
             'event': self.event_type,
             'creation_date': self.creation_date,
             'duration': self.request_time
@@ -67,7 +71,5 @@ def track_handler(handler):
 
     for event in events_monitored:
         if event['handler_check'](handler):
-            e = Event(event, handler.request.execution_time)
-            State.tenant_state[tid].RecentEventQ.append(e)
-            State.tenant_state[tid].EventQ.append(e)
+            State.tenant_state[tid].EventCounters.add(Event(event, handler.request.execution_time))
             break
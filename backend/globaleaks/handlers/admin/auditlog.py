@@ -5,7 +5,7 @@ from sqlalchemy.sql.expression import distinct, func
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.state import State
 from globaleaks.utils.utility import datetime_now, iso_to_gregorian
 
@@ -25,7 +25,7 @@ def weekmap_to_heatmap(week_map):
     return retlist
 
 
-@transact
+@transact_ro
 def get_stats(session, tid, week_delta):
     """
     Get the set of statistics collected for a specific week
@@ -108,7 +108,7 @@ def get_stats(session, tid, week_delta):
     }
 
 
-@transact
+@transact_ro
 def get_anomaly_history(session, tid, limit):
     """
     Transaction for fetching the anomalies registered for a specific tenant
@@ -139,7 +139,7 @@ def get_anomaly_history(session, tid, limit):
     return ret
 
 
-@transact
+@transact_ro
 def get_tips(session, tid):
     tips = []
 
@@ -227,7 +227,7 @@ class RecentEventsCollection(BaseHandler):
     check_roles = 'admin'
 
     def get(self):
-        templist = [e.serialize() for e in State.tenant_state[self.request.tid].EventQ]
+        templist = [e.serialize() for e in State.tenant_state[self.request.tid].EventCounters.sample]
 
         templist.sort(key=operator.itemgetter('creation_date'))
 
@@ -246,7 +246,18 @@ class JobsTiming(BaseHandler):
         for job in State.jobs:
             response.append({
                 'name': job.name,
-                'timings': job.last_executions
+                'timings': job.last_executions,
+                'progress': job.progress
             })
 
         return response
+
+
+class KDFMetrics(BaseHandler):
+    """
+    This handler return the queue and latency metrics of the KDF pool
+    """
+    check_roles = 'admin'
+
+    def get(self):
+        return State.kdf.get_metrics()
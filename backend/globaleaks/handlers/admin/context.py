@@ -4,7 +4,7 @@ from globaleaks.handlers.admin.modelimgs import db_get_model_img
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.models import fill_localized_keys, get_localized_values
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 
 
@@ -58,7 +58,7 @@ def admin_serialize_context(session, context, language):
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-@transact
+@transact_ro
 def get_contexts(session, tid, language):
     """
     Returns the context list.
@@ -99,7 +99,7 @@ def db_associate_context_receivers(session, context, receiver_ids):
                                             'order': i}))
 
 
-@transact
+@transact_ro
 def get_context(session, tid, context_id, language):
     """
     Transaction for retrieving a context serialized in the specified language
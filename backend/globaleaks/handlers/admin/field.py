@@ -5,7 +5,7 @@ from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.public import serialize_field, trigger_map
 from globaleaks.models import fill_localized_keys
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
 from globaleaks.utils.fs import read_json_file
@@ -349,7 +349,7 @@ def delete_field(session, tid, field_id):
     session.delete(field)
 
 
-@transact
+@transact_ro
 def get_fieldtemplate_list(session, tid, language):
     """
     Transaction to retrieve the list of the field templates defined on a tenant
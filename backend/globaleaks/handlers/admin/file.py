@@ -7,13 +7,13 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.user import can_edit_general_settings_or_raise
-from globaleaks.orm import transact, tw
+from globaleaks.orm import transact_ro, tw
 from globaleaks.rest import errors
 from globaleaks.utils.fs import directory_traversal_check
 from globaleaks.utils.utility import uuid4
 
 
-@transact
+@transact_ro
 def get_files(session, tid):
     """
     Transaction to retrieve the list of files configured on a tenant
@@ -3,10 +3,10 @@ import json
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 
 
-@transact
+@transact_ro
 def get(session, tid, lang):
     """
     Transaction for retrieving the texts customization of a tenant
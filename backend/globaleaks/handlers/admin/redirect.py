@@ -4,12 +4,12 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models.serializers import serialize_redirect
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests
 from globaleaks.state import State
 
 
-@transact
+@transact_ro
 def get_redirect_list(session, tid):
     """
     Transaction for fetching the full list of redirects configured on a tenant
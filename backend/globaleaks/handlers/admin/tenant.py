@@ -7,7 +7,7 @@ from globaleaks.db.appdata import load_appdata, db_load_defaults
 from globaleaks.handlers.admin import file
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models.config import db_set_config_variable, ConfigFactory
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -108,12 +108,12 @@ def db_get_tenant_list(session):
                                                                   .outerjoin(models.Signup, models.Signup.tid == models.Tenant.id)]
 
 
-@transact
+@transact_ro
 def get_tenant_list(session):
     return db_get_tenant_list(session)
 
 
-@transact
+@transact_ro
 def get(session, id):
     return serialize_tenant(session, models.db_get(session, models.Tenant, models.Tenant.id == id))
 
@@ -1,9 +1,13 @@
 # -*- coding: utf-8
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from globaleaks import models
 from globaleaks.db import db_refresh_memory_variables
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.password_reset import db_generate_password_reset_token
 from globaleaks.handlers.user import db_get_user, \
+                                     derive_user_credentials, \
+                                     get_user_credentials, \
                                      parse_pgp_options, \
                                      user_serialize_user
 
@@ -81,7 +85,7 @@ def create_user(session, tid, request, language):
     return user_serialize_user(session, db_create_user(session, tid, request, language), language)
 
 
-def db_admin_update_user(session, tid, user_session, user_id, request, language):
+def db_admin_update_user(session, tid, user_session, user_id, request, language, credentials=None):
     """
     Transaction for updating an existing user
 
@@ -91,6 +95,7 @@ def db_admin_update_user(session, tid, user_session, user_id, request, language)
     :param user_id: The ID of the user to update
     :param request: The request data
     :param language: The language of the request
+    :param credentials: The credentials of the new password as returned by derive_user_credentials
     :return: The serialized descriptor of the updated object
     """
     fill_localized_keys(request, models.User.localized_keys, language)
@@ -105,10 +110,9 @@ def db_admin_update_user(session, tid, user_session, user_id, request, language)
 
     user.update(request)
 
-    password = request['password']
-    if password and (not user.crypto_pub_key or user_session.ek):
+    if credentials is not None and (not user.crypto_pub_key or user_session.ek):
         if user.crypto_pub_key and user_session.ek:
-            enc_key = GCE.derive_key(password.encode(), user.salt)
+            enc_key = credentials['key']
             crypto_escrow_prv_key = GCE.asymmetric_decrypt(user_session.cc, Base64Encoder.decode(user_session.ek))
 
             if tid == 1:
@@ -118,11 +122,9 @@ def db_admin_update_user(session, tid, user_session, user_id, request, language)
 
             user.crypto_prv_key = Base64Encoder.encode(GCE.symmetric_encrypt(enc_key, user_cc))
 
-        if user.hash_alg != 'ARGON2':
-            user.hash_alg = 'ARGON2'
-            user.salt = GCE.generate_salt()
-
-        user.password = GCE.hash_password(password, user.salt)
+        user.hash_alg = 'ARGON2'
+        user.salt = credentials['salt']
+        user.password = credentials['password']
         user.password_change_date = datetime_now()
 
     # The various options related in manage PGP keys are used here.
@@ -131,6 +133,33 @@ def db_admin_update_user(session, tid, user_session, user_id, request, language)
     return user_serialize_user(session, user, language)
 
 
+@inlineCallbacks
+def admin_update_user(tid, user_session, user_id, request, language):
+    """
+    Update an existing user deriving the credentials of the new password on the KDF pool
+
+    :param tid: A tenant ID
+    :param user_session: The current user session
+    :param user_id: The ID of the user to update
+    :param request: The request data
+    :param language: The language of the request
+    :return: The serialized descriptor of the updated object
+    """
+    credentials = None
+
+    if request['password']:
+        user = yield get_user_credentials(tid, user_id)
+
+        credentials = yield derive_user_credentials(request['password'],
+                                                    user['salt'],
+                                                    user['hash_alg'],
+                                                    bool(user['crypto_pub_key'] and user_session.ek))
+
+    user = yield tw(db_admin_update_user, tid, user_session, user_id, request, language, credentials)
+
+    returnValue(user)
+
+
 def db_get_users(session, tid, role=None, language=None):
     """
     Transaction for retrieving the list of users defined on a tenant
@@ -183,12 +212,11 @@ class UserInstance(BaseHandler):
         """
         request = self.validate_message(self.request.content.read(), requests.AdminUserDesc)
 
-        return tw(db_admin_update_user,
-                  self.request.tid,
-                  self.current_user,
-                  user_id,
-                  request,
-                  self.request.language)
+        return admin_update_user(self.request.tid,
+                                 self.current_user,
+                                 user_id,
+                                 request,
+                                 self.request.language)
 
     def delete(self, user_id):
         """
@@ -7,7 +7,7 @@ from random import SystemRandom
 from twisted.internet.defer import inlineCallbacks, returnValue
 from globaleaks.handlers.base import connection_check, BaseHandler
 from globaleaks.models import InternalTip, User, WhistleblowerTip
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors, requests
 from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
@@ -44,23 +44,31 @@ def login_delay():
         return deferred_sleep(SystemRandom().randint(min_sleep, max_sleep))
 
 
+@transact_ro
+def get_receipt_hash_algorithms(session, tid):
+    """
+    Transaction returning the list of hash algorithms used for the receipts of a tenant
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :return: The list of the algorithms in use
+    """
+    return [x[0] for x in session.query(WhistleblowerTip.hash_alg).filter(WhistleblowerTip.tid == tid).distinct()]
+
+
 @transact
-def login_whistleblower(session, tid, receipt):
+def authenticate_whistleblower(session, tid, hashes):
     """
     Login transaction for whistleblowers' access
 
     :param session: An ORM session
     :param tid: A tenant ID
-    :param receipt: A provided receipt
-    :return: Returns a user session in case of success
+    :param hashes: The hashes of the provided receipt
+    :return: Returns the id and the encrypted private key of the whistleblower tip
     """
     x = None
 
-    algorithms = [x[0] for x in session.query(WhistleblowerTip.hash_alg).filter(WhistleblowerTip.tid == tid).distinct()]
-
-    if algorithms:
-        hashes = [GCE.hash_password(receipt, State.tenant_cache[tid].receipt_salt, alg) for alg in algorithms]
-
+    if hashes:
         x = session.query(WhistleblowerTip, InternalTip) \
                    .filter(WhistleblowerTip.receipt_hash.in_(hashes),
                            WhistleblowerTip.tid == tid,
@@ -77,45 +85,74 @@ def login_whistleblower(session, tid, receipt):
 
     itip.wb_last_access = datetime_now()
 
-    crypto_prv_key = ''
-    if wbtip.crypto_prv_key:
-        user_key = GCE.derive_key(receipt.encode(), State.tenant_cache[tid].receipt_salt)
-        crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(wbtip.crypto_prv_key))
+    return wbtip.id, wbtip.crypto_prv_key
 
-    return Sessions.new(tid, wbtip.id, tid, 'whistleblower', False, False, crypto_prv_key, '')
+
+@inlineCallbacks
+def login_whistleblower(tid, receipt):
+    """
+    Login function for whistleblowers' access
+
+    The hashing and the key derivation of the receipt are executed
+    on the KDF pool before and after the short login transaction.
+
+    :param tid: A tenant ID
+    :param receipt: A provided receipt
+    :return: Returns a user session in case of success
+    """
+    receipt_salt = State.tenant_cache[tid].receipt_salt
+
+    hashes = []
+    for alg in (yield get_receipt_hash_algorithms(tid)):
+        hashes.append((yield State.kdf.hash_password(receipt, receipt_salt, alg)))
+
+    wbtip_id, crypto_prv_key = yield authenticate_whistleblower(tid, hashes)
+
+    if crypto_prv_key:
+        user_key = yield State.kdf.derive_key(receipt.encode(), receipt_salt)
+        crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(crypto_prv_key))
+    else:
+        crypto_prv_key = ''
+
+    returnValue(Sessions.new(tid, wbtip_id, tid, 'whistleblower', False, False, crypto_prv_key, ''))
+
+
+@transact_ro
+def get_user_credentials(session, tid, username):
+    """
+    Transaction returning the credentials of the enabled users having the provided username
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param username: A provided username
+    :return: A list of tuples (id, hash_alg, salt, password, has_key) where has_key
+             tells if the user has an encryption key
+    """
+    return [(u.id, u.hash_alg, u.salt, u.password, bool(u.crypto_prv_key))
+            for u in session.query(User).filter(User.username == username,
+                                                User.state == 'enabled',
+                                                User.tid == tid)]
 
 
 @transact
-def login(session, tid, username, password, authcode, client_using_tor, client_ip):
+def authenticate_user(session, tid, user_id, user_key, authcode, client_using_tor, client_ip):
     """
     Login transaction for users' access
 
     :param session: An ORM session
     :param tid: A tenant ID
-    :param username: A provided username
-    :param password: A provided password
+    :param user_id: The ID of the user whose password has been verified
+    :param user_key: The key derived from the password of the user
     :param authcode: A provided authcode
     :param client_using_tor: A boolean signaling Tor usage
     :param client_ip:  The client IP
     :return: Returns a user session in case of success
     """
-    user = None
-
-    for u in session.query(User).filter(User.username == username,
-                                        User.state == 'enabled',
-                                        User.tid == tid):
-        if GCE.check_password(u.hash_alg, password, u.salt, u.password):
-            user = u
-            break
-
-        # Fix for issue: https://github.com/globaleaks/GlobaLeaks/issues/2563
-        if State.tenant_cache[1].creation_date < 1551740400:
-            u_password = 'b\'' + u.password + '\''
-            if GCE.check_password(u.hash_alg, password, u.salt, u_password):
-                user = u
-                break
+    user = session.query(User).filter(User.id == user_id,
+                                      User.state == 'enabled',
+                                      User.tid == tid).one_or_none()
 
-    if user is None:
+    if user is None or bool(user.crypto_prv_key) != (user_key is not None):
         log.debug("Login: Invalid credentials")
         Settings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
@@ -124,7 +161,6 @@ def login(session, tid, username, password, authcode, client_using_tor, client_i
 
     crypto_prv_key = ''
     if user.crypto_prv_key:
-        user_key = GCE.derive_key(password.encode(), user.salt)
         crypto_prv_key = GCE.symmetric_decrypt(user_key, Base64Encoder.decode(user.crypto_prv_key))
     elif State.tenant_cache[tid].encryption:
         # Force the password change on which the user key will be created
@@ -149,6 +185,48 @@ def login(session, tid, username, password, authcode, client_using_tor, client_i
     return Sessions.new(tid, user.id, user.tid, user.role, user.password_change_needed, user.two_factor_enable, crypto_prv_key, user.crypto_escrow_prv_key)
 
 
+@inlineCallbacks
+def login(tid, username, password, authcode, client_using_tor, client_ip):
+    """
+    Login function for users' access
+
+    The verification of the password and the derivation of the user key
+    are executed on the KDF pool before the short login transaction.
+
+    :param tid: A tenant ID
+    :param username: A provided username
+    :param password: A provided password
+    :param authcode: A provided authcode
+    :param client_using_tor: A boolean signaling Tor usage
+    :param client_ip:  The client IP
+    :return: Returns a user session in case of success
+    """
+    user_id, user_key = None, None
+
+    for u_id, hash_alg, salt, u_password, has_key in (yield get_user_credentials(tid, username)):
+        valid = yield State.kdf.check_password(hash_alg, password, salt, u_password)
+
+        # Fix for issue: https://github.com/globaleaks/GlobaLeaks/issues/2563
+        if not valid and State.tenant_cache[1].creation_date < 1551740400:
+            u_password = 'b\'' + u_password + '\''
+            valid = yield State.kdf.check_password(hash_alg, password, salt, u_password)
+
+        if valid:
+            user_id = u_id
+            if has_key:
+                user_key = yield State.kdf.derive_key(password.encode(), salt)
+            break
+
+    if user_id is None:
+        log.debug("Login: Invalid credentials")
+        Settings.failed_login_attempts += 1
+        raise errors.InvalidAuthentication
+
+    session = yield authenticate_user(tid, user_id, user_key, authcode, client_using_tor, client_ip)
+
+    returnValue(session)
+
+
 class AuthenticationHandler(BaseHandler):
     """
     Login handler for admins and recipents and custodians
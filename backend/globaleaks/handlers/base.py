@@ -10,8 +10,12 @@ import re
 from datetime import datetime
 
 from cryptography.hazmat.primitives import constant_time
-from twisted.internet import abstract
+from twisted.internet import abstract, defer, reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.threads import deferToThreadPool
 from twisted.protocols.basic import FileSender
+from zope.interface import implementer
 
 from globaleaks.event import track_handler
 from globaleaks.rest import errors, requests
@@ -21,6 +25,7 @@ from globaleaks.state import State
 from globaleaks.utils.crypto import sha256
 from globaleaks.utils.ip import check_ip
 from globaleaks.utils.log import log
+from globaleaks.utils.multipart import MultipartParser, parse_content_disposition
 from globaleaks.utils.securetempfile import SecureTemporaryFile
 from globaleaks.utils.utility import datetime_now, deferred_sleep
 
@@ -44,6 +49,259 @@ def serve_file(request, fo):
     return filesender
 
 
+@implementer(IPushProducer)
+class FileProducer(object):
+    """
+    Producer streaming a range of a file to a request
+
+    The file is read (and decrypted) ahead on a thread pool into a bounded
+    buffer so that the reactor thread is only in charge of writing the data;
+    the reading is suspended while the buffer is full or the consumer paused.
+
+    A start of None streams the file from its current position and a length
+    of None streams it until its end.
+
+    The deferred returned by begin() fires with True if the content has
+    been entirely served and with False otherwise.
+    """
+    chunk_size = abstract.FileDescriptor.bufferSize
+    buffer_chunks = 8
+
+    def __init__(self, request, fo, start, length, thread_pool):
+        self.request = request
+        self.fo = fo
+        self.start = start
+        self.remaining = length
+        self.thread_pool = thread_pool
+        self.buffer = collections.deque()
+        self.deferred = defer.Deferred()
+        self.paused = False
+        self.reading = False
+        self.eof = False
+        self.finished = False
+
+    def begin(self):
+        self.request.registerProducer(self, True)
+        self.read_ahead()
+        return self.deferred
+
+    def read(self, n):
+        if self.start is not None:
+            self.fo.seek(self.start)
+            self.start = None
+
+        chunks = []
+        while len(chunks) < n:
+            size = self.chunk_size if self.remaining is None else min(self.chunk_size, self.remaining)
+
+            chunk = self.fo.read(size) if size else b''
+            if not chunk:
+                return chunks, True
+
+            if self.remaining is not None:
+                self.remaining -= len(chunk)
+
+            chunks.append(chunk)
+
+        return chunks, self.remaining == 0
+
+    def read_ahead(self):
+        if self.reading or self.eof or self.finished or len(self.buffer) >= self.buffer_chunks:
+            return
+
+        self.reading = True
+
+        d = deferToThreadPool(reactor, self.thread_pool, self.read, self.buffer_chunks - len(self.buffer))
+        d.addCallbacks(self.on_read, self.on_error)
+
+    def on_read(self, result):
+        self.reading = False
+
+        if self.finished:
+            self.fo.close()
+            return
+
+        self.buffer.extend(result[0])
+        self.eof = result[1]
+        self.write()
+
+    def on_error(self, failure):
+        self.reading = False
+        log.err("Unable to stream file: %s", failure.value)
+        self.finish(failed=True)
+
+    def write(self):
+        while self.buffer and not self.paused and not self.finished:
+            self.request.write(self.buffer.popleft())
+
+        if self.eof and not self.buffer:
+            # a file shorter than expected could not fill the declared length
+            self.finish(failed=bool(self.remaining))
+        else:
+            self.read_ahead()
+
+    def finish(self, connection_lost=False, failed=False):
+        if self.finished:
+            return
+
+        self.finished = True
+        self.buffer.clear()
+        self.request.unregisterProducer()
+
+        if failed:
+            # The headers and part of the content have already been sent;
+            # the connection is aborted so that the client does not take
+            # the truncated content for the complete one
+            self.request.channel.transport.abortConnection()
+        elif not connection_lost:
+            self.request.finish()
+
+        # the file is closed by the pending read if any
+        if not self.reading:
+            self.fo.close()
+
+        self.deferred.callback(not (connection_lost or failed))
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.write()
+
+    def stopProducing(self):
+        self.finish(True)
+
+
+
+class StreamingUpload(object):
+    """
+    Receiver of the multipart/form-data body of a flow.js chunk upload
+
+    The body is parsed while it is received: the form fields are collected
+    in memory within a bounded size while the content of the file part is
+    encrypted and appended to the temporary file of the upload, identified
+    by the flowIdentifier field sent before the file.
+
+    If the request is not completed, or not consumed by an upload handler,
+    the data written is discarded so that the chunk could be retried.
+    """
+    max_field_size = 64 * 1024
+
+    def __init__(self, boundary, max_size=None):
+        self.parser = MultipartParser(boundary, self.part_begin, self.part_data, self.part_end)
+        self.max_size = max_size
+        self.fields = {}
+        self.field = None
+        self.file_id = None
+        self.file = None
+        self.created = False
+        self.offset = 0
+        self.size = 0
+        self.streaming = False
+        self.complete = False
+        self.consumed = False
+        self.aborted = False
+        self.too_big = False
+        self.error = None
+
+    def part_begin(self, headers):
+        name, filename = parse_content_disposition(headers)
+
+        if filename is None:
+            self.field = (name.encode(), [], [0])
+            return
+
+        if self.file is not None or b'flowIdentifier' not in self.fields:
+            raise ValueError("Unexpected file upload")
+
+        file_id = self.fields[b'flowIdentifier'][0].decode()
+
+        f = State.TempUploadFiles.get(file_id)
+        if f is None:
+            f = SecureTemporaryFile(Settings.tmp_path)
+            State.TempUploadFiles.set(file_id, f)
+            self.created = True
+        elif f.writer is not None:
+            raise ValueError("Concurrent upload of the same file")
+
+        f.writer = self
+        f.open('w')
+
+        self.file_id = file_id
+        self.file = f
+        self.offset = f.size
+        self.streaming = True
+
+    def part_data(self, data):
+        if self.streaming:
+            if self.max_size is not None and self.size + len(data) > self.max_size:
+                self.too_big = True
+                raise ValueError("File too big")
+
+            self.file.write(data)
+            self.size += len(data)
+            return
+
+        self.field[2][0] += len(data)
+        if self.field[2][0] > self.max_field_size:
+            raise ValueError("Form field too long")
+
+        self.field[1].append(data)
+
+    def part_end(self):
+        if self.streaming:
+            self.streaming = False
+            return
+
+        self.fields.setdefault(self.field[0], []).append(b''.join(self.field[1]))
+        self.field = None
+
+    def feed(self, data):
+        if self.error is not None:
+            return
+
+        try:
+            self.parser.feed(data)
+        except ValueError as e:
+            self.fail(e)
+
+    def close(self):
+        if self.error is not None:
+            return
+
+        try:
+            self.parser.close()
+        except ValueError as e:
+            self.fail(e)
+            return
+
+        self.complete = True
+        if self.file is not None:
+            self.file.writer = None
+
+    def fail(self, error):
+        self.error = str(error)
+        self.abort()
+
+    def abort(self):
+        """
+        Discard the data of the file part written by the request
+        """
+        if self.file is None or self.aborted or self.file.writer is not self and not self.complete:
+            return
+
+        self.aborted = True
+
+        self.file.truncate(self.offset)
+        self.file.writer = None
+        self.size = 0
+
+        if self.created:
+            # The file created by the request is discarded altogether
+            self.file.close()
+            State.TempUploadFiles.pop(self.file_id, None)
+
 
 def connection_check(tid, client_ip, role, client_using_tor):
     """
@@ -254,16 +512,85 @@ class BaseHandler(object):
 
         return serve_file(self.request, fp)
 
+    def parse_range(self):
+        """
+        Parse the Range header of the request
+
+        Only the requests of a single range are considered; the
+        other requests are served with the entire content.
+
+        :return: A tuple (start, end) of the values of the range, each
+                 of them eventually empty, or None
+        """
+        header = self.request.getHeader(b'Range')
+
+        match = re.match(br'^bytes=(\d*)-(\d*)$', header.strip()) if header else None
+        if match is None or match.groups() == (b'', b''):
+            return None
+
+        return match.groups()
+
+    def get_range(self, size):
+        """
+        Return the range of the content requested
+
+        :param size: The size of the content
+        :return: A tuple (start, end) or None
+        """
+        byte_range = self.parse_range()
+        if byte_range is None:
+            return None
+
+        start, end = byte_range
+
+        if not start:
+            return max(size - int(end), 0), size - 1
+
+        return int(start), min(int(end), size - 1) if end else size - 1
+
+    @inlineCallbacks
     def write_file_as_download(self, filename, fp):
+        """
+        Serve a file as a download, eventually limited to the range requested
+
+        :param filename: The name of the file proposed to the client
+        :param fp: The path or the file object of the file
+        :return: A deferred fired with True if the last byte of the file has been served
+        """
         if isinstance(fp, str):
           fp = self.open_file(fp)
 
+        if hasattr(fp, 'get_plaintext_size'):
+            size = yield deferToThreadPool(reactor, self.state.decryption_pool.thread_pool, fp.get_plaintext_size)
+        else:
+            size = os.fstat(fp.fileno()).st_size
+
         self.request.setHeader(b'X-Download-Options', b'noopen')
         self.request.setHeader(b'Content-Type', b'application/octet-stream')
         self.request.setHeader(b'Content-Disposition',
                                'attachment; filename="%s"' % filename)
+        self.request.setHeader(b'Accept-Ranges', b'bytes')
 
-        return serve_file(self.request, fp)
+        start, end = 0, size - 1
+
+        byte_range = self.get_range(size)
+        if byte_range is not None:
+            start, end = byte_range
+
+            if start > end:
+                fp.close()
+                self.request.setResponseCode(416)
+                self.request.setHeader(b'Content-Range', b'bytes */%d' % size)
+                returnValue(False)
+
+            self.request.setResponseCode(206)
+            self.request.setHeader(b'Content-Range', b'bytes %d-%d/%d' % (start, end, size))
+
+        self.request.setHeader(b'Content-Length', b'%d' % (end - start + 1))
+
+        served = yield FileProducer(self.request, fp, start, end - start + 1, self.state.decryption_pool.thread_pool).begin()
+
+        returnValue(served and end == size - 1)
 
     def get_current_user(self):
         api_session = self.get_api_session()
@@ -316,23 +643,41 @@ class BaseHandler(object):
         total_file_size = int(self.request.args[b'flowTotalSize'][0])
         file_id = self.request.args[b'flowIdentifier'][0].decode()
 
-        chunk_size = len(self.request.args[b'file'][0])
-        if ((chunk_size // (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
+        upload = getattr(self.request, 'upload', None)
+        if upload is not None:
+            # The content of the chunk has been already written while received
+            if upload.error is not None and not upload.too_big or upload.file is None:
+                upload.abort()
+                raise errors.InputValidationError(upload.error or "Missing file")
+
+            chunk_size = upload.size
+        else:
+            chunk_size = len(self.request.args[b'file'][0])
+
+        if ((upload is not None and upload.too_big) or
+            (chunk_size // (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
             (total_file_size // (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize):
+            if upload is not None:
+                upload.abort()
+
             log.err("File upload request rejected: file too big", tid=self.request.tid)
             raise errors.FileTooBig(self.state.tenant_cache[self.request.tid].maximum_filesize)
 
-        if file_id not in self.state.TempUploadFiles:
-            self.state.TempUploadFiles.set(file_id, SecureTemporaryFile(Settings.tmp_path))
+        if upload is not None:
+            upload.consumed = True
+            f = upload.file
+        else:
+            if file_id not in self.state.TempUploadFiles:
+                self.state.TempUploadFiles.set(file_id, SecureTemporaryFile(Settings.tmp_path))
 
-        f = self.state.TempUploadFiles[file_id]
-        with f.open('w') as f:
+            f = self.state.TempUploadFiles[file_id].open('w')
             f.write(self.request.args[b'file'][0])
 
-            if self.request.args[b'flowChunkNumber'][0] != self.request.args[b'flowTotalChunks'][0]:
-                return None
+        if self.request.args[b'flowChunkNumber'][0] != self.request.args[b'flowTotalChunks'][0]:
+            return None
 
-            f.finalize_write()
+        f.finalize_write()
+        f.close()
 
         mime_type, _ = mimetypes.guess_type(self.request.args[b'flowFilename'][0].decode())
         if mime_type is None:
@@ -3,7 +3,7 @@
 # Handlers dealing with custodian user functionalities
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests
 from globaleaks.utils.utility import datetime_now
 
@@ -32,7 +32,7 @@ def serialize_identityaccessrequest(session, identityaccessrequest):
     }
 
 
-@transact
+@transact_ro
 def get_identityaccessrequest_list(session, tid):
     return [serialize_identityaccessrequest(session, iar)
         for iar in session.query(models.IdentityAccessRequest).filter(models.IdentityAccessRequest.receivertip_id == models.ReceiverTip.id,
@@ -40,7 +40,7 @@ def get_identityaccessrequest_list(session, tid):
                                                                       models.InternalTip.tid == tid)]
 
 
-@transact
+@transact_ro
 def get_identityaccessrequest(session, tid, identityaccessrequest_id):
     iar = session.query(models.IdentityAccessRequest) \
                .filter(models.IdentityAccessRequest.id == identityaccessrequest_id,
@@ -2,18 +2,16 @@
 #
 # API handling export of submissions
 from io import BytesIO
-from twisted.internet import abstract
-from twisted.internet.defer import Deferred, inlineCallbacks
-from twisted.internet.threads import deferToThread
+from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.submission_statuses import db_get_submission_statuses
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, FileProducer
 from globaleaks.handlers.rtip import db_access_rtip, serialize_rtip
-from globaleaks.handlers.submission import decrypt_tip
+from globaleaks.handlers.submission import decrypt_tip_with_key
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.orm import transact
 from globaleaks.utils.crypto import Base64Encoder, GCE
@@ -46,48 +44,6 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
     }
 
 
-class ZipStreamProducer(object):
-    """Streaming producter for ZipStream"""
-
-    def __init__(self, handler, zipstreamObject):
-        self.finish = Deferred()
-        self.handler = handler
-        self.zipstreamObject = zipstreamObject
-
-    def start(self):
-        self.handler.request.registerProducer(self, False)
-        return self.finish
-
-    def resumeProducing(self):
-        if not self.handler:
-            return
-
-        data = self.zip_chunk()
-        if data:
-            self.handler.request.write(data)
-        else:
-            self.stopProducing()
-
-    def stopProducing(self):
-        self.handler.request.unregisterProducer()
-        self.handler.request.finish()
-        self.handler = None
-        self.finish.callback(None)
-
-    def zip_chunk(self):
-        chunk = []
-        chunk_size = 0
-
-        for data in self.zipstreamObject:
-            if data:
-                chunk_size += len(data)
-                chunk.append(data)
-                if chunk_size >= abstract.FileDescriptor.bufferSize:
-                    return b''.join(chunk)
-
-        return b''.join(chunk)
-
-
 class ExportHandler(BaseHandler):
     check_roles = 'receiver'
     handler_exec_time_threshold = 3600
@@ -100,13 +56,14 @@ class ExportHandler(BaseHandler):
                                           self.request.language)
 
         if tip_export['crypto_tip_prv_key']:
-            tip_export['tip'] = yield deferToThread(decrypt_tip, self.current_user.cc, tip_export['crypto_tip_prv_key'], tip_export['tip'])
+            tip_prv_key = (yield self.state.decryption_pool.decrypt(self.current_user.cc, [tip_export['crypto_tip_prv_key']]))[0]
+
+            tip_export['tip'] = yield decrypt_tip_with_key(tip_prv_key, tip_export['tip'])
 
             for file_dict in tip_export['tip']['rfiles'] + tip_export['tip']['wbfiles']:
                 if file_dict.get('status', '') == 'encrypted' or file_dict.get('forged'):
                     continue
 
-                tip_prv_key = GCE.asymmetric_decrypt(self.current_user.cc, tip_export['crypto_tip_prv_key'])
                 file_dict['fo'] = GCE.streaming_encryption_open('DECRYPT', tip_prv_key, file_dict['path'])
                 del file_dict['path']
 
@@ -133,6 +90,5 @@ class ExportHandler(BaseHandler):
         self.request.setHeader(b'Content-Type', b'application/octet-stream')
         self.request.setHeader(b'Content-Disposition', b'attachment; filename="submission.zip"')
 
-        self.zip_stream = iter(ZipStream(files))
-
-        yield ZipStreamProducer(self, self.zip_stream).start()
+        # The archive is generated on the threads of the decryption pool
+        yield FileProducer(self.request, ZipStream(files), None, None, self.state.decryption_pool.thread_pool).begin()
@@ -9,7 +9,7 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from globaleaks import models
 from globaleaks.handlers.admin.file import db_get_file
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact, tw
+from globaleaks.orm import transact_ro, tw
 
 
 appfiles = {
@@ -37,7 +37,7 @@ def db_mark_file_for_secure_deletion(session, directory, filename):
     session.add(secure_file_delete)
 
 
-@transact
+@transact_ro
 def get_file_id(session, tid, name):
     """
     Transaction returning a file ID given the file name
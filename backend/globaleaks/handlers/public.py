@@ -11,7 +11,7 @@ from globaleaks.handlers.admin.submission_statuses import db_get_submission_stat
 from globaleaks.models import get_localized_values
 from globaleaks.models.config import ConfigFactory, ConfigL10NFactory
 from globaleaks.models.enums import EnumContextStatus
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.state import State
 from globaleaks.utils.sets import merge_dicts
 
@@ -492,7 +492,7 @@ def db_get_receivers(session, tid, language):
     return ret
 
 
-@transact
+@transact_ro
 def get_public_resources(session, tid, language):
     """
     Transaction that compose the public API
@@ -3,62 +3,116 @@
 # API handling recipient user functionalities
 import base64
 import json
+from datetime import datetime
 
-from sqlalchemy.sql.expression import distinct, func
+from sqlalchemy.sql.expression import and_, exists, func, or_
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.rtip import db_postpone_expiration, db_delete_itips
 from globaleaks.handlers.submission import db_serialize_archived_preview_schema
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 from globaleaks.state import State
 from globaleaks.utils.crypto import GCE
 
 
-@transact
-def get_receivertips(session, tid, receiver_id, user_key, language):
+def db_filter_receivertips(query, filters):
     """
-    Return list of submissions received by the specified receiver
+    Apply the filters selected by the recipient to the query of the submissions
+
+    :param query: A query on ReceiverTip and InternalTip
+    :param filters: A dictionary of the filters to be applied
+    :return: The filtered query
+    """
+    if filters.get('status'):
+        query = query.filter(models.InternalTip.status == filters['status'])
+
+    if filters.get('context_id'):
+        query = query.filter(models.InternalTip.context_id == filters['context_id'])
+
+    if filters.get('start_date'):
+        query = query.filter(models.InternalTip.creation_date >= filters['start_date'])
+
+    if filters.get('end_date'):
+        query = query.filter(models.InternalTip.creation_date <= filters['end_date'])
+
+    if filters.get('unread'):
+        query = query.filter(or_(models.ReceiverTip.access_counter == 0,
+                                 models.ReceiverTip.last_access < models.InternalTip.update_date))
+
+    return query
+
+
+@transact_ro
+def fetch_receivertips(session, tid, receiver_id, language, filters=None, cursor=None, limit=None):
+    """
+    Transaction returning the list of submissions received by the specified receiver
+
+    The submissions are ordered by descending progressive and could be
+    paginated by means of a cursor (progressive, id) of the last submission
+    of the previous page.
 
     :param session: An ORM session
     :param tid: The tenant ID
     :param receiver_id: The receiver ID
-    :param user_key: The user key to be used for decrypting data
     :param language: The language to be used during data serialization
-    :return: A list of submissions descriptors
+    :param filters: A dictionary of filters on status, context_id, start_date, end_date and unread
+    :param cursor: The tuple (progressive, id) of the last submission of the previous page
+    :param limit: The maximum number of submissions to be returned
+    :return: A tuple (submissions descriptors, encrypted previews) where the encrypted
+             previews are tuples (position, encrypted tip key, encrypted preview)
     """
     rtip_summary_list = []
-
-    rtip_ids = []
-    itip_ids = []
+    encrypted_previews = []
 
     messages_by_rtip = {}
     comments_by_itip = {}
     files_by_itip = {}
+    schemas_by_itip = {}
+    previews_by_hash = {}
 
-    # Fetch rtip, internaltip and associated questionnaire schema
-    for rtip, itip, aqs in session.query(models.ReceiverTip,
-                                         models.InternalTip,
-                                         models.ArchivedSchema) \
-                                  .filter(models.ReceiverTip.receiver_id == receiver_id,
-                                          models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                                          models.InternalTipAnswers.internaltip_id == models.InternalTip.id,
-                                          models.ArchivedSchema.hash == models.InternalTipAnswers.questionnaire_hash,
-                                          models.InternalTip.tid == tid) \
-                                  .order_by(models.InternalTip.progressive.desc(), models.InternalTipAnswers.creation_date.asc()):
-        if rtip.id in rtip_ids:
-            continue
+    # The submissions without answers are excluded by the query itself
+    # so that the pages and the cursor are not affected by their presence
+    query = session.query(models.ReceiverTip, models.InternalTip) \
+                   .filter(models.ReceiverTip.receiver_id == receiver_id,
+                           models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                           models.InternalTip.tid == tid,
+                           exists().where(models.InternalTipAnswers.internaltip_id == models.InternalTip.id))
 
-        rtip_ids.append(rtip.id)
-        itip_ids.append(itip.id)
+    query = db_filter_receivertips(query, filters or {})
 
-        preview = itip.preview
+    if cursor is not None:
+        query = query.filter(or_(models.InternalTip.progressive < cursor[0],
+                                 and_(models.InternalTip.progressive == cursor[0],
+                                      models.ReceiverTip.id < cursor[1])))
 
-        if itip.crypto_tip_pub_key:
-            tip_key = GCE.asymmetric_decrypt(user_key, base64.b64decode(rtip.crypto_tip_prv_key))
+    query = query.order_by(models.InternalTip.progressive.desc(), models.ReceiverTip.id.desc())
 
-            preview = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(itip.preview.encode())).decode())
+    if limit is not None:
+        query = query.limit(limit)
+
+    rtips = query.all()
+
+    rtip_ids = [rtip.id for rtip, _ in rtips]
+    itip_ids = [itip.id for _, itip in rtips]
+
+    # Fetch the questionnaire schema of the first answers of each submission
+    for itip_id, aqs_hash, aqs_preview in session.query(models.InternalTipAnswers.internaltip_id,
+                                                        models.ArchivedSchema.hash,
+                                                        models.ArchivedSchema.preview) \
+                                                 .filter(models.ArchivedSchema.hash == models.InternalTipAnswers.questionnaire_hash,
+                                                         models.InternalTipAnswers.internaltip_id.in_(itip_ids)) \
+                                                 .order_by(models.InternalTipAnswers.creation_date.desc()):
+        schemas_by_itip[itip_id] = aqs_hash
+
+        if aqs_hash not in previews_by_hash:
+            previews_by_hash[aqs_hash] = db_serialize_archived_preview_schema(aqs_preview, language)
+
+    for rtip, itip in rtips:
+        if itip.crypto_tip_pub_key:
+            encrypted_previews.append((len(rtip_summary_list), rtip.crypto_tip_prv_key, itip.preview))
 
         data = {
             'id': rtip.id,
@@ -73,8 +127,8 @@ def get_receivertips(session, tid, receiver_id, user_key, language):
             'context_id': itip.context_id,
             'access_counter': rtip.access_counter,
             'https': itip.https,
-            'preview_schema': db_serialize_archived_preview_schema(aqs.preview, language),
-            'preview': preview,
+            'preview_schema': previews_by_hash[schemas_by_itip[itip.id]],
+            'preview': itip.preview,
             'score': itip.total_score,
             'label': rtip.label,
             'status': itip.status,
@@ -89,27 +143,24 @@ def get_receivertips(session, tid, receiver_id, user_key, language):
         rtip_summary_list.append(data)
 
     # Fetch messages count
-    for rtip_id, count in session.query(models.ReceiverTip.id,
-                                        func.count(distinct(models.Message.id))) \
-                                 .filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                                         models.ReceiverTip.id.in_(rtip_ids)) \
-                                 .group_by(models.ReceiverTip.id):
+    for rtip_id, count in session.query(models.Message.receivertip_id,
+                                        func.count(models.Message.id)) \
+                                 .filter(models.Message.receivertip_id.in_(rtip_ids)) \
+                                 .group_by(models.Message.receivertip_id):
         messages_by_rtip[rtip_id] = count
 
     # Fetch comments count
-    for itip_id, count in session.query(models.InternalTip.id,
-                                        func.count(distinct(models.Comment.id))) \
-                                 .filter(models.Comment.internaltip_id == models.InternalTip.id,
-                                         models.InternalTip.id.in_(itip_ids)) \
-                                 .group_by(models.InternalTip.id):
+    for itip_id, count in session.query(models.Comment.internaltip_id,
+                                        func.count(models.Comment.id)) \
+                                 .filter(models.Comment.internaltip_id.in_(itip_ids)) \
+                                 .group_by(models.Comment.internaltip_id):
         comments_by_itip[itip_id] = count
 
     # Fetch attachment count
-    for itip_id, count in session.query(models.InternalTip.id,
-                                        func.count(distinct(models.InternalFile.id))) \
-                                 .filter(models.InternalFile.internaltip_id == models.InternalTip.id,
-                                         models.InternalTip.id.in_(itip_ids)) \
-                                 .group_by(models.InternalTip.id):
+    for itip_id, count in session.query(models.InternalFile.internaltip_id,
+                                        func.count(models.InternalFile.id)) \
+                                 .filter(models.InternalFile.internaltip_id.in_(itip_ids)) \
+                                 .group_by(models.InternalFile.internaltip_id):
         files_by_itip[itip_id] = count
 
     for elem in rtip_summary_list:
@@ -117,7 +168,39 @@ def get_receivertips(session, tid, receiver_id, user_key, language):
         elem['comment_count'] = comments_by_itip.get(elem['itip_id'], 0)
         elem['message_count'] = messages_by_rtip.get(elem['id'], 0)
 
-    return rtip_summary_list
+    return rtip_summary_list, encrypted_previews
+
+
+def decrypt_preview(user_key, crypto_tip_prv_key, preview):
+    tip_key = GCE.asymmetric_decrypt(user_key, base64.b64decode(crypto_tip_prv_key))
+
+    return json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(preview.encode())).decode())
+
+
+@inlineCallbacks
+def get_receivertips(tid, receiver_id, user_key, language, filters=None, cursor=None, limit=None):
+    """
+    Return list of submissions received by the specified receiver
+
+    The previews of the returned submissions are decrypted in batch on the decryption pool.
+
+    :param tid: The tenant ID
+    :param receiver_id: The receiver ID
+    :param user_key: The user key to be used for decrypting data
+    :param language: The language to be used during data serialization
+    :param filters: A dictionary of filters on status, context_id, start_date, end_date and unread
+    :param cursor: The tuple (progressive, id) of the last submission of the previous page
+    :param limit: The maximum number of submissions to be returned
+    :return: A list of submissions descriptors
+    """
+    rtips, encrypted_previews = yield fetch_receivertips(tid, receiver_id, language, filters, cursor, limit)
+
+    previews = yield State.decryption_pool.map(lambda x: decrypt_preview(user_key, x[1], x[2]), encrypted_previews)
+
+    for x, preview in zip(encrypted_previews, previews):
+        rtips[x[0]]['preview'] = preview
+
+    returnValue(rtips)
 
 
 @transact
@@ -161,11 +244,73 @@ class TipsCollection(BaseHandler):
     """
     check_roles = 'receiver'
 
+    def get_argument(self, name):
+        value = self.request.args.get(name.encode(), [b''])[0]
+
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            raise errors.InputValidationError
+
+    def parse_date(self, name):
+        value = self.get_argument(name)
+        if not value:
+            return None
+
+        try:
+            return datetime.strptime(value.rstrip('Z')[:19], '%Y-%m-%dT%H:%M:%S')
+        except ValueError:
+            raise errors.InputValidationError
+
+    @inlineCallbacks
     def get(self):
-        return get_receivertips(self.request.tid,
-                                    self.current_user.user_id,
-                                    self.current_user.cc,
-                                    self.request.language)
+        """
+        Return the submissions of the recipient
+
+        When the argument limit is provided the submissions are paginated and
+        the result includes the cursor to be used for requesting the next page.
+        """
+        if b'limit' not in self.request.args:
+            rtips = yield get_receivertips(self.request.tid,
+                                           self.current_user.user_id,
+                                           self.current_user.cc,
+                                           self.request.language)
+            returnValue(rtips)
+
+        cursor = None
+        filters = {
+            'status': self.get_argument('status'),
+            'context_id': self.get_argument('context_id'),
+            'start_date': self.parse_date('start_date'),
+            'end_date': self.parse_date('end_date'),
+            'unread': self.get_argument('unread') == 'true'
+        }
+
+        try:
+            limit = min(max(int(self.get_argument('limit')), 1), 100)
+
+            if self.get_argument('cursor'):
+                progressive, rtip_id = self.get_argument('cursor').split(':', 1)
+                cursor = (int(progressive), rtip_id)
+        except ValueError:
+            raise errors.InputValidationError
+
+        rtips = yield get_receivertips(self.request.tid,
+                                       self.current_user.user_id,
+                                       self.current_user.cc,
+                                       self.request.language,
+                                       filters,
+                                       cursor,
+                                       limit)
+
+        next_cursor = None
+        if len(rtips) == limit:
+            next_cursor = '%d:%s' % (rtips[-1]['progressive'], rtips[-1]['id'])
+
+        returnValue({
+            'tips': rtips,
+            'cursor': next_cursor
+        })
 
 
 class TipsOperations(BaseHandler):
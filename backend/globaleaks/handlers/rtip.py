@@ -4,7 +4,6 @@
 import base64
 import os
 
-from twisted.internet.threads import deferToThread
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
@@ -18,7 +17,7 @@ from globaleaks.handlers.operation import OperationHandler
 from globaleaks.handlers.submission import serialize_usertip, decrypt_tip
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.models import serializers
-from globaleaks.orm import transact
+from globaleaks.orm import transact, tw
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -635,8 +634,7 @@ def db_get_rtip_identityaccessrequest_list(session, rtip_id):
     return [serialize_identityaccessrequest(session, iar) for iar in session.query(models.IdentityAccessRequest).filter(models.IdentityAccessRequest.receivertip_id == rtip_id)]
 
 
-@transact
-def create_comment(session, tid, user_id, rtip_id, content):
+def db_create_comment(session, tid, user_id, rtip_id, content):
     """
     Transaction for registering a new comment
     :param session: An ORM session
@@ -644,7 +642,7 @@ def create_comment(session, tid, user_id, rtip_id, content):
     :param user_id: The user id of the user creating the comment
     :param rtip_id: The rtip associated to the comment to be created
     :param content: The content of the comment
-    :return: A serialized descriptor of the comment
+    :return: The id of the tip and a serialized descriptor of the comment
     """
     rtip, itip = db_access_rtip(session, tid, user_id, rtip_id)
 
@@ -665,11 +663,22 @@ def create_comment(session, tid, user_id, rtip_id, content):
     ret = serialize_comment(session, comment)
     ret['content'] = content
 
-    return ret
+    return itip.id, ret
 
 
-@transact
-def create_message(session, tid, user_id, rtip_id, content):
+@inlineCallbacks
+def create_comment(tid, user_id, rtip_id, content):
+    """
+    Register a new comment scheduling the notification once committed
+    """
+    itip_id, ret = yield tw(db_create_comment, tid, user_id, rtip_id, content)
+
+    State.schedule_notification(itip_id)
+
+    returnValue(ret)
+
+
+def db_create_message(session, tid, user_id, rtip_id, content):
     """
     Transaction for registering a new message
     :param session: An ORM session
@@ -677,7 +686,7 @@ def create_message(session, tid, user_id, rtip_id, content):
     :param user_id: The user id of the user creating the message
     :param rtip_id: The rtip associated to the message to be created
     :param content: The content of the message
-    :return: A serialized descriptor of the message
+    :return: The id of the tip and a serialized descriptor of the message
     """
     rtip, itip = db_access_rtip(session, tid, user_id, rtip_id)
 
@@ -696,7 +705,20 @@ def create_message(session, tid, user_id, rtip_id, content):
 
     ret = serialize_message(session, msg)
     ret['content'] = content
-    return ret
+
+    return itip.id, ret
+
+
+@inlineCallbacks
+def create_message(tid, user_id, rtip_id, content):
+    """
+    Register a new message scheduling the notification once committed
+    """
+    itip_id, ret = yield tw(db_create_message, tid, user_id, rtip_id, content)
+
+    State.schedule_notification(itip_id)
+
+    returnValue(ret)
 
 
 def db_get_itip_message_list(session, rtip_id):
@@ -734,7 +756,7 @@ class RTipInstance(OperationHandler):
         tip, crypto_tip_prv_key = yield get_rtip(self.request.tid, self.current_user.user_id, tip_id, self.request.language)
 
         if State.tenant_cache[self.request.tid].encryption and crypto_tip_prv_key:
-            tip = yield deferToThread(decrypt_tip, self.current_user.cc, crypto_tip_prv_key, tip)
+            tip = yield decrypt_tip(self.current_user.cc, crypto_tip_prv_key, tip)
 
         returnValue(tip)
 
@@ -920,13 +942,20 @@ class ReceiverFileDownload(BaseHandler):
                   (rfile.internalfile_id, rtip.receiver_id, rfile.downloads))
 
         rfile.last_access = datetime_now()
-        rfile.downloads += 1
 
         return serializers.serialize_rfile(session, rfile), base64.b64decode(rtip.crypto_tip_prv_key)
 
+    @transact
+    def count_rfile_download(self, session, file_id):
+        session.query(models.ReceiverFile) \
+               .filter(models.ReceiverFile.id == file_id) \
+               .update({'downloads': models.ReceiverFile.downloads + 1}, synchronize_session=False)
+
     @inlineCallbacks
     def get(self, rfile_id):
-        rfile, tip_prv_key = yield self.download_rfile(self.request.tid, self.current_user.user_id, rfile_id)
+        rfile, tip_prv_key = yield self.download_rfile(self.request.tid,
+                                                       self.current_user.user_id,
+                                                       rfile_id)
 
         filelocation = os.path.join(Settings.attachments_path, rfile['filename'])
         directory_traversal_check(Settings.attachments_path, filelocation)
@@ -935,7 +964,10 @@ class ReceiverFileDownload(BaseHandler):
             tip_prv_key = GCE.asymmetric_decrypt(self.current_user.cc, tip_prv_key)
             filelocation = GCE.streaming_encryption_open('DECRYPT', tip_prv_key, filelocation)
 
-        yield self.write_file_as_download(rfile['name'], filelocation)
+        # A download is counted once its last byte is served, so that
+        # a download split in multiple range requests is counted once
+        if (yield self.write_file_as_download(rfile['name'], filelocation)):
+            yield self.count_rfile_download(rfile_id)
 
 
 
@@ -2,7 +2,7 @@
 # Implementation of the Tenant handlers
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.state import State
 
 
@@ -37,7 +37,7 @@ def serialize_site(session, tenant):
     return ret
 
 
-@transact
+@transact_ro
 def get_site_list(session):
     """
     Transaction return the list of the active tenants
@@ -1,11 +1,151 @@
 # -*- coding: utf-8 -*-
 #
 # Handler exposing application files
+import gzip
+import hashlib
+import mimetypes
 import os
+import re
 
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, serve_file
 from globaleaks.rest import errors
+from globaleaks.rest.cache import etag_match
+from globaleaks.settings import Settings
 from globaleaks.utils.fs import directory_traversal_check
+from globaleaks.utils.log import log
+
+# Assets whose name includes an hash of their content, e.g. scripts.3f2a9c1b.js
+fingerprint_regexp = re.compile(r'\.[0-9a-f]{8,}\.[a-z0-9]+$')
+
+compressible_mime_types = ('application/javascript',
+                           'application/json',
+                           'application/xml',
+                           'image/svg+xml')
+
+precompressed_variants = (('br', '.br'), ('gzip', '.gz'))
+
+
+class Asset(object):
+    __slots__ = ['mime_type', 'etag', 'immutable', 'variants']
+
+    def __init__(self, mime_type, etag, immutable):
+        self.mime_type = mime_type
+        self.etag = etag
+        self.immutable = immutable
+
+        # content encoding -> (path, size, body or None if served from disk)
+        self.variants = {}
+
+
+class AssetIndex(object):
+    """
+    Index of the static assets of a directory
+
+    The index is built once holding the metadata, the entity tags and,
+    within a memory budget, the bodies of the assets and of their
+    compressed variants so that the requests are served without any
+    access to the filesystem.
+    """
+    def __init__(self, root, budget):
+        self.root = root
+        self.budget = budget
+        self.size = 0
+        self.assets = {}
+
+        for dirpath, _, filenames in os.walk(root, followlinks=True):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root)
+
+                if not any(name.endswith(ext) for _, ext in precompressed_variants):
+                    self.add_asset(name)
+                elif not os.path.isfile(path[:path.rindex('.')]):
+                    # precompressed asset without the uncompressed version
+                    self.add_asset(name[:name.rindex('.')])
+
+    def load(self, path, size):
+        if self.size + size > self.budget:
+            return None
+
+        self.size += size
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def add_asset(self, name):
+        path = os.path.join(self.root, name)
+
+        variants = []
+        for encoding, ext in (('identity', ''),) + precompressed_variants:
+            if os.path.isfile(path + ext):
+                variants.append((encoding, path + ext))
+
+        h = hashlib.sha256()
+        for _, x in variants:
+            with open(x, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    h.update(chunk)
+
+        mime_type, _ = mimetypes.guess_type(name)
+
+        asset = Asset(mime_type, h.hexdigest()[:32], fingerprint_regexp.search(name) is not None)
+
+        for encoding, x in variants:
+            size = os.path.getsize(x)
+            asset.variants[encoding] = (x, size, self.load(x, size))
+
+        identity = asset.variants.get('identity')
+        if 'gzip' not in asset.variants and identity is not None and identity[2] is not None and \
+           mime_type is not None and (mime_type.startswith('text/') or mime_type in compressible_mime_types):
+            data = gzip.compress(identity[2], 9)
+            if len(data) < identity[1] and self.size + len(data) <= self.budget:
+                self.size += len(data)
+                asset.variants['gzip'] = (None, len(data), data)
+
+        self.assets[name] = asset
+
+    def get(self, name):
+        return self.assets.get(name)
+
+
+asset_indexes = {}
+
+
+def get_asset_index(root):
+    root = os.path.join(os.path.abspath(root), '')
+
+    index = asset_indexes.get(root)
+    if index is None:
+        index = asset_indexes[root] = AssetIndex(root, Settings.static_cache_size)
+
+    return index
+
+
+def reload_asset_indexes():
+    """
+    Rebuild the indexes of the static assets, e.g. after a client update
+    """
+    for root in list(asset_indexes):
+        asset_indexes[root] = AssetIndex(root, Settings.static_cache_size)
+        log.info("Reloaded the index of the static assets of %s", root)
+
+
+def select_encoding(asset, accept_encoding):
+    accepted = {'identity'}
+
+    for x in accept_encoding.split(b','):
+        x = x.split(b';')
+        if len(x) > 1 and x[1].strip() in (b'q=0', b'q=0.0'):
+            continue
+
+        accepted.add(x[0].strip().decode(errors='ignore'))
+
+    for encoding in ('br', 'gzip', 'identity'):
+        if encoding in accepted and encoding in asset.variants:
+            return encoding
+
+    # Assets only available compressed are anyhow served compressed
+    return 'gzip' if 'gzip' in asset.variants else 'br'
 
 
 class StaticFileHandler(BaseHandler):
@@ -25,9 +165,37 @@ class StaticFileHandler(BaseHandler):
 
         directory_traversal_check(self.root, abspath)
 
-        if os.path.exists(abspath + '.gz') and os.path.isfile(abspath + '.gz'):
-            return self.write_file(filename + '.gz', abspath + '.gz')
-        elif os.path.exists(abspath) and os.path.isfile(abspath):
-            return self.write_file(filename, abspath)
+        asset = get_asset_index(self.root).get(abspath[len(self.root):])
+        if asset is None:
+            raise errors.ResourceNotFound()
+
+        encoding = select_encoding(asset, self.request.getHeader(b'Accept-Encoding') or b'')
+        path, size, body = asset.variants[encoding]
+
+        etag = ('"%s-%s"' % (asset.etag, encoding)).encode()
+
+        self.request.setHeader(b'ETag', etag)
+        self.request.setHeader(b'Vary', b'Accept-Encoding')
+
+        if asset.immutable:
+            self.request.setHeader(b'Cache-control', b'public, max-age=31536000, immutable')
+            self.request.responseHeaders.removeHeader(b'Pragma')
+            self.request.responseHeaders.removeHeader(b'Expires')
+        else:
+            self.request.setHeader(b'Cache-control', b'no-cache, must-revalidate')
+
+        if etag_match(self.request.getHeader(b'If-None-Match'), etag):
+            self.request.setResponseCode(304)
+            return
+
+        if encoding != 'identity':
+            self.request.setHeader(b'Content-encoding', encoding)
+
+        if asset.mime_type:
+            self.request.setHeader(b'Content-Type', asset.mime_type)
+
+        if body is None:
+            return serve_file(self.request, self.open_file(path))
 
-        raise errors.ResourceNotFound()
+        self.request.setHeader(b'Content-Length', b'%d' % size)
+        self.request.write(body)
@@ -5,11 +5,13 @@ import base64
 import copy
 import json
 
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from globaleaks import models
 from globaleaks.handlers.admin.questionnaire import db_get_questionnaire
 from globaleaks.handlers.base import connection_check, BaseHandler
 from globaleaks.models import get_localized_values
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro, tw
 from globaleaks.rest import errors, requests
 from globaleaks.state import State
 from globaleaks.utils.crypto import sha256, Base64Encoder, GCE
@@ -18,32 +20,81 @@ from globaleaks.utils.json import JSONEncoder
 from globaleaks.utils.utility import get_expiration
 
 
+def decrypt_json(x):
+    return json.loads(x.decode())
+
+
+def decrypt_identity(x):
+    x = json.loads(x.decode())
+
+    if isinstance(x, list):
+        # Fix for issue: https://github.com/globaleaks/GlobaLeaks/issues/2612
+        # The bug is due to the fact that the data was initially saved as an array of one entry
+        x = x[0]
+
+    return x
+
+
+def decrypt_str(x):
+    return x.decode()
+
+
+def decrypt_int(x):
+    return int(x.decode())
+
+
+@inlineCallbacks
 def decrypt_tip(user_key, tip_prv_key, tip):
-    tip_key = GCE.asymmetric_decrypt(user_key, tip_prv_key)
+    """
+    Decrypt the items of a tip
+
+    The tip key is decrypted once and the decryption of the items is
+    executed in batch on the decryption pool.
+
+    :param user_key: The private key of the user
+    :param tip_prv_key: The tip key encrypted with the user key
+    :param tip: The serialized tip
+    :return: A deferred fired with the decrypted tip
+    """
+    tip_key = (yield State.decryption_pool.decrypt(user_key, [tip_prv_key]))[0]
+
+    tip = yield decrypt_tip_with_key(tip_key, tip)
+
+    returnValue(tip)
+
+
+@inlineCallbacks
+def decrypt_tip_with_key(tip_key, tip):
+    """
+    Decrypt the items of a tip by means of the already decrypted tip key
+
+    :param tip_key: The private key of the tip
+    :param tip: The serialized tip
+    :return: A deferred fired with the decrypted tip
+    """
+    items = []
 
     for questionnaire in tip['questionnaires']:
-        questionnaire['answers'] = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(questionnaire['answers'].encode())).decode())
+        items.append((questionnaire, 'answers', decrypt_json))
 
     for k in ['whistleblower_identity']:
         if k in tip['data'] and tip['data'][k]:
-            tip['data'][k] = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(tip['data'][k].encode())).decode())
-
-            if k == 'whistleblower_identity' and isinstance(tip['data'][k], list):
-               # Fix for issue: https://github.com/globaleaks/GlobaLeaks/issues/2612
-               # The bug is due to the fact that the data was initially saved as an array of one entry
-               tip['data'][k] = tip['data'][k][0]
+            items.append((tip['data'], k, decrypt_identity))
 
     for x in tip['comments'] + tip['messages']:
-        x['content'] = GCE.asymmetric_decrypt(tip_key, base64.b64decode(x['content'].encode())).decode()
+        items.append((x, 'content', decrypt_str))
 
     for x in tip['wbfiles'] + tip['rfiles']:
         for k in ['name', 'description', 'type', 'size']:
             if k in x:
-                x[k] = GCE.asymmetric_decrypt(tip_key, base64.b64decode(x[k].encode())).decode()
-                if k == 'size':
-                    x[k] = int(x[k])
+                items.append((x, k, decrypt_int if k == 'size' else decrypt_str))
+
+    values = yield State.decryption_pool.decrypt(tip_key, [base64.b64decode(x[0][x[1]].encode()) for x in items])
+
+    for (obj, k, f), value in zip(items, values):
+        obj[k] = f(value)
 
-    return tip
+    returnValue(tip)
 
 
 def db_set_internaltip_answers(session, itip_id, questionnaire_hash, answers):
@@ -275,7 +326,7 @@ def db_create_receivertip(session, receiver, internaltip, can_access_whistleblow
     session.add(receivertip)
 
 
-def db_create_submission(session, tid, request, token, client_using_tor):
+def db_create_submission(session, tid, request, token, client_using_tor, receipt, receipt_hash, wb_key):
     answers = request['answers']
 
     context, questionnaire = session.query(models.Context, models.Questionnaire) \
@@ -357,25 +408,17 @@ def db_create_submission(session, tid, request, token, client_using_tor):
         else:
             crypto_tip_prv_key, itip.crypto_tip_pub_key = GCE.generate_keypair()
 
-    receipt = ''
-
-    # Evaluate if the whistleblower tip should be generated
-    if ((not State.tenant_cache[tid].enable_scoring_system) or
-        (context.score_threshold_receipt == 0) or
-        (context.score_threshold_receipt == 1 and itip.total_score >= 2) or
-        (context.score_threshold_receipt == 2 and itip.total_score == 3)):
-        receipt = GCE.generate_receipt()
-        receipt_salt = State.tenant_cache[tid].receipt_salt
+    # The whistleblower tip is generated only if a receipt is issued
+    if receipt:
         wbtip = models.WhistleblowerTip()
         wbtip.id = itip.id
         wbtip.tid = tid
         wbtip.hash_alg = 'ARGON2'
-        wbtip.receipt_hash = GCE.hash_password(receipt, receipt_salt)
+        wbtip.receipt_hash = receipt_hash
 
         # Evaluate if the whistleblower tip should be encrypted
         if crypto_is_available:
             crypto_tip_prv_key, itip.crypto_tip_pub_key = GCE.generate_keypair()
-            wb_key = GCE.derive_key(receipt.encode(), receipt_salt)
             wb_prv_key, wb_pub_key = GCE.generate_keypair()
             wbtip.crypto_prv_key = Base64Encoder.encode(GCE.symmetric_encrypt(wb_key, wb_prv_key))
             wbtip.crypto_pub_key = wb_pub_key
@@ -442,15 +485,62 @@ def db_create_submission(session, tid, request, token, client_using_tor):
     if not tip_count:
         raise errors.InputValidationError("Unable to deliver the submission to at least one recipient")
 
-    return {
+    return itip.id, {
         'receipt': receipt,
         'score': itip.total_score
     }
 
 
-@transact
-def create_submission(session, tid, request, token, client_using_tor):
-    return db_create_submission(session, tid, request, token, client_using_tor)
+@transact_ro
+def is_receipt_issued(session, tid, context_id, total_score):
+    """
+    Evaluate if a receipt should be issued to the whistleblower
+    in relation to the score of the submission
+
+    :param tid: A tenant ID
+    :param context_id: The ID of the context of the submission
+    :param total_score: The score of the submission
+    :return: A boolean
+    """
+    if not State.tenant_cache[tid].enable_scoring_system:
+        return True
+
+    context = session.query(models.Context) \
+                     .filter(models.Context.id == context_id,
+                             models.Context.tid == tid).one_or_none()
+
+    if not context:
+        raise errors.ModelNotFound(models.Context)
+
+    return ((context.score_threshold_receipt == 0) or
+            (context.score_threshold_receipt == 1 and total_score >= 2) or
+            (context.score_threshold_receipt == 2 and total_score == 3))
+
+
+@inlineCallbacks
+def create_submission(tid, request, token, client_using_tor):
+    """
+    Create a submission executing the hashing and the key derivation
+    of the receipt on the KDF pool before opening the transaction
+
+    The receipt is generated only if it is issued to the whistleblower.
+    """
+    receipt, receipt_hash, wb_key = '', '', b''
+
+    receipt_is_issued = yield is_receipt_issued(tid, request['context_id'], request['total_score'])
+    if receipt_is_issued:
+        receipt = GCE.generate_receipt()
+        receipt_salt = State.tenant_cache[tid].receipt_salt
+        receipt_hash = yield State.kdf.hash_password(receipt, receipt_salt)
+
+        if State.tenant_cache[tid].encryption:
+            wb_key = yield State.kdf.derive_key(receipt.encode(), receipt_salt)
+
+    itip_id, ret = yield tw(db_create_submission, tid, request, token, client_using_tor, receipt, receipt_hash, wb_key)
+
+    State.schedule_notification(itip_id)
+
+    returnValue(ret)
 
 
 class SubmissionInstance(BaseHandler):
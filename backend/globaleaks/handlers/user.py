@@ -10,33 +10,111 @@ from globaleaks.handlers.admin.modelimgs import db_get_model_img
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.models import get_localized_values
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors, requests
 from globaleaks.state import State
-from globaleaks.utils.pgp import PGPContext
 from globaleaks.utils.crypto import Base32Encoder, Base64Encoder, GCE, generateRandomKey
 from globaleaks.utils.utility import datetime_now, datetime_null
 
 
-def set_user_password(tid, user, password, cc):
+@transact_ro
+def get_user_credentials(session, tid, user_id):
+    """
+    Transaction returning the credentials of a user
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param user_id: A user ID
+    :return: A dictionary with the credentials of the user
+    """
+    user = db_get_user(session, tid, user_id)
+
+    return {
+        'hash_alg': user.hash_alg,
+        'salt': user.salt,
+        'password': user.password,
+        'password_change_needed': user.password_change_needed,
+        'crypto_pub_key': user.crypto_pub_key
+    }
+
+
+@inlineCallbacks
+def derive_user_credentials(password, salt, hash_alg, with_key):
+    """
+    Compute on the KDF pool the hash and the key of a new user password
+
+    :param password: The new password
+    :param salt: The current salt of the user
+    :param hash_alg: The current hash algorithm of the user
+    :param with_key: A boolean telling if the encryption key should be derived
+    :return: A dictionary with the salt, the password hash and the key to be used by set_user_password
+    """
     # Regenerate the password hash only if different from the best choice on the platform
-    if user.hash_alg != 'ARGON2':
-        user.hash_alg = 'ARGON2'
-        user.salt = GCE.generate_salt()
+    if hash_alg != 'ARGON2':
+        salt = GCE.generate_salt()
+
+    credentials = {
+        'salt': salt,
+        'password': (yield State.kdf.hash_password(password, salt)),
+        'key': None
+    }
+
+    if with_key:
+        credentials['key'] = yield State.kdf.derive_key(password.encode(), salt)
+
+    returnValue(credentials)
 
-    password_hash = GCE.hash_password(password, user.salt)
+
+@inlineCallbacks
+def get_user_password_change(tid, user_session, request):
+    """
+    Verify the old password and derive the credentials of the new one
+
+    :param tid: A tenant ID
+    :param user_session: The session of the user changing the password
+    :param request: A user request data
+    :return: The credentials to be used by set_user_password or None if the password is not changed
+    """
+    if not request['password']:
+        returnValue(None)
+
+    user = yield get_user_credentials(user_session.user_tid, user_session.user_id)
+
+    if not user['password_change_needed']:
+        valid = yield State.kdf.check_password(user['hash_alg'],
+                                               request['old_password'],
+                                               user['salt'],
+                                               user['password'])
+        if not valid:
+            raise errors.InvalidOldPassword
+
+    credentials = yield derive_user_credentials(request['password'],
+                                                user['salt'],
+                                                user['hash_alg'],
+                                                State.tenant_cache[tid].encryption or user_session.cc != '')
+
+    # The password verified is checked again within the update transaction
+    credentials['old_password'] = user['password']
+
+    returnValue(credentials)
+
+
+def set_user_password(tid, user, credentials, cc):
+    password_hash = credentials['password']
 
     # Check that the new password is different form the current password
     if user.password == password_hash:
         raise errors.PasswordReuseError
 
+    user.hash_alg = 'ARGON2'
+    user.salt = credentials['salt']
     user.password = password_hash
     user.password_change_date = datetime_now()
 
     if not State.tenant_cache[tid].encryption and cc == '':
         return None
 
-    enc_key = GCE.derive_key(password.encode(), user.salt)
+    enc_key = credentials['key']
     if not cc:
         # The first password change triggers the generation
         # of the user encryption private key and its backup
@@ -67,9 +145,7 @@ def parse_pgp_options(user, request):
 
     k = None
     if not remove_key and pgp_key_public:
-        pgpctx = PGPContext(State.settings.tmp_path)
-
-        k = pgpctx.load_key(pgp_key_public)
+        k = State.pgp_keyring.load_key(pgp_key_public)
 
     if k is not None:
         user.pgp_key_public = pgp_key_public
@@ -156,7 +232,7 @@ def db_get_user(session, tid, user_id):
                          models.User.tid == tid)
 
 
-@transact
+@transact_ro
 def get_user(session, tid, user_id, language):
     """
     Transaction for retrieving a user model given an id
@@ -172,7 +248,7 @@ def get_user(session, tid, user_id, language):
     return user_serialize_user(session, user, language)
 
 
-def db_user_update_user(session, tid, user_session, request):
+def db_user_update_user(session, tid, user_session, request, credentials=None):
     """
     Transaction for updating an existing user
 
@@ -180,6 +256,7 @@ def db_user_update_user(session, tid, user_session, request):
     :param tid: A tenant ID
     :param user_session: A session of the user invoking the transaction
     :param request: A user request data
+    :param credentials: The credentials of the new password as returned by get_user_password_change
     :return: A user model
     """
     from globaleaks.handlers.admin.notification import db_get_notification
@@ -193,17 +270,14 @@ def db_user_update_user(session, tid, user_session, request):
     user.name = request['name']
     user.public_name = request['public_name'] if request['public_name'] else request['name']
 
-    if request['password']:
-        if user.password_change_needed:
-            user.password_change_needed = False
-        else:
-            if not GCE.check_password(user.hash_alg,
-                                      request['old_password'],
-                                      user.salt,
-                                      user.password):
-                raise errors.InvalidOldPassword
+    if credentials is not None:
+        # The password could have been changed since its verification
+        if user.password != credentials['old_password']:
+            raise errors.InvalidOldPassword
+
+        user.password_change_needed = False
 
-        user_session.cc = set_user_password(tid, user, request['password'], user_session.cc)
+        user_session.cc = set_user_password(tid, user, credentials, user_session.cc)
 
     # If the email address changed, send a validation email
     if request['mail_address'] != user.mail_address:
@@ -232,7 +306,7 @@ def db_user_update_user(session, tid, user_session, request):
 
 
 @transact
-def update_user_settings(session, tid, user_session, request, language):
+def update_user_settings(session, tid, user_session, request, language, credentials=None):
     """
     Transaction for updating an existing user
 
@@ -241,9 +315,10 @@ def update_user_settings(session, tid, user_session, request, language):
     :param user_session: A session of the user invoking the transaction
     :param request: A user request data
     :param language: A language to be used when serializing the user
+    :param credentials: The credentials of the new password as returned by get_user_password_change
     :return: A serialization of user model
     """
-    user = db_user_update_user(session, tid, user_session, request)
+    user = db_user_update_user(session, tid, user_session, request, credentials)
 
     return user_serialize_user(session, user, language)
 
@@ -276,16 +351,24 @@ class UserInstance(BaseHandler):
                         self.current_user.user_id,
                         self.request.language)
 
+    @inlineCallbacks
     def put(self):
         request = self.validate_message(self.request.content.read(), requests.UserUserDesc)
 
-        return update_user_settings(self.current_user.user_tid,
-                                    self.current_user,
-                                    request,
-                                    self.request.language)
+        credentials = yield get_user_password_change(self.current_user.user_tid,
+                                                     self.current_user,
+                                                     request)
 
+        user = yield update_user_settings(self.current_user.user_tid,
+                                          self.current_user,
+                                          request,
+                                          self.request.language,
+                                          credentials)
 
-@transact
+        returnValue(user)
+
+
+@transact_ro
 def get_recovery_key(session, tid, user_id, user_cc):
     """
     Transaction to get a user recovery key
@@ -3,7 +3,6 @@
 # Handlers dealing with tip interface for whistleblowers (wbtip)
 import base64
 import json
-from twisted.internet.threads import deferToThread
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
@@ -13,8 +12,9 @@ from globaleaks.handlers.submission import serialize_usertip, \
     db_save_plaintext_answers, decrypt_tip, \
     db_set_internaltip_answers, db_get_questionnaire, db_archive_questionnaire_schema, db_set_internaltip_data
 from globaleaks.models import serializers
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_batch, transact_ro, tw
 from globaleaks.rest import errors, requests
+from globaleaks.state import State
 from globaleaks.utils.crypto import GCE
 from globaleaks.utils.log import log
 from globaleaks.utils.utility import datetime_now
@@ -42,17 +42,22 @@ def db_get_wbtip(session, itip_id, language):
                                 models.WhistleblowerTip.id == models.InternalTip.id,
                                 models.InternalTip.id == itip_id)
 
-    itip.wb_access_counter += 1
-    itip.wb_last_access = datetime_now()
-
     return serialize_wbtip(session, wbtip, itip, language), base64.b64decode(wbtip.crypto_tip_prv_key)
 
 
-@transact
+@transact_ro
 def get_wbtip(session, itip_id, language):
     return db_get_wbtip(session, itip_id, language)
 
 
+@transact_batch
+def update_wbtip_access(session, itip_id):
+    session.query(models.InternalTip) \
+           .filter(models.InternalTip.id == itip_id) \
+           .update({'wb_access_counter': models.InternalTip.wb_access_counter + 1,
+                    'wb_last_access': datetime_now()}, synchronize_session=False)
+
+
 def serialize_wbtip(session, wbtip, itip, language):
     ret = serialize_usertip(session, itip, itip, language)
 
@@ -64,8 +69,7 @@ def serialize_wbtip(session, wbtip, itip, language):
     return ret
 
 
-@transact
-def create_comment(session, tid, wbtip_id, content):
+def db_create_comment(session, tid, wbtip_id, content):
     wbtip, itip = session.query(models.WhistleblowerTip, models.InternalTip)\
                          .filter(models.WhistleblowerTip.id == wbtip_id,
                                  models.InternalTip.id == models.WhistleblowerTip.id,
@@ -95,6 +99,18 @@ def create_comment(session, tid, wbtip_id, content):
     return ret
 
 
+@inlineCallbacks
+def create_comment(tid, wbtip_id, content):
+    """
+    Register a new comment scheduling the notification once committed
+    """
+    ret = yield tw(db_create_comment, tid, wbtip_id, content)
+
+    State.schedule_notification(wbtip_id)
+
+    returnValue(ret)
+
+
 def db_get_itip_message_list(session, wbtip_id):
     messages = session.query(models.Message) \
                       .filter(models.Message.receivertip_id == models.ReceiverTip.id,
@@ -104,8 +120,7 @@ def db_get_itip_message_list(session, wbtip_id):
     return [serialize_message(session, message) for message in messages]
 
 
-@transact
-def create_message(session, tid, wbtip_id, receiver_id, content):
+def db_create_message(session, tid, wbtip_id, receiver_id, content):
     wbtip, itip, rtip_id = session.query(models.WhistleblowerTip, models.InternalTip, models.ReceiverTip.id) \
                                   .filter(models.WhistleblowerTip.id == wbtip_id,
                                           models.ReceiverTip.internaltip_id == wbtip_id,
@@ -137,6 +152,18 @@ def create_message(session, tid, wbtip_id, receiver_id, content):
     return ret
 
 
+@inlineCallbacks
+def create_message(tid, wbtip_id, receiver_id, content):
+    """
+    Register a new message scheduling the notification once committed
+    """
+    ret = yield tw(db_create_message, tid, wbtip_id, receiver_id, content)
+
+    State.schedule_notification(wbtip_id)
+
+    returnValue(ret)
+
+
 @transact
 def update_identity_information(session, tid, tip_id, identity_field_id, wbi, language):
     itip = models.db_get(session,
@@ -188,8 +215,10 @@ class WBTipInstance(BaseHandler):
     def get(self):
         tip, crypto_tip_prv_key = yield get_wbtip(self.current_user.user_id, self.request.language)
 
+        yield update_wbtip_access(self.current_user.user_id)
+
         if crypto_tip_prv_key:
-            tip = yield deferToThread(decrypt_tip, self.current_user.cc, crypto_tip_prv_key, tip)
+            tip = yield decrypt_tip(self.current_user.cc, crypto_tip_prv_key, tip)
 
         returnValue(tip)
 
@@ -1,48 +1,90 @@
 # -*- coding: utf-8
 import os
+import shutil
+import sys
 import time
 from datetime import datetime
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
+from twisted.internet.utils import getProcessOutputAndValue
 
-from globaleaks import models
+import globaleaks
+from globaleaks import models, DATABASE_VERSION
 from globaleaks.handlers.file import db_mark_file_for_secure_deletion
 from globaleaks.jobs.job import DailyJob
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.settings import Settings
-from globaleaks.utils.backup import backup_name, get_records_to_delete
-from globaleaks.utils.tar import tardir
+from globaleaks.utils.backup import backup_name, get_objects, get_records_to_delete, get_referenced_objects
 
 
 __all__ = ['Backup']
 
 
-def db_perform_backup(session, id):
-    timestamp = int(time.time())
-    backupfile = backup_name(id, timestamp)
-    dst = os.path.join(Settings.backup_path, backupfile)
+def get_backup_command(filename):
+    """
+    Return the command creating a backup in a separate process
+
+    The process runs with the lowest CPU priority and, where supported,
+    in the idle I/O scheduling class.
+    """
+    args = [sys.executable, '-m', 'globaleaks.utils.backup',
+            Settings.working_path, Settings.backup_path, filename, str(DATABASE_VERSION)]
+
+    ionice = shutil.which('ionice')
+    if ionice is not None:
+        args = [ionice, '-c', '3'] + args
+
+    return args
+
+
+def get_unreferenced_objects(backup_path, filenames):
+    """
+    Return the paths of the objects not referenced by a set of backups
+    """
+    referenced = get_referenced_objects(backup_path, filenames)
+
+    return [path for digest, path in get_objects(backup_path).items() if digest not in referenced]
 
-    tardir(dst, Settings.working_path)
 
-    backup = session.query(models.Backup).filter(models.Backup.filename == backupfile).one_or_none()
+@transact
+def db_record_backup(session, filename, timestamp):
+    backup = session.query(models.Backup).filter(models.Backup.filename == filename).one_or_none()
     if backup is None:
         backup = models.Backup()
 
-    backup.filename = backupfile
+    backup.filename = filename
     backup.creation_date = datetime.utcfromtimestamp(timestamp)
     backup.local = True
     session.add(backup)
 
 
+@inlineCallbacks
+def perform_backup(id):
+    timestamp = int(time.time())
+    filename = backup_name(id, timestamp)
+
+    args = get_backup_command(filename)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(globaleaks.__file__)))
+
+    out, err, code = yield getProcessOutputAndValue(args[0], args[1:], env=env)
+    if code != 0:
+        raise Exception("Backup failed with exit code %d: %s" % (code, err.decode(errors='replace')))
+
+    yield db_record_backup(filename, timestamp)
+
+
 class Backup(DailyJob):
     monitor_interval = 5 * 60
 
-    @transact
-    def daily_backup(self, session):
+    @inlineCallbacks
+    def daily_backup(self):
         if not self.state.tenant_cache[1].backup:
             return
 
-        db_perform_backup(session, self.state.tenant_cache[1].id)
+        yield perform_backup(self.state.tenant_cache[1].id)
 
     @transact
     def check_backup_records_to_delete(self, session):
@@ -65,7 +107,32 @@ class Backup(DailyJob):
     @transact
     def commit_deletion_of_backup_records(self, session, records_to_delete):
         records_to_delete_ids = [r['id'] for r in records_to_delete]
-        session.query(models.Backup).filter(models.Backup.id.in_(records_to_delete_ids))
+        session.query(models.Backup).filter(models.Backup.id.in_(records_to_delete_ids)).delete(synchronize_session=False)
+
+    @transact_ro
+    def get_backup_filenames(self, session):
+        return [x[0] for x in session.query(models.Backup.filename).filter(models.Backup.delete.is_(False))]
+
+    @transact
+    def mark_objects_for_secure_deletion(self, session, paths):
+        queued_files = set(x[0] for x in session.query(models.SecureFileDelete.filepath))
+
+        for path in paths:
+            if path not in queued_files:
+                db_mark_file_for_secure_deletion(session, os.path.dirname(path), os.path.basename(path))
+
+    @inlineCallbacks
+    def delete_unreferenced_objects(self):
+        """
+        Mark for secure deletion the attachments no more referenced by any backup
+
+        The manifests of the archives are read outside of the transactions
+        """
+        filenames = yield self.get_backup_filenames()
+
+        paths = yield deferToThread(get_unreferenced_objects, self.state.settings.backup_path, filenames)
+
+        yield self.mark_objects_for_secure_deletion(paths)
 
     @inlineCallbacks
     def operation(self):
@@ -74,3 +141,5 @@ class Backup(DailyJob):
         to_delete = yield self.check_backup_records_to_delete()
 
         yield self.commit_deletion_of_backup_records(to_delete)
+
+        yield self.delete_unreferenced_objects()
@@ -2,9 +2,10 @@
 # Implementation of the daily operations.
 import fnmatch
 import os
+import time
 from datetime import datetime, timedelta
 
-from sqlalchemy import not_
+from sqlalchemy import and_, not_, or_
 from sqlalchemy.sql.expression import func
 
 from twisted.internet.defer import inlineCallbacks
@@ -12,11 +13,11 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
+from globaleaks.handlers.file import db_mark_file_for_secure_deletion
 from globaleaks.handlers.rtip import db_delete_itips
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.job import DailyJob
-from globaleaks.orm import transact
-from globaleaks.utils.fs import overwrite_and_remove
+from globaleaks.orm import transact, transact_ro
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, is_expired
 
@@ -27,16 +28,99 @@ __all__ = ['Cleaning']
 class Cleaning(DailyJob):
     monitor_interval = 5 * 60
 
+    # Maximum number of expired tips deleted by each transaction and
+    # time budget in seconds after which a transaction stops deleting
+    expired_itips_batch_size = 100
+    expired_itips_time_budget = 1
+
+    # Number of tips deleted together within a transaction
+    expired_itips_chunk_size = 10
+
+    def __init__(self):
+        # (expiration_date, id) of the last expired tip deleted
+        self.expired_itips_cursor = None
+        self.expired_itips_threshold = None
+
+        DailyJob.__init__(self)
+
+    @transact_ro
+    def count_expired_itips(self, session, threshold):
+        return session.query(models.InternalTip.id) \
+                      .filter(models.InternalTip.expiration_date < threshold).count()
+
     @transact
-    def clean_expired_itips(self, session):
+    def delete_expired_itips(self, session, threshold, cursor):
+        """
+        Delete a batch of the tips expired before the threshold
+
+        The tips are visited by expiration date starting after the cursor
+        and are deleted in chunks until the batch size or the time budget
+        are exhausted; the files of the tips are marked for secure deletion
+        within the same transaction.
+
+        :param threshold: The expiration threshold
+        :param cursor: The (expiration_date, id) of the last tip deleted or None
+        :return: A tuple (cursor, count) with the updated cursor and the number of tips deleted
+        """
+        start = time.time()
+
+        query = session.query(models.InternalTip.expiration_date, models.InternalTip.id) \
+                       .filter(models.InternalTip.expiration_date < threshold)
+
+        if cursor is not None:
+            query = query.filter(or_(models.InternalTip.expiration_date > cursor[0],
+                                     and_(models.InternalTip.expiration_date == cursor[0],
+                                          models.InternalTip.id > cursor[1])))
+
+        itips = query.order_by(models.InternalTip.expiration_date, models.InternalTip.id) \
+                     .limit(self.expired_itips_batch_size).all()
+
+        count = 0
+        for i in range(0, len(itips), self.expired_itips_chunk_size):
+            chunk = itips[i:i + self.expired_itips_chunk_size]
+
+            db_delete_itips(session, [x[1] for x in chunk])
+
+            count += len(chunk)
+            cursor = tuple(chunk[-1])
+
+            if time.time() - start > self.expired_itips_time_budget:
+                break
+
+        return cursor, count
+
+    @inlineCallbacks
+    def clean_expired_itips(self):
         """
-        This function, checks all the InternalTips and their expiration date.
-        if expired InternalTips are found, it removes that along with
-        all the related DB entries comment and tip related.
+        Delete the expired tips along with all the related entries
+
+        The deletion is split in transactions of bounded size and duration
+        so that the database is not locked for long by a purge of many tips;
+        the progress is resumed from a cursor in case of interruption.
         """
-        itips_ids = [id[0] for id in session.query(models.InternalTip.id).filter(models.InternalTip.expiration_date < datetime_now())]
-        if itips_ids:
-            db_delete_itips(session, itips_ids)
+        if self.expired_itips_threshold is None:
+            self.expired_itips_threshold = datetime_now()
+            self.expired_itips_cursor = None
+
+        threshold = self.expired_itips_threshold
+
+        total = yield self.count_expired_itips(threshold)
+
+        self.progress = {
+            'operation': 'expired_itips',
+            'deleted': 0,
+            'total': total
+        }
+
+        while True:
+            self.expired_itips_cursor, count = yield self.delete_expired_itips(threshold, self.expired_itips_cursor)
+            if not count:
+                break
+
+            self.progress['deleted'] += count
+
+        self.expired_itips_threshold = None
+        self.expired_itips_cursor = None
 
     def db_clean_expired_wbtips(self, session, tid):
         """
@@ -108,30 +192,20 @@ class Cleaning(DailyJob):
         session.query(models.Tenant).filter(models.Tenant.id.in_(subquery)).delete(synchronize_session=False)
 
     @transact
-    def get_files_to_secure_delete(self, session):
-        return [x[0] for x in session.query(models.SecureFileDelete.filepath)]
-
-    @transact
-    def commit_files_deletion(self, session, filepaths):
-        session.query(models.SecureFileDelete).filter(models.SecureFileDelete.filepath.in_(filepaths)).delete(synchronize_session=False)
+    def mark_outdated_files_for_secure_deletion(self, session):
+        """
+        Mark for secure deletion the temporary AES files older than 1 day
+        """
+        queued_files = set(x[0] for x in session.query(models.SecureFileDelete.filepath))
 
-    @inlineCallbacks
-    def perform_secure_deletion_of_files(self):
-        # Delete files that are marked for secure deletion
-        files_to_delete = yield self.get_files_to_secure_delete()
-        for file_to_delete in files_to_delete:
-            overwrite_and_remove(file_to_delete)
-
-        if files_to_delete:
-            yield self.commit_files_deletion(files_to_delete)
-
-        # Delete the outdated AES files older than 1 day
-        files_to_remove = [f for f in os.listdir(self.state.settings.tmp_path) if fnmatch.fnmatch(f, '*.aes')]
-        for f in files_to_remove:
+        for f in os.listdir(self.state.settings.tmp_path):
             path = os.path.join(self.state.settings.tmp_path, f)
+            if not fnmatch.fnmatch(f, '*.aes') or path in queued_files:
+                continue
+
             timestamp = datetime.fromtimestamp(os.path.getmtime(path))
             if is_expired(timestamp, days=1):
-                overwrite_and_remove(path)
+                db_mark_file_for_secure_deletion(session, self.state.settings.tmp_path, f)
 
     @transact
     def per_tenant_clean(self, session, tid):
@@ -147,4 +221,4 @@ class Cleaning(DailyJob):
 
         yield self.clean()
 
-        yield self.perform_secure_deletion_of_files()
+        yield self.mark_outdated_files_for_secure_deletion()
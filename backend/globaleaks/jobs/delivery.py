@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import os
+import threading
+import time
 
-from twisted.internet import abstract
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import abstract, reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.internet.threads import deferToThreadPool
 
 from globaleaks import models
 from globaleaks.jobs.job import LoopingJob
@@ -10,7 +13,6 @@ from globaleaks.orm import transact
 from globaleaks.settings import Settings
 from globaleaks.utils.crypto import generateRandomKey, GCE
 from globaleaks.utils.log import log
-from globaleaks.utils.pgp import PGPContext
 
 __all__ = ['Delivery']
 
@@ -24,6 +26,7 @@ def file_delivery_planning(session):
     """
     receiverfiles_maps = {}
     whistleblowerfiles_maps = {}
+    itip_ids = set()
 
     for ifile, itip in session.query(models.InternalFile, models.InternalTip)\
                               .filter(models.InternalFile.new.is_(True),
@@ -45,6 +48,9 @@ def file_delivery_planning(session):
 
             session.add(receiverfile)
 
+            if receiverfile.new:
+                itip_ids.add(itip.id)
+
             session.flush()
 
             if ifile.id not in receiverfiles_maps:
@@ -82,120 +88,248 @@ def file_delivery_planning(session):
             'filename': wbfile.filename,
         }
 
-    return receiverfiles_maps, whistleblowerfiles_maps
+    return receiverfiles_maps, whistleblowerfiles_maps, itip_ids
 
 
-def encrypt_file_with_pgp(state, fd, key, fingerprint, dest_path):
+class PGPStreamWriter(object):
     """
-    Encrypt the file for a specific key
+    Writer encrypting with PGP the data streamed through a pipe to gpg
     """
-    pgpctx = PGPContext(state.settings.tmp_path)
+    def __init__(self, state, key, dest_path):
+        self.keyring = state.pgp_keyring
+        self.keyring.load_key(key)
 
-    pgpctx.load_key(key)
+        self.error = None
 
-    pgpctx.encrypt_file(fingerprint, fd, dest_path)
+        r, w = os.pipe()
+        self.input = os.fdopen(r, 'rb')
+        self.output = os.fdopen(w, 'wb')
 
+        self.thread = threading.Thread(target=self.encrypt, args=(key, dest_path))
+        self.thread.daemon = True
+        self.thread.start()
 
-def write_plaintext_file(sf, dest_path):
-    try:
-        with sf.open('rb') as encrypted_file, open(dest_path, "a+b") as plaintext_file:
-            chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
-            while chunk:
-                plaintext_file.write(chunk)
-                chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
+    def encrypt(self, key, dest_path):
+        try:
+            self.keyring.encrypt_file(key, self.input, dest_path)
+        except Exception as excep:
+            self.error = excep
+        finally:
+            self.input.close()
 
-    except Exception as excep:
-        log.err("Unable to create plaintext file %s: %s", dest_path, excep)
+    def write(self, chunk):
+        self.output.write(chunk)
+
+    def close(self):
+        try:
+            self.output.close()
+        finally:
+            self.thread.join()
+
+        if self.error is not None:
+            raise self.error
 
 
-def write_encrypted_file(key, sf, dest_path):
+class EncryptedFileWriter(object):
+    """
+    Writer encrypting the data with the streaming encryption of the tip key
+    """
+    def __init__(self, key, dest_path):
+        self.seo = GCE.streaming_encryption_open('ENCRYPT', key, dest_path)
+
+    def write(self, chunk):
+        self.seo.encrypt_chunk(chunk, 0)
+
+    def close(self):
+        try:
+            self.seo.encrypt_chunk(b'', 1)
+        finally:
+            self.seo.close()
+
+
+def stream_file(sf, writers):
+    """
+    Read a temporary file once, writing each plaintext chunk to all the writers
+
+    :param sf: The temporary file to be read
+    :param writers: A list of (name, writer) to which the data should be written
+    :return: A tuple with the bytes read and a dict of the writers failed with their exception
+    """
+    failures = {}
+    size = 0
+
     try:
-        with sf.open('rb') as encrypted_file, \
-             GCE.streaming_encryption_open('ENCRYPT', key, dest_path) as seo:
+        with sf.open('rb') as encrypted_file:
             chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
             while chunk:
-                seo.encrypt_chunk(chunk, 0)
+                size += len(chunk)
+
+                for name, writer in writers:
+                    if name in failures:
+                        continue
+
+                    try:
+                        writer.write(chunk)
+                    except Exception as excep:
+                        failures[name] = excep
+
                 chunk = encrypted_file.read(abstract.FileDescriptor.bufferSize)
+    finally:
+        for name, writer in writers:
+            try:
+                writer.close()
+            except Exception as excep:
+                failures.setdefault(name, excep)
 
-            seo.encrypt_chunk(b'', 1)
+    return size, failures
+
+
+def remove_partial_file(path):
+    """
+    Remove the partial output left by a writer failed while processing a file
+
+    :param path: The path of the output file
+    """
+    try:
+        if os.path.exists(path):
+            os.remove(path)
     except Exception as excep:
-        log.err("Unable to create plaintext file %s: %s", dest_path, excep)
+        log.err("Unable to remove the partial file %s: %s", path, excep)
+
 
+def log_file_throughput(filename, size, recipients, start_time):
+    elapsed = max(time.time() - start_time, 0.001)
 
-def process_receiverfiles(state, files_maps):
+    log.debug("Processed file %s for %d recipient(s): %d bytes in %.3f seconds (%.2f MB/s)",
+              filename, recipients, size, elapsed, size / elapsed / (1 << 20))
+
+
+def process_receiverfile(state, receiverfiles_map, sf):
     """
-    Function that process uploaded receiverfiles
+    Function that process an uploaded receiverfile for all its recipients
+
+    The temporary file is read and decrypted only once and each plaintext
+    chunk is streamed to the encryptors of all the recipients.
 
     :param state: A reference to the application state
-    :param files_maps: descriptos of whistleblower files to be processed
+    :param receiverfiles_map: descriptor of the receiverfile to be processed
+    :param sf: The temporary file to be processed
     """
-    for _, receiverfiles_map in files_maps.items():
-        key = receiverfiles_map['crypto_tip_pub_key']
-        filename = receiverfiles_map['filename']
-        filecode = filename.split('.')[0]
-        plaintext_name = "%s.plain" % filecode
-        encrypted_name = "%s.encrypted" % filecode
-        plaintext_path = os.path.abspath(os.path.join(Settings.attachments_path, plaintext_name))
-        encrypted_path = os.path.abspath(os.path.join(Settings.attachments_path, encrypted_name))
+    start_time = time.time()
+
+    key = receiverfiles_map['crypto_tip_pub_key']
+    filename = receiverfiles_map['filename']
+    filecode = filename.split('.')[0]
+    plaintext_name = "%s.plain" % filecode
+    encrypted_name = "%s.encrypted" % filecode
+    plaintext_path = os.path.abspath(os.path.join(Settings.attachments_path, plaintext_name))
+    encrypted_path = os.path.abspath(os.path.join(Settings.attachments_path, encrypted_name))
 
-        receiverfiles_map['filename'] = encrypted_name if key else plaintext_name
+    receiverfiles_map['filename'] = encrypted_name if key else plaintext_name
 
-        sf = state.get_tmp_file_by_name(filename)
+    writers = []
+    pgp_names = {}
+    file_path = encrypted_path if key else plaintext_path
 
-        for rcounter, rf in enumerate(receiverfiles_map['rfiles']):
+    for rcounter, rf in enumerate(receiverfiles_map['rfiles']):
+        if key:
+            rf['filename'] = encrypted_name
+        else:
+            rf['filename'] = plaintext_path
+
+        if not rf['receiver']['pgp_key_public']:
+            receiverfiles_map['pgp_encrypted_for_everybody'] = False
+            continue
+
+        try:
+            pgp_name = "%s.pgp" % generateRandomKey()
+            pgp_path = os.path.abspath(os.path.join(Settings.attachments_path, pgp_name))
+            writers.append((rcounter, PGPStreamWriter(state,
+                                                      rf['receiver']['pgp_key_public'],
+                                                      pgp_path)))
+            pgp_names[rcounter] = pgp_name
+        except Exception as excep:
+            log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
+                    rcounter, rf['receiver']['name'], rf['filename'], excep)
+            rf['status'] = 'unavailable'
+
+    file_failure = None
+    if not receiverfiles_map['pgp_encrypted_for_everybody']:
+        try:
             if key:
-                rf['filename'] = encrypted_name
+                writers.append(('file', EncryptedFileWriter(key, file_path)))
             else:
-                rf['filename'] = plaintext_path
+                writers.append(('file', open(file_path, 'a+b')))
+        except Exception as excep:
+            file_failure = excep
 
-            try:
-                with sf.open('rb') as encrypted_file:
-                    if not rf['receiver']['pgp_key_public']:
-                        receiverfiles_map['pgp_encrypted_for_everybody'] = False
-                        continue
+    pgp_paths = {rcounter: os.path.abspath(os.path.join(Settings.attachments_path, pgp_name))
+                 for rcounter, pgp_name in pgp_names.items()}
 
-                    pgp_name = "%s.pgp" % generateRandomKey()
-                    pgp_path = os.path.abspath(os.path.join(Settings.attachments_path, pgp_name))
-                    encrypt_file_with_pgp(state,
-                                          encrypted_file,
-                                          rf['receiver']['pgp_key_public'],
-                                          rf['receiver']['pgp_key_fingerprint'],
-                                          pgp_path)
-                    rf['filename'] = pgp_name
-                    rf['status'] = 'encrypted'
+    try:
+        size, failures = stream_file(sf, writers)
+    except:
+        for pgp_path in pgp_paths.values():
+            remove_partial_file(pgp_path)
+
+        remove_partial_file(file_path)
+        raise
+
+    if file_failure is not None:
+        failures['file'] = file_failure
+
+    if 'file' in failures:
+        for pgp_path in pgp_paths.values():
+            remove_partial_file(pgp_path)
+
+        remove_partial_file(file_path)
+        raise Exception("Unable to create file %s: %s" % (receiverfiles_map['filename'], failures['file']))
+
+    for rcounter, pgp_name in pgp_names.items():
+        rf = receiverfiles_map['rfiles'][rcounter]
+        if rcounter in failures:
+            remove_partial_file(pgp_paths[rcounter])
+            log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
+                    rcounter, rf['receiver']['name'], rf['filename'], failures[rcounter])
+            rf['status'] = 'unavailable'
+        else:
+            rf['filename'] = pgp_name
+            rf['status'] = 'encrypted'
 
-            except Exception as excep:
-                log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
-                        rcounter, rf['receiver']['name'], rf['filename'], excep)
-                rf['status'] = 'unavailable'
-
-        if not receiverfiles_map['pgp_encrypted_for_everybody']:
-            if key:
-                write_encrypted_file(key, sf, encrypted_path)
-            else:
-                write_plaintext_file(sf, plaintext_path)
+    log_file_throughput(filename, size, len(receiverfiles_map['rfiles']), start_time)
 
 
-def process_whistleblowerfiles(state, files_maps):
+def process_whistleblowerfile(state, whistleblowerfiles_map, sf):
     """
-    Function that process uploaded whistleblowerfiles
+    Function that process an uploaded whistleblowerfile
 
     :param state: A reference to the application state
-    :param files_maps: descriptos of whistleblower files to be processed
+    :param whistleblowerfiles_map: descriptor of the whistleblowerfile to be processed
+    :param sf: The temporary file to be processed
     """
-    for _, whistleblowerfiles_map in files_maps.items():
-        key = whistleblowerfiles_map['crypto_tip_pub_key']
-        filename = whistleblowerfiles_map['filename']
-        filecode = filename.split('.')[0]
+    start_time = time.time()
+
+    key = whistleblowerfiles_map['crypto_tip_pub_key']
+    filename = whistleblowerfiles_map['filename']
+    filecode = filename.split('.')[0]
 
-        sf = state.get_tmp_file_by_name(filename)
+    whistleblowerfiles_map['filename'] = "%s.%s" % (filecode, 'encrypted' if key else 'plain')
+    file_path = os.path.abspath(os.path.join(Settings.attachments_path, whistleblowerfiles_map['filename']))
 
+    try:
         if key:
-            whistleblowerfiles_map['filename'] = "%s.encrypted" % filecode
-            write_encrypted_file(key, sf, os.path.abspath(os.path.join(Settings.attachments_path, whistleblowerfiles_map['filename'])))
+            writer = EncryptedFileWriter(key, file_path)
         else:
-            whistleblowerfiles_map['filename'] = "%s.plain" % filecode
-            write_plaintext_file(sf, os.path.abspath(os.path.join(Settings.attachments_path, whistleblowerfiles_map['filename'])))
+            writer = open(file_path, 'a+b')
+
+        size, failures = stream_file(sf, [('file', writer)])
+        if failures:
+            raise failures['file']
+    except Exception as excep:
+        remove_partial_file(file_path)
+        raise Exception("Unable to create file %s: %s" % (whistleblowerfiles_map['filename'], excep))
+
+    log_file_throughput(filename, size, 1, start_time)
 
 
 @transact
@@ -221,11 +355,40 @@ class Delivery(LoopingJob):
         """
         This function creates receiver files
         """
-        receiverfiles_maps, whistleblowerfiles_maps = yield file_delivery_planning()
+        receiverfiles_maps, whistleblowerfiles_maps, itip_ids = yield file_delivery_planning()
+
+        for itip_id in itip_ids:
+            self.state.schedule_notification(itip_id)
+
         if receiverfiles_maps:
-            process_receiverfiles(self.state, receiverfiles_maps)
+            yield self.process_files(process_receiverfile, receiverfiles_maps)
             yield update_receiverfiles(receiverfiles_maps)
 
         if whistleblowerfiles_maps:
-            process_whistleblowerfiles(self.state, whistleblowerfiles_maps)
+            yield self.process_files(process_whistleblowerfile, whistleblowerfiles_maps)
             yield update_whistleblowerfiles(whistleblowerfiles_maps)
+
+    def process_files(self, function, files_maps):
+        """
+        Process the files concurrently on the delivery thread pool
+
+        The parallelism is limited by the size of the thread pool.
+        """
+        ids = list(files_maps)
+        dl = []
+
+        for id in ids:
+            sf = self.state.get_tmp_file_by_name(files_maps[id]['filename'])
+            dl.append(deferToThreadPool(reactor, self.state.delivery_tp, function, self.state, files_maps[id], sf))
+
+        return DeferredList(dl, consumeErrors=True).addCallback(self.discard_failures, ids, files_maps)
+
+    def discard_failures(self, results, ids, files_maps):
+        """
+        Remove from the maps the files whose processing failed so that
+        their partially updated descriptors are not stored on the database
+        """
+        for id, (success, result) in zip(ids, results):
+            if not success:
+                log.err("Unable to process file: %s", result.getErrorMessage())
+                del files_maps[id]
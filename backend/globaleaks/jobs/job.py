@@ -21,6 +21,10 @@ class Job(task.LoopingCall):
     active = None
     last_executions = []
 
+    # Optional description of the progress of the current or last
+    # execution reported by the jobs performing long operations
+    progress = None
+
     def __init__(self):
         self.name = self.__class__.__name__
 
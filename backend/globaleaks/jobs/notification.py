@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # Implement the notification of new submissions
-import copy
+import time
+from datetime import timedelta
 
 from twisted.internet import defer
 
@@ -13,10 +14,10 @@ from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serializ
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.job import LoopingJob
 from globaleaks.orm import transact
+from globaleaks.settings import Settings
 from globaleaks.utils.log import log
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.utility import datetime_now
 from globaleaks.utils.templating import Templating
-from globaleaks.utils.utility import deferred_sleep
 
 
 trigger_template_map = {
@@ -43,6 +44,7 @@ class MailGenerator(object):
     def __init__(self, state):
         self.state = state
         self.cache = {}
+        self.pgp_mails = {}
 
     def serialize_config(self, session, key, tid, language):
         cache_key = gen_cache_key(key, tid, language)
@@ -53,6 +55,8 @@ class MailGenerator(object):
                 cache_obj = db_admin_serialize_node(session, tid, language)
             elif key == 'notification':
                 cache_obj = db_get_notification(session, tid, language)
+            elif key == 'submission_statuses':
+                cache_obj = db_get_submission_statuses(session, tid, language)
 
             self.cache[cache_key] = cache_obj
 
@@ -118,6 +122,9 @@ class MailGenerator(object):
         self.process_mail_creation(session, tid, data)
 
     def process_Comment(self, session, comment, data):
+        tid = None
+        recipients_data = []
+
         for user, context, rtip in session.query(models.User, models.Context, models.ReceiverTip) \
                                           .filter(models.User.id == models.ReceiverTip.receiver_id,
                                                   models.ReceiverTip.internaltip_id == comment.internaltip_id,
@@ -127,13 +134,15 @@ class MailGenerator(object):
                                                   models.ReceiverTip.receiver_id != comment.author_id):
             tid = context.tid
 
-            umsg = copy.deepcopy(data)
-            umsg['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
-            umsg['tip'] = self.serialize_obj(session, 'tip', rtip, tid, user.language)
-            umsg['context'] = self.serialize_obj(session, 'context', context, tid, user.language)
-            umsg['comment'] = self.serialize_obj(session, 'comment', comment, tid, user.language)
+            recipients_data.append({
+                'user': self.serialize_obj(session, 'user', user, tid, user.language),
+                'tip': self.serialize_obj(session, 'tip', rtip, tid, user.language),
+                'context': self.serialize_obj(session, 'context', context, tid, user.language),
+                'comment': self.serialize_obj(session, 'comment', comment, tid, user.language)
+            })
 
-            self.process_mail_creation(session, tid, umsg)
+        if recipients_data:
+            self.process_mails_creation(session, tid, data, recipients_data)
 
     def process_ReceiverFile(self, session, rfile, data):
         user, context, rtip, ifile = session.query(models.User, models.Context, models.ReceiverTip, models.InternalFile) \
@@ -155,68 +164,119 @@ class MailGenerator(object):
         self.process_mail_creation(session, tid, data)
 
     def process_mail_creation(self, session, tid, data):
-        user_id = data['user']['id']
-        language = data['user']['language']
+        self.process_mails_creation(session, tid, {'type': data['type']}, [data])
+
+    def process_mails_creation(self, session, tid, data, recipients_data):
+        """
+        Render and spool the mails of an event for its recipients
+
+        :param session: An ORM session
+        :param tid: A tenant ID
+        :param data: The data of the event shared by all the recipients
+        :param recipients_data: A list of dicts with the data specific to each recipient
+        """
+        for x in recipients_data:
+            # Do not spool emails if the receiver has disabled notifications
+            if not x['user']['notification'] or not x['tip']['enable_notifications']:
+                log.debug("Discarding emails for %s due to receiver's preference.", x['user']['id'])
+                continue
+
+            language = x['user']['language']
+
+            x['node'] = self.serialize_config(session, 'node', tid, language)
+
+            x['submission_statuses'] = self.serialize_config(session, 'submission_statuses', tid, language)
+
+            if x['node']['mode'] == 'default':
+                x['notification'] = self.serialize_config(session, 'notification', tid, language)
+            else:
+                x['notification'] = self.serialize_config(session, 'notification', 1, language)
+
+            subject, body = Templating().get_mail_subject_and_body(dict(data, **x))
+
+            mail = models.Mail({
+                'address': x['user']['mail_address'],
+                'subject': subject,
+                'body': body,
+                'tid': tid,
+            })
+
+            # If the receiver has encryption enabled the mail body is encrypted
+            # at the end of the generation together with the other mails
+            # directed to the same key
+            if x['user']['pgp_key_public']:
+                self.pgp_mails.setdefault(x['user']['pgp_key_public'], []).append(mail)
+            else:
+                session.add(mail)
+
+    def encrypt_mails(self, session):
+        """
+        Encrypt the mails of the receivers with PGP encryption enabled
+
+        Each mail is encrypted from memory so that a failure does not
+        discard the other mails directed to the same key
+        """
+        for key, mails in self.pgp_mails.items():
+            for mail in mails:
+                try:
+                    mail.body = self.state.pgp_keyring.encrypt_message(key, mail.body)
+                except Exception as e:
+                    log.err("Unable to encrypt mail for %s: %s", mail.address, e)
+                    continue
 
-        # Do not spool emails if the receiver has disabled notifications
-        if not data['user']['notification'] or not data['tip']['enable_notifications']:
-            log.debug("Discarding emails for %s due to receiver's preference.", user_id)
-            return
+                session.add(mail)
 
-        data['node'] = self.serialize_config(session, 'node', tid, language)
+        self.pgp_mails = {}
 
-        data['submission_statuses'] = db_get_submission_statuses(session, tid, language)
+    def filter_by_itips(self, session, model, itips):
+        """
+        Return the filter selecting the elements of a model related to a set of tips
+        """
+        if model in (models.ReceiverTip, models.Comment):
+            return model.internaltip_id.in_(itips)
 
-        if data['node']['mode'] == 'default':
-            data['notification'] = self.serialize_config(session, 'notification', tid, language)
-        else:
-            data['notification'] = self.serialize_config(session, 'notification', 1, language)
+        rtips = session.query(models.ReceiverTip.id).filter(models.ReceiverTip.internaltip_id.in_(itips)).subquery()
 
-        subject, body = Templating().get_mail_subject_and_body(data)
+        return model.receivertip_id.in_(rtips)
 
-        # If the receiver has encryption enabled encrypt the mail body
-        if data['user']['pgp_key_public']:
-            pgpctx = PGPContext(self.state.settings.tmp_path)
-            fingerprint = pgpctx.load_key(data['user']['pgp_key_public'])['fingerprint']
-            body = pgpctx.encrypt_message(fingerprint, body)
+    @transact
+    def generate(self, session, itip_ids=None):
+        """
+        Generate the mails for the new elements
 
-        session.add(models.Mail({
-            'address': data['user']['mail_address'],
-            'subject': subject,
-            'body': body,
-            'tid': tid,
-        }))
+        :param itip_ids: The ids of the tips to be looked up; None for a full scan
+        """
+        full_scan = itip_ids is None
+
+        self.pgp_mails = {}
 
-    @transact
-    def generate(self, session):
         silent_tids = []
         for tid, cache_item in self.state.tenant_cache.items():
             if cache_item.notification and cache_item.notification.disable_receiver_notification_emails:
                 silent_tids.append(tid)
 
-        if silent_tids:
-            for x in session.query(models.ReceiverTip).filter(models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                              models.InternalTip.tid.in_(silent_tids)):
-                x.new = False
+        itips = session.query(models.InternalTip.id)
+        if not full_scan:
+            itips = itips.filter(models.InternalTip.id.in_(list(itip_ids)))
 
-            for x in session.query(models.Comment).filter(models.Comment.internaltip_id == models.InternalTip.id,
-                                                          models.InternalTip.tid.in_(silent_tids)):
-                x.new = False
+        if silent_tids:
+            silent_itips = itips.filter(models.InternalTip.tid.in_(silent_tids)).subquery()
 
-            for x in session.query(models.Message).filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                                                          models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                          models.InternalTip.tid.in_(silent_tids)):
-                x.new = False
+            for model in trigger_model_map.values():
+                session.query(model).filter(model.new.is_(True),
+                                            self.filter_by_itips(session, model, silent_itips)) \
+                                    .update({'new': False}, synchronize_session=False)
 
-            for x in session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == models.ReceiverTip.id,
-                                                               models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                               models.InternalTip.tid.in_(silent_tids)):
-                x.new = False
+        itips = itips.subquery()
 
         for trigger in ['ReceiverTip', 'Comment', 'Message', 'ReceiverFile']:
             model = trigger_model_map[trigger]
 
-            for element in session.query(model).filter(model.new.is_(True)):
+            elements = session.query(model).filter(model.new.is_(True))
+            if not full_scan:
+                elements = elements.filter(self.filter_by_itips(session, model, itips))
+
+            for element in elements:
                 data = {
                     'type': trigger_template_map[trigger]
                 }
@@ -228,21 +288,49 @@ class MailGenerator(object):
                 finally:
                     element.new = False
 
+        self.encrypt_mails(session)
+
 
 @transact
-def get_mails_from_the_pool(session):
+def claim_mails(session, tids, limit, interval, backoff_limit):
     """
-    Fetch the email to be sent.
-
-    Email are spooled every 5 seconds and mailing attepts last 5 days.
+    Claim the mails due for delivery
+
+    The claimed mails are postponed with an exponential backoff so that
+    the mails whose delivery fails are retried less and less frequently;
+    the mails successfully sent are deleted by the caller, while the
+    mails not delivered within mail_timetolive are discarded.
+    The due mails are looked up with a single query on the index over
+    (tid, next_attempt_at) so that the cost of a cycle is proportional
+    to the mails being claimed and not to the size of the queue.
+
+    :param tids: The ids of the tenants whose mails could be claimed
+    :param limit: The maximum number of mails claimed
+    :param interval: The delay in seconds applied to the first retry
+    :param backoff_limit: The maximum delay in seconds between two retries
+    :return: The list of the claimed mails
     """
-    session.query(models.Mail).filter(models.Mail.processing_attempts > 86400).delete(synchronize_session=False)
+    now = datetime_now()
 
-    session.query(models.Mail).update({'processing_attempts': models.Mail.processing_attempts + 1})
+    expired = session.query(models.Mail) \
+                     .filter(models.Mail.creation_date < now - timedelta(seconds=Settings.mail_timetolive)) \
+                     .delete(synchronize_session=False)
+    if expired:
+        log.err("Discarding %d mails expired without being delivered", expired)
+
+    if not tids:
+        return []
 
     ret = []
+    for mail in session.query(models.Mail) \
+                       .filter(models.Mail.tid.in_(tids),
+                               models.Mail.next_attempt_at <= now) \
+                       .order_by(models.Mail.next_attempt_at) \
+                       .limit(limit):
+        delay = min(interval * (2 ** mail.attempts), backoff_limit)
+        mail.attempts += 1
+        mail.next_attempt_at = now + timedelta(seconds=delay)
 
-    for mail in session.query(models.Mail).order_by(models.Mail.creation_date):
         ret.append({
             'id': mail.id,
             'address': mail.address,
@@ -258,18 +346,93 @@ class Notification(LoopingJob):
     interval = 5
     monitor_interval = 3 * 60
 
+    # interval in seconds between the full scans performed to recover
+    # the elements not signaled on the notification queue
+    full_scan_interval = 3600
+
+    def __init__(self):
+        self.smtp_backoff = {}
+        self.last_full_scan = 0
+
+        LoopingJob.__init__(self)
+
+    def is_smtp_server_available(self, server):
+        return self.smtp_backoff.get(server, (0, 0))[1] <= time.time()
+
+    def update_smtp_server_backoff(self, server, error):
+        if error is None:
+            self.smtp_backoff.pop(server, None)
+            return
+
+        failures = self.smtp_backoff.get(server, (0, 0))[0] + 1
+        delay = min(self.interval * (2 ** failures), self.state.settings.smtp_backoff_limit)
+
+        log.err("SMTP server %s:%d is failing; delaying deliveries for %d seconds", server[0], server[1], delay)
+
+        self.smtp_backoff[server] = (failures, time.time() + delay)
+
+    @defer.inlineCallbacks
+    def spool_server_emails(self, server, smtp_tids_mails):
+        """
+        Send the mails directed to the same SMTP server
+
+        The mails of the tenants sharing the same SMTP settings are sent
+        together, while the groups of mails using different settings are
+        sent one after the other, so that no more than smtp_concurrency
+        connections are opened to the server.
+
+        :param server: The tuple (host, port) of the SMTP server
+        :param smtp_tids_mails: A dict mapping the id of the tenant whose SMTP settings are used to its mails
+        """
+        for smtp_tid, mails in smtp_tids_mails.items():
+            sent, error = yield self.state.sendmails(smtp_tid, mails, self.state.settings.smtp_concurrency)
+
+            self.update_smtp_server_backoff(server, error)
+
+            if sent:
+                yield models.delete(models.Mail, models.Mail.id.in_(sent))
+
     @defer.inlineCallbacks
     def spool_emails(self):
-        mails = yield get_mails_from_the_pool()
+        """
+        Send the mails of each SMTP server over concurrent and reused SMTP connections
+
+        Only the due mails are claimed, up to notification_limit for each cycle,
+        and the tenants whose SMTP server is failing are skipped
+        until the expiration of an exponential backoff.
+        """
+        tids = {}
+        for tid in self.state.tenant_cache:
+            server = self.state.get_smtp_server(tid)
+            if self.is_smtp_server_available(server):
+                tids[tid] = server
+
+        mails = yield claim_mails(list(tids),
+                                  self.state.settings.notification_limit,
+                                  self.interval,
+                                  self.state.settings.smtp_backoff_limit)
+
+        server_mails = {}
         for mail in mails:
-            sent = yield self.state.sendmail(mail['tid'], mail['address'], mail['subject'], mail['body'])
-            if sent:
-                yield models.delete(models.Mail, models.Mail.id == mail['id'])
+            smtp_tid = self.state.get_smtp_tid(mail['tid'])
+            server_mails.setdefault(tids[mail['tid']], {}).setdefault(smtp_tid, []).append(mail)
+
+        dl = []
+        for server, smtp_tids_mails in server_mails.items():
+            dl.append(self.spool_server_emails(server, smtp_tids_mails))
 
-            yield deferred_sleep(1)
+        yield defer.DeferredList(dl, fireOnOneErrback=True, consumeErrors=True)
 
     @defer.inlineCallbacks
     def operation(self):
-        yield MailGenerator(self.state).generate()
+        itip_ids = set()
+        while self.state.notification_queue:
+            itip_ids.add(self.state.notification_queue.popleft())
+
+        if time.time() - self.last_full_scan > self.full_scan_interval:
+            self.last_full_scan = time.time()
+            yield MailGenerator(self.state).generate()
+        elif itip_ids:
+            yield MailGenerator(self.state).generate(itip_ids)
 
         yield self.spool_emails()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+# Implementation of the secure deletion of the files marked for deletion
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs.job import LoopingJob
+from globaleaks.orm import transact, transact_ro
+
+__all__ = ['SecureDeletion']
+
+
+@transact_ro
+def get_files_to_secure_delete(session, limit):
+    return list(set(x[0] for x in session.query(models.SecureFileDelete.filepath).limit(limit)))
+
+
+@transact
+def commit_files_deletion(session, filepaths):
+    session.query(models.SecureFileDelete).filter(models.SecureFileDelete.filepath.in_(filepaths)).delete(synchronize_session=False)
+
+
+class SecureDeletion(LoopingJob):
+    """
+    Job draining the queue of the files marked for secure deletion
+
+    The files are overwritten in batches on the secure deletion worker and
+    are removed from the queue only once deleted, so that the deletions
+    interrupted by a restart are resumed; the throughput of the worker is
+    reported as the progress of the job.
+    """
+    interval = 60
+    monitor_interval = 10 * 60
+
+    # Maximum number of files deleted by each batch
+    batch_size = 100
+
+    @inlineCallbacks
+    def operation(self):
+        while True:
+            filepaths = yield get_files_to_secure_delete(self.batch_size)
+            if not filepaths:
+                break
+
+            yield self.state.secure_deletion.delete(filepaths)
+
+            yield commit_files_deletion(filepaths)
+
+            self.progress = self.state.secure_deletion.get_stats()
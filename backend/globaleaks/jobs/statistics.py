@@ -4,7 +4,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.jobs.job import HourlyJob
 from globaleaks.models import Stats
-from globaleaks.orm import transact
+from globaleaks.orm import transact_batch
 from globaleaks.utils.log import log
 from globaleaks.utils.utility import datetime_now
 
@@ -13,15 +13,12 @@ def get_statistics(state):
     stats = {}
 
     for tid in state.tenant_state:
-        stats[tid] = {}
-        for e in state.tenant_state[tid].EventQ:
-            stats[tid].setdefault(e.event_type, 0)
-            stats[tid][e.event_type] += 1
+        stats[tid] = state.tenant_state[tid].EventCounters.collect()
 
     return stats
 
 
-@transact
+@transact_batch
 def save_statistics(session, start, stats):
     for tid in stats:
         if not stats[tid]:
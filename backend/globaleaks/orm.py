@@ -1,20 +1,32 @@
 # -*- coding: utf-8
-import random
-import time
+import queue
+import threading
 import warnings
 
+from functools import partial
+
 from sqlalchemy import create_engine, event
-from sqlalchemy.exc import OperationalError, SAWarning
+from sqlalchemy.exc import SAWarning
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
-from twisted.internet import reactor
+from twisted.internet import defer, reactor
 from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+
+from globaleaks.utils.log import log
 
 _DEBUG = False
 _DB_URI = 'sqlite:'
 _THREAD_POOL = None
+_WRITE_SCHEDULER = None
+
+# Long lived engines used by the transact decorators; these are lazily
+# created and disposed every time the database uri is changed.
+_WRITER_ENGINE = None
+_READER_ENGINE = None
 
-TRANSACTION_RETRIES = 20
+READERS_POOL_SIZE = 8
 
 
 warnings.filterwarnings('ignore', '.', SAWarning)
@@ -27,6 +39,7 @@ def make_db_uri(db_file):
 def set_db_uri(db_uri):
     global _DB_URI
     _DB_URI = db_uri
+    dispose_engines()
 
 
 def get_db_uri():
@@ -47,6 +60,81 @@ def get_engine(db_uri=None, foreign_keys=True):
     return engine
 
 
+def get_pooled_engine(read_only=False):
+    """
+    Create an engine keeping a pool of long lived connections in WAL mode.
+
+    The writer engine keeps a single connection used by serialized write
+    transactions while the reader engine keeps a pool of read-only
+    connections that thanks to WAL never block on the writer.
+
+    Write transactions are started with BEGIN IMMEDIATE so that the
+    database lock is acquired when the transaction starts rather than
+    when its first write fails to upgrade a read lock; a writer waiting
+    for the lock is handled by the sqlite busy timeout.
+    """
+    if read_only:
+        pool_size, max_overflow = READERS_POOL_SIZE, 0
+    else:
+        pool_size, max_overflow = 1, 0
+
+    engine = create_engine(get_db_uri(),
+                           connect_args={'timeout': 30, 'check_same_thread': False},
+                           poolclass=QueuePool,
+                           pool_size=pool_size,
+                           max_overflow=max_overflow,
+                           pool_timeout=60,
+                           echo=_DEBUG)
+
+    @event.listens_for(engine, "connect")
+    def do_connect(conn, connection_record):
+        conn.execute('pragma foreign_keys=ON')
+        conn.execute('pragma journal_mode=WAL')
+
+        if read_only:
+            conn.execute('pragma query_only=ON')
+
+        # Disable pysqlite's emitting of the BEGIN statement so that
+        # it can be issued at transaction start (see do_begin)
+        conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        # Ensure every transaction works on a consistent snapshot
+        # and that savepoints are supported
+        conn.execute('BEGIN' if read_only else 'BEGIN IMMEDIATE')
+
+    return engine
+
+
+def get_writer_engine():
+    global _WRITER_ENGINE
+
+    if _WRITER_ENGINE is None:
+        _WRITER_ENGINE = get_pooled_engine(read_only=False)
+
+    return _WRITER_ENGINE
+
+
+def get_reader_engine():
+    global _READER_ENGINE
+
+    if _READER_ENGINE is None:
+        _READER_ENGINE = get_pooled_engine(read_only=True)
+
+    return _READER_ENGINE
+
+
+def dispose_engines():
+    global _WRITER_ENGINE, _READER_ENGINE
+
+    for engine in [_WRITER_ENGINE, _READER_ENGINE]:
+        if engine is not None:
+            engine.dispose()
+
+    _WRITER_ENGINE = _READER_ENGINE = None
+
+
 def get_session(db_uri=None, foreign_keys=True):
     return sessionmaker(bind=get_engine(db_uri, foreign_keys))()
 
@@ -69,6 +157,152 @@ def get_thread_pool():
     return _THREAD_POOL
 
 
+def set_write_scheduler(write_scheduler):
+    global _WRITE_SCHEDULER
+    _WRITE_SCHEDULER = write_scheduler
+
+
+def get_write_scheduler():
+    return _WRITE_SCHEDULER
+
+
+class WriteScheduler(object):
+    """
+    Scheduler funneling write transactions into a single dedicated thread.
+
+    Transactions queued at the same time are executed in a single database
+    transaction (group commit); each of them runs inside its own savepoint
+    so that a failure only rolls back the changes of the failing call.
+    """
+    def __init__(self, max_batch_size=64):
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue()
+        self.thread = None
+
+        self.batches = 0
+        self.transactions = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop, name='WriteScheduler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def schedule(self, function, *args, **kwargs):
+        """
+        Schedule a write transaction
+
+        :return: A deferred fired with the result of the transaction
+        """
+        d = defer.Deferred()
+        self.queue.put((d, function, args, kwargs))
+        return d
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    self.queue.put(None)
+                    break
+
+                batch.append(item)
+
+            try:
+                results = self.execute(batch)
+            except:
+                failure = Failure()
+                results = [(x[0], False, failure) for x in batch]
+
+            for d, success, result in results:
+                try:
+                    reactor.callFromThread(self.fire, d, success, result)
+                except Exception as e:
+                    log.err("Unable to fire the result of a write transaction: %s", e)
+
+    def fire(self, d, success, result):
+        if success:
+            d.callback(result)
+        else:
+            d.errback(result)
+
+    def execute(self, batch):
+        """
+        Execute a batch of transactions committing them at once
+
+        If the batch fails as a whole, e.g. because its commit fails,
+        each transaction is executed again in a transaction of its own
+        so that a single failure does not fail the whole batch.
+
+        :param batch: A list of (deferred, function, args, kwargs)
+        :return: A list of (deferred, success, result)
+        """
+        results, success = self.execute_batch(batch)
+
+        if not success and len(batch) > 1:
+            results = []
+            for item in batch:
+                results.extend(self.execute_batch([item])[0])
+
+        return results
+
+    def execute_batch(self, batch):
+        """
+        Execute a batch of transactions in a single database transaction
+
+        :param batch: A list of (deferred, function, args, kwargs)
+        :return: A tuple with the list of (deferred, success, result)
+                 and a boolean telling if the batch was committed
+        """
+        results = []
+        session = None
+        success = True
+
+        try:
+            session = sessionmaker(bind=get_writer_engine())()
+
+            for d, function, args, kwargs in batch:
+                savepoint = session.begin_nested()
+                try:
+                    result = function(session, *args, **kwargs)
+                    savepoint.commit()
+                    results.append((d, True, result))
+                except:
+                    savepoint.rollback()
+                    results.append((d, False, Failure()))
+
+            session.commit()
+        except:
+            if session is not None:
+                session.rollback()
+
+            failure = Failure()
+            results = [(x[0], False, failure) for x in batch]
+            success = False
+        finally:
+            if session is not None:
+                session.close()
+
+        self.batches += 1
+        self.transactions += len(batch)
+
+        return results, success
+
+
 class transact(object):
     """
     Class decorator for managing transactions.
@@ -92,47 +326,80 @@ class transact(object):
                                  *args,
                                  **kwargs)
 
+    def get_session(self):
+        return sessionmaker(bind=get_writer_engine())()
+
     def _wrap(self, function, *args, **kwargs):
         """
         Wrap provided function calling it inside a thread and
         passing the ORM session to it.
+
+        Write transactions are serialized on the writer connection that
+        is held only from the first statement of the transaction to its
+        commit.
         """
-        session = get_session()
-        retries = 0
+        session = self.get_session()
 
         try:
-            while True:
-                try:
-                    if self.instance:
-                        result = function(self.instance, session, *args, **kwargs)
-                    else:
-                        result = function(session, *args, **kwargs)
+            if self.instance:
+                result = function(self.instance, session, *args, **kwargs)
+            else:
+                result = function(session, *args, **kwargs)
+
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        else:
+            return result
+        finally:
+            session.close()
+
 
-                    session.commit()
-                except OperationalError as e:
-                    session.rollback()
+class transact_sync(transact):
+    def run(self, function, *args, **kwargs):
+        return function(*args, **kwargs)
 
-                    if "database is locked" not in str(e):
-                        raise
 
-                    retries += 1
+class transact_ro(transact):
+    """
+    Class decorator for managing read-only transactions.
 
-                    if retries >= TRANSACTION_RETRIES:
-                        raise Exception("Transaction failed with too many retries")
+    Read-only transactions are executed on a pool of WAL readers
+    and are never blocked by the write transactions.
+    """
+    def get_session(self):
+        return sessionmaker(bind=get_reader_engine())()
 
-                    time.sleep(0.2 * random.uniform(1, 2 ** retries))
-                except:
-                    session.rollback()
-                    raise
-                else:
-                    return result
+    def _wrap(self, function, *args, **kwargs):
+        session = self.get_session()
+
+        try:
+            if self.instance:
+                return function(self.instance, session, *args, **kwargs)
+            else:
+                return function(session, *args, **kwargs)
         finally:
+            session.rollback()
             session.close()
 
 
-class transact_sync(transact):
-    def run(self, function, *args, **kwargs):
-        return function(*args, **kwargs)
+class transact_batch(transact):
+    """
+    Class decorator for managing small independent write transactions.
+
+    When a write scheduler is enabled the transactions are queued to it
+    and grouped in a single commit; otherwise they behave like @transact.
+    """
+    def __call__(self, *args, **kwargs):
+        write_scheduler = get_write_scheduler()
+        if write_scheduler is None:
+            return transact.__call__(self, *args, **kwargs)
+
+        if self.instance:
+            return write_scheduler.schedule(partial(self.method, self.instance), *args, **kwargs)
+
+        return write_scheduler.schedule(self.method, *args, **kwargs)
 
 
 @transact
@@ -49,6 +49,7 @@ from globaleaks.handlers.admin import tenant as admin_tenant
 from globaleaks.handlers.admin import user as admin_user
 from globaleaks.handlers.admin import submission_statuses as admin_submission_statuses
 from globaleaks.rest import decorators, requests, errors
+from globaleaks.rest.dispatcher import RouteDispatcher
 from globaleaks.settings import Settings
 from globaleaks.state import State, extract_exception_traceback_and_schedule_email
 from globaleaks.utils.json import JSONEncoder
@@ -141,6 +142,7 @@ api_spec = [
     (r'/api/admin/auditlog/stats/(\d+)', admin_auditlog.StatsCollection),
     (r'/api/admin/auditlog/tips', admin_auditlog.TipsCollection),
     (r'/api/admin/auditlog/jobs', admin_auditlog.JobsTiming),
+    (r'/api/admin/auditlog/kdf', admin_auditlog.KDFMetrics),
     (r'/api/admin/l10n/(' + '|'.join(LANGUAGES_SUPPORTED_CODES) + ')', admin_l10n.AdminL10NHandler),
     (r'/api/admin/files/(logo|favicon|css|script)', admin_file.FileInstance),
     (r'/api/admin/config', admin_operation.AdminOperationHandler),
@@ -211,6 +213,8 @@ class APIResourceWrapper(Resource):
 
             self._registry.append((re.compile(pattern), handler, args))
 
+        self._dispatcher = RouteDispatcher(self._registry)
+
     def should_redirect_https(self, request):
         if State.tenant_cache[request.tid].https_enabled and \
            not request.isSecure() and \
@@ -365,19 +369,13 @@ class APIResourceWrapper(Resource):
             request.redirect(State.tenant_cache[request.tid]['redirects'][request_path])
             return b''
 
-        match = None
-        for regexp, handler, args in self._registry:
-            try:
-                match = regexp.match(request_path)
-            except UnicodeDecodeError:
-                match = None
-            if match:
-                break
-
+        match = self._dispatcher.match(request_path)
         if match is None:
             self.handle_exception(errors.ResourceNotFound(), request)
             return b''
 
+        handler, args, groups = match
+
         method = request.method.lower().decode()
 
         if method == 'head':
@@ -388,7 +386,6 @@ class APIResourceWrapper(Resource):
             return b''
 
         f = getattr(handler, method)
-        groups = match.groups()
 
         self.handler = handler(State, request, **args)
 
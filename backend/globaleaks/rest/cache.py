@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 import gzip
+import hashlib
 import io
+from collections import OrderedDict
+
+from globaleaks.settings import Settings
+
 
 def gzipdata(data):
     if isinstance(data, str):
@@ -14,35 +19,108 @@ def gzipdata(data):
     return fgz.getvalue()
 
 
+def etag(data):
+    """
+    Compute the strong entity tag of a cached representation
+
+    :param data: The bytes of the representation
+    :return: The quoted entity tag
+    """
+    return ('"%s"' % hashlib.sha256(data).hexdigest()[:32]).encode()
+
+
+def etag_match(if_none_match, tag):
+    """
+    Check an If-None-Match request header against an entity tag
+
+    :param if_none_match: The value of the If-None-Match header
+    :param tag: The entity tag of the current representation
+    :return: A boolean
+    """
+    if not if_none_match:
+        return False
+
+    for x in if_none_match.split(b','):
+        x = x.strip()
+        if x == b'*' or x == tag or x == b'W/' + tag:
+            return True
+
+    return False
+
+
 class Cache(object):
-    memory_cache_dict = {}
+    """
+    Cache of the gzipped representations of the cacheable resources
+
+    Entries are kept in LRU order within a total bound in bytes and are
+    tagged with the tenants whose configuration they depend on so that
+    the invalidation related to a tenant drops only the affected entries.
+    """
+    memory_cache_dict = OrderedDict()
+    memory_cache_tags = {}
+    memory_cache_dependencies = {}
+    memory_cache_size = 0
 
     @classmethod
     def get(cls, tid, resource, language):
-        if tid in cls.memory_cache_dict \
-           and resource in cls.memory_cache_dict[tid] \
-           and language in cls.memory_cache_dict[tid][resource]:
-            return cls.memory_cache_dict[tid][resource][language]
+        key = (tid, resource, language)
+
+        entry = cls.memory_cache_dict.get(key)
+        if entry is not None:
+            cls.memory_cache_dict.move_to_end(key)
+
+        return entry
 
     @classmethod
-    def set(cls, tid, resource, language, content_type, data):
+    def set(cls, tid, resource, language, content_type, data, dependencies=()):
         data = gzipdata(data)
 
-        if tid not in Cache.memory_cache_dict:
-            cls.memory_cache_dict[tid] = {}
+        key = (tid, resource, language)
 
-        if resource not in Cache.memory_cache_dict[tid]:
-            cls.memory_cache_dict[tid][resource] = {}
+        cls.remove(key)
 
-        entry = (content_type, data)
+        entry = (content_type, data, etag(data))
 
-        cls.memory_cache_dict[tid][resource][language] = entry
+        cls.memory_cache_dict[key] = entry
+        cls.memory_cache_size += len(data)
+
+        dependencies = set(dependencies) | {tid}
+        cls.memory_cache_dependencies[key] = dependencies
+        for x in dependencies:
+            cls.memory_cache_tags.setdefault(x, set()).add(key)
+
+        while cls.memory_cache_size > Settings.api_cache_size and len(cls.memory_cache_dict) > 1:
+            cls.remove(next(iter(cls.memory_cache_dict)))
 
         return entry
 
     @classmethod
-    def invalidate(cls, tid=1):
-        if tid == 1:
+    def remove(cls, key):
+        entry = cls.memory_cache_dict.pop(key, None)
+        if entry is None:
+            return
+
+        cls.memory_cache_size -= len(entry[1])
+
+        for x in cls.memory_cache_dependencies.pop(key):
+            keys = cls.memory_cache_tags[x]
+            keys.discard(key)
+            if not keys:
+                del cls.memory_cache_tags[x]
+
+    @classmethod
+    def invalidate(cls, tid=None):
+        """
+        Invalidate the cached entries
+
+        :param tid: The tenant whose configuration changed; None drops every entry
+        """
+        if tid is None:
             cls.memory_cache_dict.clear()
-        else:
-            cls.memory_cache_dict.pop(tid, None)
+            cls.memory_cache_tags.clear()
+            cls.memory_cache_dependencies.clear()
+            cls.memory_cache_size = 0
+            return
+
+        for key in list(cls.memory_cache_tags.get(tid, ())):
+            cls.remove(key)
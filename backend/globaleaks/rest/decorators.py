@@ -4,7 +4,7 @@ import json
 from twisted.internet import defer
 
 from globaleaks.rest import errors
-from globaleaks.rest.cache import Cache
+from globaleaks.rest.cache import Cache, etag_match
 from globaleaks.state import State
 from globaleaks.utils.json import JSONEncoder
 
@@ -24,6 +24,34 @@ def decorator_authentication(f, roles):
     return wrapper
 
 
+def get_cache_dependencies(handler):
+    """
+    Return the tenants whose configuration a cached resource depends on
+
+    The resources of every tenant depend on the root tenant configuration,
+    that holds the versions, the fallback language and the tenants' mode
+    and activation.
+    """
+    return {handler.request.tid, 1}
+
+
+def serve_cache_entry(handler, entry):
+    handler.request.setHeader(b'ETag', entry[2])
+
+    if handler.check_roles == 'none':
+        # Public resources are allowed to be stored by the client for revalidation
+        handler.request.setHeader(b'Cache-control', b'no-cache, must-revalidate')
+
+    if etag_match(handler.request.getHeader(b'If-None-Match'), entry[2]):
+        handler.request.setResponseCode(304)
+        return b''
+
+    handler.request.setHeader(b'Content-encoding', b'gzip')
+    handler.request.setHeader(b'Content-type', entry[0])
+
+    return entry[1]
+
+
 def decorator_cache_get(f):
     def wrapper(self, *args, **kwargs):
         c = Cache.get(self.request.tid, self.request.path, self.request.language)
@@ -35,20 +63,17 @@ def decorator_cache_get(f):
                     self.request.setHeader(b'content-type', b'application/json')
                     data = json.dumps(data, cls=JSONEncoder)
 
-                self.request.setHeader(b'Content-encoding', b'gzip')
-
                 c = self.request.responseHeaders.getRawHeaders(b'Content-type', [b'application/json'])[0]
-                return Cache.set(self.request.tid, self.request.path, self.request.language, c, data)[1]
+                c = Cache.set(self.request.tid, self.request.path, self.request.language, c, data,
+                              get_cache_dependencies(self))
+
+                return serve_cache_entry(self, c)
 
             d.addCallback(callback)
 
             return d
 
-        else:
-            self.request.setHeader(b'Content-encoding', b'gzip')
-            self.request.setHeader(b'Content-type', c[0])
-
-        return c[1]
+        return serve_cache_entry(self, c)
 
     return wrapper
 
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# Dispatcher selecting the handler of the requests on the base of the path
+re_metachars = '.^$*+?{}[]\\|()'
+
+
+def literal_prefix(pattern):
+    """
+    Extract the literal prefix of a regular expression
+
+    :param pattern: A regular expression anchored with ^ and $
+    :return: A tuple (prefix, exact) where exact signals that the pattern
+             matches only the literal prefix
+    """
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 2
+            continue
+
+        if pattern[i] == '[':
+            i = pattern.index(']', i + 2 if pattern[i + 1:i + 2] == ']' else i + 1)
+        elif pattern[i] == '(':
+            depth += 1
+        elif pattern[i] == ')':
+            depth -= 1
+        elif pattern[i] == '|' and depth == 0:
+            # top level alternatives do not share any prefix
+            return '', False
+
+        i += 1
+
+    prefix = ''
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            c = pattern[i + 1]
+            i += 1
+        elif c in re_metachars:
+            break
+
+        if pattern[i + 1:i + 2] in ('?', '*', '{'):
+            # the last literal character is optional
+            return prefix, False
+
+        prefix += c
+        i += 1
+
+    return prefix, pattern[i:] == '$'
+
+
+class RouteNode(object):
+    __slots__ = ['children', 'routes', 'candidates']
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+        self.candidates = []
+
+
+class RouteDispatcher(object):
+    """
+    Dispatcher indexing the routes in a trie by the segments of their literal prefix
+
+    The selection of the paths made only of literal characters is computed at
+    startup, while for the other paths the regular expressions are evaluated
+    in order only for the routes whose literal prefix matches the path; the
+    selection is the same of the evaluation of the whole list of the regular
+    expressions in order.
+    """
+    def __init__(self, registry):
+        """
+        :param registry: A list of tuples (compiled regexp, handler, args)
+        """
+        self.registry = registry
+        self.exact = {}
+        self.root = RouteNode()
+
+        for idx, route in enumerate(registry):
+            prefix, exact = literal_prefix(route[0].pattern)
+
+            if exact:
+                # $ matches also before a trailing newline
+                for path in (prefix, prefix + '\n'):
+                    if path not in self.exact:
+                        self.exact[path] = self.linear_match(path)
+
+                continue
+
+            segments = prefix.split('/')
+
+            node = self.root
+            for segment in segments[:-1]:
+                node = node.children.setdefault(segment, RouteNode())
+
+            node.routes.append((idx, len(segments) - 1, segments[-1], route))
+
+        self.merge_candidates(self.root, [])
+
+    def merge_candidates(self, node, candidates):
+        node.candidates = sorted(candidates + node.routes, key=lambda x: x[0])
+
+        for child in node.children.values():
+            self.merge_candidates(child, node.candidates)
+
+    def linear_match(self, path):
+        for regexp, handler, args in self.registry:
+            match = regexp.match(path)
+            if match:
+                return handler, args, match.groups()
+
+    def match(self, path):
+        """
+        Select the route of a path
+
+        :param path: The path of the request
+        :return: A tuple (handler, args, groups) or None
+        """
+        if path in self.exact:
+            return self.exact[path]
+
+        segments = path.split('/')
+
+        node = self.root
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                break
+
+            node = child
+
+        for _, depth, tail, route in node.candidates:
+            if depth < len(segments) and segments[depth].startswith(tail):
+                match = route[0].match(path)
+                if match:
+                    return route[1], route[2], match.groups()
@@ -203,3 +203,9 @@ class SessionExpired(GLException):
     reason = "Session expired"
     error_code = 17
     status_code = 401
+
+
+class ServiceOverloaded(GLException):
+    reason = "Service temporarily overloaded"
+    error_code = 18
+    status_code = 503  # Service not available
@@ -17,10 +17,10 @@ class Session(object):
         self.cc = cc
         self.ek = ek
         self.ms = ms
-        self.expireCall = None
+        self.expireTime = 0
 
     def getTime(self):
-        return self.expireCall.getTime() if self.expireCall else 0
+        return self.expireTime
 
     def serialize(self):
         return {
@@ -38,11 +38,13 @@ class Session(object):
 
 class SessionsFactory(TempDict):
     """Extends TempDict to provide session management functions ontop of temp session keys"""
+    indexes = {
+        'user': lambda session: (session.tid, session.user_id)
+    }
 
     def revoke(self, tid, user_id):
-        for k, v in list(self.items()):
-            if v.tid == tid and v.user_id == user_id:
-                del self[k]
+        for k in self.lookup('user', (tid, user_id)):
+            del self[k]
 
     def new(self, tid, user_id, user_tid, user_role, pcn, two_factor, cc, ek, ms=False):
         self.revoke(tid, user_id)
@@ -76,8 +76,31 @@ class SettingsClass(object, metaclass=Singleton):
         self.csr_sign_bits = 512
 
         self.notification_limit = 30
+
+        # Lifetime in seconds of the mails that could not be sent
+        self.mail_timetolive = 5 * 24 * 3600
+
+        # Maximum number of concurrent connections to each SMTP server
+        # and maximum delay in seconds applied to the failing servers
+        self.smtp_concurrency = 2
+        self.smtp_backoff_limit = 3600
         self.jobs_operation_limit = 20
 
+        # KDF pool: maximum number of concurrent Argon2 executions,
+        # memory available to them and maximum number of queued requests
+        self.kdf_concurrency = 4
+        self.kdf_memory_budget = 1 << 29  # 512MB
+        self.kdf_queue_limit = 64
+
+        # Maximum number of files encrypted concurrently by the delivery job
+        self.delivery_parallelism = 4
+
+        # Maximum number of threads decrypting concurrently the items of the tips
+        self.decryption_parallelism = 4
+
+        # Maximum number of bytes per second overwritten by the secure deletion
+        self.secure_deletion_rate = 32 * 1024 * 1024
+
         self.user = getpass.getuser()
         self.group = getpass.getuser()
 
@@ -114,6 +137,15 @@ class SettingsClass(object, metaclass=Singleton):
 
         self.enable_api_cache = True
 
+        # Bound in bytes of the memory used by the API cache
+        self.api_cache_size = 64 * 1024 * 1024
+
+        # Bound in bytes of the memory used by the static assets
+        self.static_cache_size = 64 * 1024 * 1024
+
+        # Group small independent write transactions in a single commit
+        self.enable_write_scheduler = True
+
         self.eval_paths()
 
     def eval_paths(self):
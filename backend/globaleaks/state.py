@@ -4,21 +4,26 @@ import re
 import sys
 import traceback
 
+from collections import deque
 from twisted.internet import defer
 from twisted.mail.smtp import SMTPError
 from twisted.python.failure import Failure
 from twisted.python.threadpool import ThreadPool
 
 from globaleaks import __version__, orm
-from globaleaks.orm import tw
+from globaleaks.orm import WriteScheduler
 from globaleaks.settings import Settings
-from globaleaks.transactions import db_schedule_email
+from globaleaks.transactions import db_schedule_email, schedule_email
 from globaleaks.utils.agent import get_tor_agent, get_web_agent
+from globaleaks.utils.counters import EventCounters
 from globaleaks.utils.crypto import sha256
+from globaleaks.utils.decryption import DecryptionPool
+from globaleaks.utils.kdf import KDFPool
 from globaleaks.utils.log import log
-from globaleaks.utils.mail import sendmail
+from globaleaks.utils.mail import sendmail, sendmails
 from globaleaks.utils.objectdict import ObjectDict
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import PGPKeyring
+from globaleaks.utils.securedelete import SecureDeletionWorker
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.sni import SNIMap
 from globaleaks.utils.tempdict import TempDict
@@ -33,10 +38,18 @@ def getAlarm(state):
     return Alarm(state)
 
 
+class TempUploadFiles(TempDict):
+    """
+    Temporary files of the uploads in progress or waiting to be processed
+    """
+    indexes = {
+        'filename': lambda f: os.path.basename(f.filepath)
+    }
+
+
 class TenantState(object):
     def __init__(self, state):
-        self.RecentEventQ = []
-        self.EventQ = []
+        self.EventCounters = EventCounters()
         self.AnomaliesQ = []
 
         # An ACME challenge will have 5 minutes to resolve
@@ -65,6 +78,9 @@ class StateClass(ObjectDict, metaclass=Singleton):
 
         self.exceptions = {}
         self.exceptions_email_count = 0
+
+        # ids of the tips with new elements to be notified
+        self.notification_queue = deque()
         self.stats_collection_start_time = datetime_now()
 
         self.accept_submissions = True
@@ -74,7 +90,14 @@ class StateClass(ObjectDict, metaclass=Singleton):
         self.tenant_hostname_id_map = {}
 
         self.set_orm_tp(ThreadPool(4, 16))
-        self.TempUploadFiles = TempDict(timeout=3600)
+        self.write_scheduler = WriteScheduler()
+        self.kdf = KDFPool(self.settings.kdf_concurrency,
+                           self.settings.kdf_memory_budget,
+                           self.settings.kdf_queue_limit)
+        self.delivery_tp = ThreadPool(1, self.settings.delivery_parallelism, 'Delivery')
+        self.decryption_pool = DecryptionPool(self.settings.decryption_parallelism)
+        self.secure_deletion = SecureDeletionWorker(self.settings.secure_deletion_rate)
+        self.TempUploadFiles = TempUploadFiles(timeout=3600)
 
         self.shutdown = False
 
@@ -85,6 +108,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
         self.cleaning_dead_files()
 
         self.tokens = TokenList(self, self.settings.tmp_path)
+        self.pgp_keyring = PGPKeyring(self.settings.tmp_path)
 
     def set_orm_tp(self, orm_tp):
         self.orm_tp = orm_tp
@@ -165,20 +189,70 @@ class StateClass(ObjectDict, metaclass=Singleton):
 
     def reset_hourly(self):
         for tid in self.tenant_state:
+            # The event counters slide over the hours
+            event_counters = self.tenant_state[tid].EventCounters
             self.tenant_state[tid] = TenantState(self)
+            self.tenant_state[tid].EventCounters = event_counters
 
         self.exceptions.clear()
         self.exceptions_email_count = 0
 
         self.stats_collection_start_time = datetime_now()
 
+    def schedule_notification(self, itip_id):
+        """
+        Signal to the notification job the creation of new elements on a tip
+        """
+        self.notification_queue.append(itip_id)
+
+    def get_smtp_tid(self, tid):
+        """
+        Return the id of the tenant whose SMTP settings are used by the tenant
+        """
+        return tid if self.tenant_cache[tid].mode == 'default' else 1
+
+    def get_smtp_server(self, tid):
+        tid = self.get_smtp_tid(tid)
+        return self.tenant_cache[tid].notification.smtp_server, self.tenant_cache[tid].notification.smtp_port
+
+    def sendmails(self, tid, mails, concurrency=1):
+        """
+        Send a list of mails of a tenant reusing the SMTP connections
+
+        :param tid: A tenant id
+        :param mails: A list of dicts with the id, address, subject and body of each mail
+        :param concurrency: The maximum number of concurrent SMTP connections
+        :return: A deferred resolving with the list of the ids of the mails sent and the last error
+        """
+        if self.settings.testing:
+            # during unit testing do not try to send the mail
+            return defer.succeed(([mail['id'] for mail in mails], None))
+
+        tid = self.get_smtp_tid(tid)
+
+        mails = [dict(mail, subject=self.tenant_cache[tid].name + ' - ' + mail['subject']) for mail in mails]
+
+        return sendmails(tid,
+                         self.tenant_cache[tid].notification.smtp_server,
+                         self.tenant_cache[tid].notification.smtp_port,
+                         self.tenant_cache[tid].notification.smtp_security,
+                         self.tenant_cache[tid].notification.smtp_authentication,
+                         self.tenant_cache[tid].notification.smtp_username,
+                         self.tenant_cache[tid].notification.smtp_password,
+                         self.tenant_cache[tid].name,
+                         self.tenant_cache[tid].notification.smtp_source_email,
+                         mails,
+                         concurrency,
+                         self.tenant_cache[1].anonymize_outgoing_connections,
+                         self.settings.socks_host,
+                         self.settings.socks_port)
+
     def sendmail(self, tid, to_address, subject, body):
         if self.settings.testing:
             # during unit testing do not try to send the mail
             return defer.succeed(True)
 
-        if self.tenant_cache[tid].mode != 'default':
-            tid = 1
+        tid = self.get_smtp_tid(tid)
 
         return sendmail(tid,
                         self.tenant_cache[tid].notification.smtp_server,
@@ -231,12 +305,10 @@ class StateClass(ObjectDict, metaclass=Singleton):
             # Opportunisticly encrypt the mail body. NOTE that mails will go out
             # unencrypted if one address in the list does not have a public key set.
             if pgp_key_public:
-                pgpctx = PGPContext(self.settings.tmp_path)
-                fingerprint = pgpctx.load_key(pgp_key_public)['fingerprint']
-                mail_body = pgpctx.encrypt_message(fingerprint, mail_body)
+                mail_body = self.pgp_keyring.encrypt_message(pgp_key_public, mail_body)
 
             # avoid waiting for the notification to send and instead rely on threads to handle it
-            tw(db_schedule_email, 1, mail_address, mail_subject, mail_body)
+            schedule_email(1, mail_address, mail_subject, mail_body)
 
     def refresh_connection_endpoints(self):
         # Remove selected onion services and add missing services
@@ -250,16 +322,13 @@ class StateClass(ObjectDict, metaclass=Singleton):
         subject, body = Templating().get_mail_subject_and_body(template_vars)
 
         if user_desc.get('pgp_key_public', ''):
-            pgpctx = PGPContext(self.settings.tmp_path)
-            fingerprint = pgpctx.load_key(user_desc['pgp_key_public'])['fingerprint']
-            body = pgpctx.encrypt_message(fingerprint, body)
+            body = self.pgp_keyring.encrypt_message(user_desc['pgp_key_public'], body)
 
         db_schedule_email(session, tid, user_desc['mail_address'], subject, body)
 
     def get_tmp_file_by_name(self, filename):
-        for k, v in self.TempUploadFiles.items():
-            if os.path.basename(v.filepath) == filename:
-                return self.TempUploadFiles.pop(k)
+        for k in self.TempUploadFiles.lookup('filename', filename):
+            return self.TempUploadFiles.pop(k)
 
 
 def mail_exception_handler(etype, value, tback):
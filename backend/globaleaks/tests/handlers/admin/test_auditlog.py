@@ -93,4 +93,22 @@ class TestJobsTiming(helpers.TestHandler):
 
         handler = self.request({}, role='admin')
 
-        yield handler.get()
+        response = yield handler.get()
+
+        for elem in response:
+            for k in ['name', 'timings', 'progress']:
+                self.assertTrue(k in elem)
+
+
+class TestKDFMetrics(helpers.TestHandler):
+    _handler = auditlog.KDFMetrics
+
+    @inlineCallbacks
+    def test_get(self):
+        yield self.state.kdf.hash_password(helpers.VALID_PASSWORD1, helpers.VALID_SALT1)
+
+        handler = self.request({}, role='admin')
+        response = yield handler.get()
+
+        self.assertEqual(response['queue_depth'], 0)
+        self.assertTrue(response['executed'] >= 1)
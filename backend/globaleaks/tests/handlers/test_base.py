@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
+import io
 import json
+import os
 
-from globaleaks.handlers.base import BaseHandler
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from globaleaks.handlers.base import BaseHandler, FileProducer, StreamingUpload
 from globaleaks.rest.errors import InputValidationError
+from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.tests.utils.test_multipart import forge_multipart_body
 
 FUTURE = 100
 
@@ -69,3 +76,117 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     def test_validate_regexp_valid(self):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
+
+
+class TestStreamingUpload(helpers.TestGL):
+    boundary = b'----boundary'
+
+    def upload_chunk(self, file_id, data, complete=True, max_size=None):
+        body = forge_multipart_body(self.boundary, [(b'flowIdentifier', file_id)], data)
+        if not complete:
+            body = body[:len(body) // 2]
+
+        upload = StreamingUpload(self.boundary, max_size)
+
+        for i in range(0, len(body), 1000):
+            upload.feed(body[i:i + 1000])
+
+        if complete:
+            upload.close()
+        else:
+            upload.abort()
+
+        return upload
+
+    def test_upload(self):
+        chunks = [os.urandom(10000) for _ in range(3)]
+
+        upload = self.upload_chunk(b'id', chunks[0])
+        self.assertTrue(upload.complete)
+        self.assertEqual(upload.fields, {b'flowIdentifier': [b'id']})
+        self.assertEqual(upload.size, 10000)
+
+        # an interrupted chunk is discarded
+        upload = self.upload_chunk(b'id', chunks[1], False)
+        self.assertFalse(upload.complete)
+        self.assertEqual(upload.file.size, 10000)
+
+        for chunk in chunks[1:]:
+            self.upload_chunk(b'id', chunk)
+
+        f = State.TempUploadFiles[u'id']
+        f.finalize_write()
+
+        with f.open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    def test_upload_not_consumed(self):
+        upload = self.upload_chunk(b'not_consumed', os.urandom(10000))
+        self.assertTrue(upload.complete)
+        self.assertIn(u'not_consumed', State.TempUploadFiles)
+
+        # the file created by an upload not consumed is discarded
+        upload.abort()
+        self.assertNotIn(u'not_consumed', State.TempUploadFiles)
+
+    def test_upload_too_big(self):
+        self.upload_chunk(b'too_big', os.urandom(10000))
+
+        upload = self.upload_chunk(b'too_big', os.urandom(10000), max_size=5000)
+        self.assertTrue(upload.too_big)
+        self.assertIsNotNone(upload.error)
+        self.assertEqual(State.TempUploadFiles[u'too_big'].size, 10000)
+
+        upload = self.upload_chunk(b'other', os.urandom(10000), max_size=5000)
+        self.assertTrue(upload.too_big)
+        self.assertNotIn(u'other', State.TempUploadFiles)
+
+
+class FailingFile(io.BytesIO):
+    def read(self, size=-1):
+        raise IOError("Read error")
+
+
+class TransportMock(object):
+    aborted = False
+
+    def abortConnection(self):
+        self.aborted = True
+
+
+class ChannelMock(object):
+    def __init__(self):
+        self.transport = TransportMock()
+
+
+class TestFileProducer(helpers.TestGL):
+    @inlineCallbacks
+    def produce(self, fo, length):
+        request = helpers.forge_request()
+        request.channel = ChannelMock()
+
+        served = yield FileProducer(request, fo, 0, length, reactor.getThreadPool()).begin()
+
+        returnValue((request, served))
+
+    @inlineCallbacks
+    def test_produce(self):
+        request, served = yield self.produce(io.BytesIO(b'x' * 100000), 100000)
+        self.assertTrue(served)
+        self.assertEqual(request.getResponseBody(), b'x' * 100000)
+        self.assertEqual(request.finished, 1)
+        self.assertFalse(request.channel.transport.aborted)
+
+    @inlineCallbacks
+    def test_abort_on_error(self):
+        request, served = yield self.produce(FailingFile(), 100000)
+        self.assertFalse(served)
+        self.assertEqual(request.finished, 0)
+        self.assertTrue(request.channel.transport.aborted)
+
+    @inlineCallbacks
+    def test_abort_on_truncated_file(self):
+        request, served = yield self.produce(io.BytesIO(b'x' * 10), 100000)
+        self.assertFalse(served)
+        self.assertEqual(request.finished, 0)
+        self.assertTrue(request.channel.transport.aborted)
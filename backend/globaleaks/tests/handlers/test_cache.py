@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.rest.cache import Cache, gzipdata
+from globaleaks.handlers import public
+from globaleaks.rest.cache import Cache, etag, etag_match, gzipdata
+from globaleaks.rest.decorators import decorator_cache_get, get_cache_dependencies
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
 
@@ -12,22 +15,114 @@ class TestCache(helpers.TestGL):
 
         Cache.invalidate()
 
+    def tearDown(self):
+        Cache.invalidate()
+
+        return helpers.TestGL.tearDown(self)
+
     def test_cache(self):
-        self.assertEqual(Cache.memory_cache_dict, {})
+        self.assertEqual(len(Cache.memory_cache_dict), 0)
         self.assertIsNone(Cache.get(1, "passante_di_professione", "it"))
         self.assertIsNone(Cache.get(1, "passante_di_professione", "en"))
         self.assertIsNone(Cache.get(2, "passante_di_professione", "ca"))
         Cache.set(1, "passante_di_professione", "it", 'text/plain', 'ititit')
         Cache.set(1, "passante_di_professione", "en", 'text/plain', 'enenen')
         Cache.set(2, "passante_di_professione", "ca", 'text/plain', 'cacaca')
-        self.assertTrue("passante_di_professione" in Cache.memory_cache_dict[1])
-        self.assertTrue("passante_di_professione" in Cache.memory_cache_dict[2])
-        self.assertIsNone(Cache.get(1, "passante_di_professione", "ca"))
-        self.assertTrue("it" in Cache.memory_cache_dict[1]['passante_di_professione'])
-        self.assertTrue("en" in Cache.memory_cache_dict[1]['passante_di_professione'])
         self.assertIsNone(Cache.get(1, "passante_di_professione", "ca"))
         self.assertEqual(Cache.get(1, "passante_di_professione", "it")[1], gzipdata('ititit'))
         self.assertEqual(Cache.get(1, "passante_di_professione", "en")[1], gzipdata('enenen'))
         self.assertEqual(Cache.get(2, "passante_di_professione", "ca")[1], gzipdata('cacaca'))
+        self.assertEqual(Cache.get(2, "passante_di_professione", "ca")[2], etag(gzipdata('cacaca')))
+        Cache.invalidate()
+        self.assertEqual(len(Cache.memory_cache_dict), 0)
+        self.assertEqual(Cache.memory_cache_size, 0)
+
+    def test_invalidate_dependencies(self):
+        Cache.set(1, "/api/public", "en", 'application/json', '{}')
+        Cache.set(2, "/api/public", "en", 'application/json', '{}')
+        Cache.set(3, "/api/public", "en", 'application/json', '{}', {1})
+
+        Cache.invalidate(2)
+        self.assertIsNotNone(Cache.get(1, "/api/public", "en"))
+        self.assertIsNone(Cache.get(2, "/api/public", "en"))
+        self.assertIsNotNone(Cache.get(3, "/api/public", "en"))
+
+        Cache.set(2, "/api/public", "en", 'application/json', '{}')
+
+        Cache.invalidate(1)
+        self.assertIsNone(Cache.get(1, "/api/public", "en"))
+        self.assertIsNotNone(Cache.get(2, "/api/public", "en"))
+        self.assertIsNone(Cache.get(3, "/api/public", "en"))
+        self.assertEqual(set(Cache.memory_cache_tags.keys()), {2})
+
+    def test_lru_eviction(self):
+        size = len(gzipdata('x' * 100))
+        self.patch(Settings, 'api_cache_size', size * 2)
+
+        Cache.set(1, "/a", "en", 'text/plain', 'x' * 100)
+        Cache.set(1, "/b", "en", 'text/plain', 'x' * 100)
+        Cache.get(1, "/a", "en")
+        Cache.set(1, "/c", "en", 'text/plain', 'x' * 100)
+
+        self.assertIsNotNone(Cache.get(1, "/a", "en"))
+        self.assertIsNone(Cache.get(1, "/b", "en"))
+        self.assertIsNotNone(Cache.get(1, "/c", "en"))
+        self.assertEqual(Cache.memory_cache_size, size * 2)
+
+    def test_etag_match(self):
+        tag = Cache.set(1, "/api/public", "en", 'application/json', '{}')[2]
+
+        self.assertTrue(etag_match(tag, tag))
+        self.assertTrue(etag_match(b'"abc", ' + tag, tag))
+        self.assertTrue(etag_match(b'W/' + tag, tag))
+        self.assertTrue(etag_match(b'*', tag))
+        self.assertFalse(etag_match(b'"abc"', tag))
+        self.assertFalse(etag_match(None, tag))
+
+
+class TestCacheDecorator(helpers.TestHandlerWithPopulatedDB):
+    _handler = public.PublicResource
+
+    def setUp(self):
+        Cache.invalidate()
+
+        return helpers.TestHandlerWithPopulatedDB.setUp(self)
+
+    def tearDown(self):
         Cache.invalidate()
-        self.assertEqual(Cache.memory_cache_dict, {})
+
+        return helpers.TestHandlerWithPopulatedDB.tearDown(self)
+
+    @inlineCallbacks
+    def test_etag_and_not_modified(self):
+        f = decorator_cache_get(lambda self: {'node': 'test'})
+
+        handler = self.request()
+        response = yield f(handler)
+        tag = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+        self.assertEqual(response, gzipdata('{"node": "test"}'))
+
+        handler = self.request(headers={'If-None-Match': tag})
+        response = yield f(handler)
+        self.assertEqual(response, b'')
+        self.assertEqual(handler.request.responseCode, 304)
+
+        handler = self.request(headers={'If-None-Match': b'"outdated"'})
+        response = yield f(handler)
+        self.assertEqual(response, gzipdata('{"node": "test"}'))
+
+    @inlineCallbacks
+    def test_root_tenant_dependency(self):
+        f = decorator_cache_get(lambda self: {'node': 'test'})
+
+        handler = self.request()
+        handler.request.tid = 2
+        self.assertEqual(get_cache_dependencies(handler), {1, 2})
+
+        yield f(handler)
+        self.assertIsNotNone(Cache.get(2, handler.request.path, handler.request.language))
+
+        # the changes of the root tenant, like the mode or the activation
+        # of the tenants, drop also the entries of the other tenants
+        Cache.invalidate(1)
+        self.assertIsNone(Cache.get(2, handler.request.path, handler.request.language))
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from io import BytesIO
+from zipfile import ZipFile
 
 from globaleaks.handlers import export
 from globaleaks.jobs.delivery import Delivery
@@ -32,3 +34,7 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
 
         yield handler.get(rtips_desc[0]['id'])
         self.assertNotEqual(handler.request.getResponseBody(), b'')
+
+        with ZipFile(BytesIO(handler.request.getResponseBody()), 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertIn('data.txt', f.namelist())
@@ -5,6 +5,7 @@ from globaleaks import models
 from globaleaks.handlers import receiver
 from globaleaks.handlers.admin import user
 from globaleaks.orm import transact
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_never
 
@@ -14,6 +15,11 @@ def set_expiration_of_all_rtips_to_unlimited(session):
     session.query(models.InternalTip).update({'expiration_date': datetime_never()})
 
 
+@transact
+def delete_itip_answers(session, itip_id):
+    session.query(models.InternalTipAnswers).filter(models.InternalTipAnswers.internaltip_id == itip_id).delete(synchronize_session=False)
+
+
 class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsCollection
 
@@ -31,6 +37,87 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
             self.assertEqual(ret[idx]['comment_count'], 3)
             self.assertEqual(ret[idx]['message_count'], 2)
 
+    @inlineCallbacks
+    def test_get_paginated(self):
+        for _ in range(2):
+            yield self.perform_full_submission_actions()
+
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+
+        ids = []
+        cursor = None
+        while True:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.args = {b'limit': [b'2']}
+            if cursor is not None:
+                handler.request.args[b'cursor'] = [cursor.encode()]
+
+            ret = yield handler.get()
+            self.assertTrue(len(ret['tips']) <= 2)
+            ids.extend([x['id'] for x in ret['tips']])
+
+            cursor = ret['cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, [x['id'] for x in rtips])
+
+    @inlineCallbacks
+    def test_get_paginated_without_answers(self):
+        for _ in range(2):
+            yield self.perform_full_submission_actions()
+
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+
+        # the submissions without answers should not hide the following pages
+        yield delete_itip_answers(rtips[0]['itip_id'])
+
+        ids = []
+        cursor = None
+        while True:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.args = {b'limit': [b'1']}
+            if cursor is not None:
+                handler.request.args[b'cursor'] = [cursor.encode()]
+
+            ret = yield handler.get()
+            ids.extend([x['id'] for x in ret['tips']])
+
+            cursor = ret['cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, [x['id'] for x in rtips[1:]])
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'limit': [b'100'], b'context_id': [rtips[0]['context_id'].encode()]}
+        ret = yield handler.get()
+        self.assertEqual(len(ret['tips']), len([x for x in rtips if x['context_id'] == rtips[0]['context_id']]))
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'limit': [b'100'], b'status': [b'unexistent']}
+        ret = yield handler.get()
+        self.assertEqual(ret['tips'], [])
+        self.assertIsNone(ret['cursor'])
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'limit': [b'100'], b'unread': [b'true'], b'start_date': [b'2000-01-01T00:00:00Z']}
+        ret = yield handler.get()
+        self.assertEqual(len(ret['tips']), len([x for x in rtips if x['new']]))
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'limit': [b'100'], b'end_date': [b'2000-01-01T00:00:00Z']}
+        ret = yield handler.get()
+        self.assertEqual(ret['tips'], [])
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'limit': [b'invalid']}
+        yield self.assertFailure(handler.get(), errors.InputValidationError)
+
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsOperations
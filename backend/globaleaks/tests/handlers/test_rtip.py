@@ -4,12 +4,18 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers import rtip
 from globaleaks.jobs.delivery import Delivery
+from globaleaks.orm import transact_ro
 from globaleaks.rest import errors
 from globaleaks.state import State
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_never, datetime_now, datetime_null
 
 
+@transact_ro
+def get_rfile_downloads(session, rfile_id):
+    return session.query(models.ReceiverFile.downloads).filter(models.ReceiverFile.id == rfile_id).one()[0]
+
+
 class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.RTipInstance
 
@@ -238,9 +244,13 @@ class TestReceiverMsgCollection(helpers.TestHandlerWithPopulatedDB):
 
         rtip_descs = yield self.get_rtips()
         for rtip_desc in rtip_descs:
+            self.state.notification_queue.clear()
+
             handler = self.request(body, role='receiver', user_id=rtip_desc['receiver_id'])
             yield handler.post(rtip_desc['id'])
 
+            self.assertEqual(list(self.state.notification_queue), [rtip_desc['internaltip_id']])
+
 
 class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.ReceiverFileDownload
@@ -258,6 +268,49 @@ class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
                 yield handler.get(rfile_desc['id'])
                 self.assertNotEqual(handler.request.getResponseBody(), '')
 
+    @inlineCallbacks
+    def test_get_range(self):
+        yield self.perform_minimal_submission()
+        yield Delivery().run()
+
+        rtip_descs = yield self.get_rtips()
+        for rtip_desc in rtip_descs:
+            rfiles_desc = yield self.get_rfiles(rtip_desc['id'])
+            for rfile_desc in rfiles_desc:
+                handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+                yield handler.get(rfile_desc['id'])
+                body = handler.request.getResponseBody()
+
+                handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                       headers={'Range': 'bytes=1-10'})
+                yield handler.get(rfile_desc['id'])
+                self.assertEqual(handler.request.responseCode, 206)
+                self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Content-Range')[0],
+                                 b'bytes 1-10/%d' % len(body))
+                self.assertEqual(handler.request.getResponseBody(), body[1:11])
+
+                handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                       headers={'Range': 'bytes=%d-' % (len(body) + 1)})
+                yield handler.get(rfile_desc['id'])
+                self.assertEqual(handler.request.responseCode, 416)
+
+                downloads = yield get_rfile_downloads(rfile_desc['id'])
+                self.assertEqual(downloads, 1)
+
+                # only the requests serving the last byte are counted as downloads
+                handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                       headers={'Range': 'bytes=1-'})
+                yield handler.get(rfile_desc['id'])
+                self.assertEqual(handler.request.getResponseBody(), body[1:])
+
+                handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                       headers={'Range': 'bytes=-1'})
+                yield handler.get(rfile_desc['id'])
+                self.assertEqual(handler.request.getResponseBody(), body[-1:])
+
+                downloads = yield get_rfile_downloads(rfile_desc['id'])
+                self.assertEqual(downloads, 3)
+
 
 class TestIdentityAccessRequestsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.IdentityAccessRequestsCollection
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import gzip
+import os
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.handlers.staticfile import StaticFileHandler
+from globaleaks.handlers.staticfile import StaticFileHandler, get_asset_index, reload_asset_indexes
 from globaleaks.rest import errors
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
@@ -22,3 +25,80 @@ class TestStaticFileHandler(helpers.TestHandler):
         handler = self.request(kwargs={'path': Settings.client_path})
 
         return self.assertRaises(errors.ResourceNotFound, handler.get, 'unexistent')
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request(kwargs={'path': Settings.client_path})
+        yield handler.get('')
+        etag = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'If-None-Match': etag})
+        yield handler.get('')
+        self.assertEqual(handler.request.responseCode, 304)
+        self.assertEqual(handler.request.written, [])
+
+
+class TestAssetIndex(helpers.TestHandler):
+    _handler = StaticFileHandler
+
+    def setUp(self):
+        self.path = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(self.path, 'js'))
+
+        for name, content in [('index.html', b'<!doctype html>' + b' ' * 1000),
+                              ('js/scripts.js', b'scripts'),
+                              ('js/scripts.js.gz', gzip.compress(b'scripts')),
+                              ('js/scripts.3f2a9c1b.js', b'scripts'),
+                              ('js/locale.js.gz', gzip.compress(b'locale'))]:
+            with open(os.path.join(self.path, name), 'wb') as f:
+                f.write(content)
+
+        return helpers.TestHandler.setUp(self)
+
+    def get(self, filename, headers=None):
+        handler = self.request(kwargs={'path': self.path}, headers=headers)
+        handler.get(filename)
+        return handler.request
+
+    def test_content_encoding(self):
+        request = self.get('js/scripts.js')
+        self.assertEqual(request.getResponseBody(), b'scripts')
+        self.assertIsNone(request.responseHeaders.getRawHeaders(b'Content-encoding'))
+
+        request = self.get('js/scripts.js', {'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(gzip.decompress(request.getResponseBody()), b'scripts')
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Content-encoding'), [b'gzip'])
+
+        request = self.get('', {'Accept-Encoding': 'gzip'})
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Content-encoding'), [b'gzip'])
+
+        request = self.get('js/locale.js')
+        self.assertEqual(gzip.decompress(request.getResponseBody()), b'locale')
+
+    def test_immutable_assets(self):
+        request = self.get('js/scripts.3f2a9c1b.js')
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Cache-control'),
+                         [b'public, max-age=31536000, immutable'])
+
+        request = self.get('js/scripts.js')
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Cache-control'),
+                         [b'no-cache, must-revalidate'])
+
+    @inlineCallbacks
+    def test_memory_budget(self):
+        self.patch(Settings, 'static_cache_size', 0)
+
+        handler = self.request(kwargs={'path': self.path})
+        self.assertIsNone(get_asset_index(self.path).get('index.html').variants['identity'][2])
+        yield handler.get('')
+        self.assertTrue(handler.request.getResponseBody().startswith(b'<!doctype html>'))
+
+    def test_reload(self):
+        self.assertRaises(errors.ResourceNotFound, self.get, 'new.js')
+
+        with open(os.path.join(self.path, 'new.js'), 'wb') as f:
+            f.write(b'new')
+
+        reload_asset_indexes()
+
+        self.assertEqual(self.get('new.js').getResponseBody(), b'new')
@@ -3,6 +3,7 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks.handlers import authentication, wbtip
 from globaleaks.handlers.submission import SubmissionInstance
+from globaleaks import models
 from globaleaks.jobs import delivery
 from globaleaks.models.config import db_set_config_variable
 from globaleaks.orm import tw
@@ -10,6 +11,10 @@ from globaleaks.rest import errors
 from globaleaks.tests import helpers
 
 
+def db_set_score_threshold_receipt(session, context_id, value):
+    session.query(models.Context).filter(models.Context.id == context_id).update({'score_threshold_receipt': value})
+
+
 class TestSubmissionEncryptedScenario(helpers.TestHandlerWithPopulatedDB):
     _handler = SubmissionInstance
 
@@ -89,6 +94,31 @@ class TestSubmissionEncryptedScenario(helpers.TestHandlerWithPopulatedDB):
         for key in self.counters_check:
             self.assertEqual(counters[key], self.counters_check[key])
 
+    @inlineCallbacks
+    def test_create_submission_without_receipt(self):
+        def fail(*args):
+            raise Exception("The receipt should not be generated")
+
+        self.patch(self.state.kdf, 'hash_password', fail)
+        self.patch(self.state.kdf, 'derive_key', fail)
+
+        enable_scoring_system = self.state.tenant_cache[1].enable_scoring_system
+        self.addCleanup(setattr, self.state.tenant_cache[1], 'enable_scoring_system', enable_scoring_system)
+        self.state.tenant_cache[1].enable_scoring_system = True
+
+        yield tw(db_set_score_threshold_receipt, self.dummyContext['id'], 2)
+
+        wbtips_count = yield tw(lambda session: session.query(models.WhistleblowerTip).count())
+
+        self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
+        self.submission_desc['total_score'] = 0
+
+        handler = self.request(self.submission_desc)
+        response = yield handler.put(self.getSolvedToken().id)
+        self.assertEqual(response['receipt'], '')
+
+        yield self.test_model_count(models.WhistleblowerTip, wbtips_count)
+
     @inlineCallbacks
     def test_update_submission(self):
         self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
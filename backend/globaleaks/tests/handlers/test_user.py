@@ -39,6 +39,17 @@ class TestUserInstance(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(response, user_id=self.rcvr_id, role='receiver')
         yield handler.put()
 
+    @inlineCallbacks
+    def test_put_change_password_invalid_old_password(self):
+        handler = self.request(user_id=self.rcvr_id, role='receiver')
+
+        response = yield handler.get()
+        response['password'] = 'new 1337 password!'
+        response['old_password'] = 'invalid password'
+
+        handler = self.request(response, user_id=self.rcvr_id, role='receiver')
+        yield self.assertFailure(handler.put(), errors.InvalidOldPassword)
+
     @inlineCallbacks
     def test_handler_update_key(self):
         handler = self.request(user_id=self.rcvr_id, role='receiver')
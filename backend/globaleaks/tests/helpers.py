@@ -143,10 +143,17 @@ def init_state():
 
     Settings.eval_paths()
 
+    if State.pgp_keyring is not None:
+        State.pgp_keyring.close()
+
     if os.path.exists(Settings.working_path):
         shutil.rmtree(Settings.working_path)
 
     orm.set_thread_pool(FakeThreadPool())
+    State.kdf.set_thread_pool(FakeThreadPool())
+    State.delivery_tp = FakeThreadPool()
+    State.decryption_pool.set_thread_pool(FakeThreadPool())
+    State.secure_deletion.set_thread_pool(FakeThreadPool())
 
     State.settings.enable_api_cache = False
     State.tenant_cache[1] = ObjectDict()
@@ -329,6 +336,20 @@ def forge_request(uri=b'https://www.globaleaks.org/',
 
     request.getResponseBody = getResponseBody
 
+    def registerProducer(producer, streaming):
+        # Push producers are driven by their own events as on a real transport
+        if streaming:
+            request.producer = producer
+        else:
+            DummyRequest.registerProducer(request, producer, streaming)
+
+    def unregisterProducer():
+        request.producer = None
+        request.go = 0
+
+    request.registerProducer = registerProducer
+    request.unregisterProducer = unregisterProducer
+
     if client_addr is None:
         request.client = IPv4Address('TCP', b'1.2.3.4', 12345)
     else:
@@ -601,8 +622,7 @@ class TestGL(unittest.TestCase):
             for event_obj in event.events_monitored:
                 for x in range(2):
                     e = event.Event(event_obj, timedelta(seconds=1.0 * x))
-                    self.state.tenant_state[1].RecentEventQ.append(e)
-                    self.state.tenant_state[1].EventQ.append(e)
+                    self.state.tenant_state[1].EventCounters.add(e)
 
     @transact
     def get_rtips(self, session):
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import filecmp
+import os
+import shutil
+import sqlite3
+import tarfile
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs.backup import Backup
+from globaleaks.jobs.delivery import Delivery
+from globaleaks.orm import transact
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.backup import get_objects, read_manifest, restore_backup
+
+
+@transact
+def get_backups(session):
+    return [x[0] for x in session.query(models.Backup.filename)]
+
+
+class TestBackup(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def test_job(self):
+        yield self.perform_full_submission_actions()
+        yield Delivery().run()
+
+        self.state.tenant_cache[1].backup = True
+
+        # a file not referenced by the database, e.g. written after the snapshot
+        with open(os.path.join(Settings.attachments_path, 'unreferenced'), 'wb') as f:
+            f.write(b'unreferenced')
+
+        yield Backup().operation()
+
+        backups = yield get_backups()
+        self.assertEqual(len(backups), 1)
+
+        path = os.path.join(Settings.backup_path, backups[0])
+        manifest = read_manifest(path)
+
+        # only the attachments referenced by the snapshot are stored
+        attachments = [x for x in os.listdir(Settings.attachments_path) if x != 'unreferenced']
+        self.assertTrue(attachments)
+        self.assertEqual(sorted(manifest['attachments']), sorted(attachments))
+
+        # the attachments are stored once by content
+        objects = get_objects(Settings.backup_path)
+        self.assertEqual(set(objects), set(manifest['attachments'].values()))
+
+        restore_path = os.path.join(Settings.tmp_path, 'restore')
+        os.mkdir(restore_path)
+        restore_backup(path, os.path.join(Settings.backup_path, 'objects'), restore_path)
+
+        for name in attachments:
+            self.assertTrue(filecmp.cmp(os.path.join(Settings.attachments_path, name),
+                                        os.path.join(restore_path, 'attachments', name), False))
+
+        with sqlite3.connect(os.path.join(restore_path, 'globaleaks.db')) as conn:
+            self.assertEqual(conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            self.assertEqual(conn.execute('SELECT count(*) FROM internaltip').fetchone()[0],
+                             self.population_of_submissions)
+
+        shutil.rmtree(restore_path)
+
+        # the objects not referenced by the backups are marked for deletion
+        self.state.tenant_cache[1].backup = False
+        self.state.tenant_cache[1].backup_d = 0
+        self.state.tenant_cache[1].backup_w = 0
+        self.state.tenant_cache[1].backup_m = 0
+
+        yield Backup().operation()
+
+        yield self.test_model_count(models.Backup, 0)
+        yield self.test_model_count(models.SecureFileDelete, 1 + len(objects))
+
+    def test_restore_legacy_backup(self):
+        src_path = os.path.join(Settings.tmp_path, 'globaleaks')
+        os.makedirs(os.path.join(src_path, 'attachments'))
+        for name in ['globaleaks.db', os.path.join('attachments', 'file')]:
+            with open(os.path.join(src_path, name), 'w') as f:
+                f.write(name)
+
+        path = os.path.join(Settings.tmp_path, 'legacy.tar.gz')
+        with tarfile.open(path, 'w:gz') as tf:
+            tf.add(src_path, arcname=os.path.basename(src_path))
+
+        restore_path = os.path.join(Settings.tmp_path, 'restore')
+        os.mkdir(restore_path)
+        restore_backup(path, os.path.join(Settings.backup_path, 'objects'), restore_path)
+
+        self.assertEqual(sorted(os.listdir(restore_path)), ['attachments', 'globaleaks.db'])
+        self.assertTrue(filecmp.cmp(os.path.join(src_path, 'attachments', 'file'),
+                                    os.path.join(restore_path, 'attachments', 'file'), False))
+
+        shutil.rmtree(src_path)
+        shutil.rmtree(restore_path)
+        os.remove(path)
@@ -4,11 +4,12 @@ import os
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
-from globaleaks.jobs import cleaning, delivery
+from globaleaks.jobs import cleaning, delivery, secure_deletion
 from globaleaks.orm import transact
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_now
 
 
 class TestCleaning(helpers.TestGLWithPopulatedDB):
@@ -113,5 +114,33 @@ class TestCleaning(helpers.TestGLWithPopulatedDB):
 
         yield cleaning.Cleaning().run()
 
+        # verify that the files of the expired tips are marked for secure deletion
+        yield self.test_model_count(models.SecureFileDelete, self.population_of_attachments * self.population_of_submissions * self.population_of_recipients)
+
+        yield secure_deletion.SecureDeletion().run()
+
         # verify cascade deletion when tips expire
         yield self.check4()
+
+    @inlineCallbacks
+    def test_clean_expired_itips_in_batches(self):
+        yield self.perform_full_submission_actions()
+        yield self.force_itip_expiration()
+
+        job = cleaning.Cleaning()
+        job.expired_itips_chunk_size = 1
+        job.expired_itips_time_budget = 0
+
+        # each transaction stops after the first chunk once the time budget is exhausted
+        cursor, count = yield job.delete_expired_itips(datetime_now(), None)
+        self.assertEqual(count, 1)
+        yield self.test_model_count(models.InternalTip, self.population_of_submissions - 1)
+
+        yield job.clean_expired_itips()
+
+        yield self.test_model_count(models.InternalTip, 0)
+        yield self.test_model_count(models.ReceiverTip, 0)
+        self.assertEqual(job.progress, {'operation': 'expired_itips',
+                                        'deleted': self.population_of_submissions - 1,
+                                        'total': self.population_of_submissions - 1})
+        self.assertIsNone(job.expired_itips_cursor)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.python.failure import Failure
+
+from globaleaks.jobs import delivery
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+
+
+class FailingWriter(object):
+    def write(self, chunk):
+        raise IOError
+
+    def close(self):
+        pass
+
+
+class TestStreamFile(helpers.TestGL):
+    def test_stream_file(self):
+        content = os.urandom(200000)
+
+        sf = SecureTemporaryFile(Settings.tmp_path)
+        with sf.open('w') as f:
+            f.write(content)
+            f.finalize_write()
+
+        dest_path = os.path.join(Settings.tmp_path, 'plain')
+
+        with open(dest_path, 'wb') as plaintext_file:
+            size, failures = delivery.stream_file(sf, [('failing', FailingWriter()),
+                                                       ('file', plaintext_file)])
+
+        self.assertEqual(size, len(content))
+        self.assertEqual(list(failures.keys()), ['failing'])
+
+        with open(dest_path, 'rb') as plaintext_file:
+            self.assertEqual(plaintext_file.read(), content)
+
+    def test_pgp_stream_writer(self):
+        dest_path = os.path.join(Settings.tmp_path, 'encrypted.pgp')
+
+        writer = delivery.PGPStreamWriter(self.state,
+                                          helpers.PGPKEYS['VALID_PGP_KEY1_PUB'],
+                                          dest_path)
+
+        writer.write(b'antani' * 10000)
+        writer.close()
+
+        self.assertTrue(os.path.getsize(dest_path) > 0)
+
+    def test_process_whistleblowerfile_failure(self):
+        sf = SecureTemporaryFile(Settings.tmp_path)
+        with sf.open('w') as f:
+            f.write(b'antani')
+            f.finalize_write()
+
+        def stream_file(sf, writers):
+            for _, writer in writers:
+                writer.write(b'partial')
+                writer.close()
+
+            return 7, {'file': IOError()}
+
+        self.patch(delivery, 'stream_file', stream_file)
+
+        files_map = {'id': 'id', 'crypto_tip_pub_key': '', 'filename': 'failure.tmp'}
+
+        self.assertRaises(Exception, delivery.process_whistleblowerfile, self.state, files_map, sf)
+        self.assertFalse(os.path.exists(os.path.join(Settings.attachments_path, 'failure.plain')))
+
+    def test_discard_failures(self):
+        files_maps = {'a': {}, 'b': {}}
+
+        try:
+            raise IOError
+        except IOError:
+            failure = Failure()
+
+        delivery.Delivery().discard_failures([(True, None), (False, failure)], ['a', 'b'], files_maps)
+
+        self.assertEqual(list(files_maps), ['a'])
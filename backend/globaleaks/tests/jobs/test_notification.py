@@ -1,10 +1,43 @@
 # -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.internet.task import deferLater
 
 from globaleaks import models
 from globaleaks.jobs.delivery import Delivery
-from globaleaks.jobs.notification import Notification
+from globaleaks.jobs.notification import MailGenerator, Notification, claim_mails
+from globaleaks.orm import transact, tw
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_now
+
+
+@transact
+def get_new_receivertips_itips(session):
+    return [x[0] for x in session.query(models.ReceiverTip.internaltip_id).filter(models.ReceiverTip.new.is_(True))]
+
+
+def db_add_mails(session, n, tid=1, creation_date=None):
+    for i in range(n):
+        mail = models.Mail({
+            'address': 'receiver%d@example.net' % i,
+            'subject': 'subject',
+            'body': 'body',
+            'tid': tid
+        })
+
+        if creation_date is not None:
+            mail.creation_date = creation_date
+
+        session.add(mail)
+
+
+@transact
+def get_mails(session):
+    return [(mail.attempts, mail.next_attempt_at) for mail in session.query(models.Mail)]
 
 
 class TestNotification(helpers.TestGLWithPopulatedDB):
@@ -20,7 +53,171 @@ class TestNotification(helpers.TestGLWithPopulatedDB):
         yield Delivery().run()
 
         notification = Notification()
-        notification.skip_sleep = True
         yield notification.run()
 
         yield self.test_model_count(models.Mail, 0)
+
+    def test_smtp_server_backoff(self):
+        notification = Notification()
+        server = ('mail.example.net', 587)
+
+        self.assertTrue(notification.is_smtp_server_available(server))
+
+        notification.update_smtp_server_backoff(server, Exception())
+        self.assertFalse(notification.is_smtp_server_available(server))
+        self.assertEqual(notification.smtp_backoff[server][0], 1)
+
+        notification.update_smtp_server_backoff(server, Exception())
+        self.assertEqual(notification.smtp_backoff[server][0], 2)
+
+        notification.update_smtp_server_backoff(server, None)
+        self.assertTrue(notification.is_smtp_server_available(server))
+
+    @inlineCallbacks
+    def test_notification_queue(self):
+        notification = Notification()
+        notification.last_full_scan = time.time()
+
+        itip_ids = yield get_new_receivertips_itips()
+        self.assertTrue(itip_ids)
+
+        # the elements not signaled on the queue are left to the full scan
+        self.state.notification_queue.clear()
+        yield notification.run()
+        x = yield get_new_receivertips_itips()
+        self.assertEqual(sorted(x), sorted(itip_ids))
+
+        for itip_id in set(itip_ids):
+            self.state.schedule_notification(itip_id)
+
+        yield notification.run()
+        x = yield get_new_receivertips_itips()
+        self.assertEqual(x, [])
+        self.assertEqual(len(self.state.notification_queue), 0)
+
+    @inlineCallbacks
+    def test_spool_emails_by_smtp_server(self):
+        yield models.delete(models.Mail)
+        for tid in [1, 2, 3]:
+            yield tw(db_add_mails, 2, tid)
+
+        # tenant 2 uses the SMTP settings of tenant 1 while tenant 3
+        # uses its own settings on the same server
+        self.patch(type(self.state), 'get_smtp_tid', lambda state, tid: 1 if tid == 2 else tid)
+        self.patch(type(self.state), 'get_smtp_server', lambda state, tid: ('mail.example.net', 587))
+
+        calls = []
+        inflight = []
+
+        def sendmails(state, tid, mails, concurrency=1):
+            calls.append((tid, sorted(mail['tid'] for mail in mails), len(inflight)))
+            inflight.append(tid)
+            return deferLater(reactor, 0.01, lambda: inflight.remove(tid) or ([mail['id'] for mail in mails], None))
+
+        self.patch(type(self.state), 'sendmails', sendmails)
+
+        yield Notification().spool_emails()
+
+        # the mails directed to the same server are sent one group after the other
+        self.assertEqual(sorted(calls), [(1, [1, 1, 2, 2], 0), (3, [3, 3], 0)])
+
+        yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_encrypt_mails(self):
+        encrypt_message = self.state.pgp_keyring.encrypt_message
+
+        def failing_encrypt_message(key, plaintext):
+            if plaintext == 'fail':
+                raise Exception("antani")
+
+            return encrypt_message(key, plaintext)
+
+        self.patch(self.state.pgp_keyring, 'encrypt_message', failing_encrypt_message)
+
+        yield models.delete(models.Mail)
+
+        generator = MailGenerator(self.state)
+        generator.pgp_mails = {
+            helpers.PGPKEYS['VALID_PGP_KEY1_PUB']: [models.Mail({'address': 'receiver%d@example.net' % i,
+                                                                 'subject': 'subject',
+                                                                 'body': body,
+                                                                 'tid': 1}) for i, body in enumerate(['body', 'fail', 'body'])]
+        }
+
+        yield tw(generator.encrypt_mails)
+
+        # the mail that could not be encrypted is discarded
+        mails = yield tw(lambda session: [x.body for x in session.query(models.Mail)])
+        self.assertEqual(len(mails), 2)
+        for body in mails:
+            self.assertTrue(body.startswith('-----BEGIN PGP MESSAGE-----'))
+
+    @inlineCallbacks
+    def test_claim_mails(self):
+        yield models.delete(models.Mail)
+        yield tw(db_add_mails, 5)
+
+        mails = yield claim_mails([1], 3, 5, 3600)
+        self.assertEqual(len(mails), 3)
+
+        # the claimed mails are postponed and not claimed again
+        mails = yield claim_mails([1], 3, 5, 3600)
+        self.assertEqual(len(mails), 2)
+
+        mails = yield claim_mails([1], 3, 5, 3600)
+        self.assertEqual(len(mails), 0)
+
+        now = datetime_now()
+        for attempts, next_attempt_at in (yield get_mails()):
+            self.assertEqual(attempts, 1)
+            self.assertTrue(now < next_attempt_at <= now + timedelta(seconds=5))
+
+        # the mails of the other tenants are not claimed
+        mails = yield claim_mails([2], 3, 5, 3600)
+        self.assertEqual(len(mails), 0)
+
+    @inlineCallbacks
+    def test_claim_mails_of_multiple_tenants(self):
+        yield models.delete(models.Mail)
+        yield tw(db_add_mails, 2, 1)
+        yield tw(db_add_mails, 2, 2)
+        yield tw(db_add_mails, 2, 3)
+
+        mails = yield claim_mails([1, 2], 10, 5, 3600)
+        self.assertEqual(sorted(mail['tid'] for mail in mails), [1, 1, 2, 2])
+
+        mails = yield claim_mails([3], 1, 5, 3600)
+        self.assertEqual(len(mails), 1)
+
+        mails = yield claim_mails([], 10, 5, 3600)
+        self.assertEqual(len(mails), 0)
+
+    @inlineCallbacks
+    def test_claim_mails_backoff(self):
+        yield models.delete(models.Mail)
+        yield tw(db_add_mails, 1)
+
+        for i in range(12):
+            yield tw(lambda session: session.query(models.Mail).update({'next_attempt_at': datetime_now()}))
+            mails = yield claim_mails([1], 1, 5, 3600)
+            self.assertEqual(len(mails), 1)
+
+        attempts, next_attempt_at = (yield get_mails())[0]
+        self.assertEqual(attempts, 12)
+        self.assertTrue(next_attempt_at <= datetime_now() + timedelta(seconds=3600))
+        self.assertTrue(next_attempt_at > datetime_now() + timedelta(seconds=3000))
+
+    @inlineCallbacks
+    def test_claim_mails_expiration(self):
+        yield models.delete(models.Mail)
+        yield tw(db_add_mails, 2, 1, datetime_now() - timedelta(seconds=Settings.mail_timetolive + 1))
+        yield tw(db_add_mails, 1)
+
+        yield tw(db_add_mails, 1, 2, datetime_now() - timedelta(seconds=Settings.mail_timetolive + 1))
+
+        mails = yield claim_mails([1], 10, 5, 3600)
+        self.assertEqual(len(mails), 1)
+
+        # the expired mails are discarded also for the tenants not being served
+        yield self.test_model_count(models.Mail, 1)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.file import db_mark_file_for_secure_deletion
+from globaleaks.jobs.secure_deletion import SecureDeletion
+from globaleaks.orm import tw
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+
+
+class TestSecureDeletion(helpers.TestGL):
+    @inlineCallbacks
+    def test_job(self):
+        filenames = ['file%d' % i for i in range(5)]
+
+        for filename in filenames:
+            with open(os.path.join(Settings.attachments_path, filename), 'wb') as f:
+                f.write(os.urandom(10000))
+
+            yield tw(db_mark_file_for_secure_deletion, Settings.attachments_path, filename)
+
+        yield self.test_model_count(models.SecureFileDelete, 5)
+
+        job = SecureDeletion()
+        job.batch_size = 2
+        yield job.run()
+
+        yield self.test_model_count(models.SecureFileDelete, 0)
+
+        for filename in filenames:
+            self.assertFalse(os.path.exists(os.path.join(Settings.attachments_path, filename)))
+
+        self.assertTrue(job.progress['files'] >= 5)
+        self.assertTrue(job.progress['bytes'] >= 5 * 10000)
@@ -6,6 +6,7 @@ from globaleaks.db import refresh_memory_variables
 from globaleaks.handlers.admin.node import db_update_enabled_languages
 from globaleaks.orm import tw
 from globaleaks.rest import api
+from globaleaks.rest.dispatcher import literal_prefix
 from globaleaks.state import State
 from globaleaks.tests.helpers import TestGL, forge_request
 
@@ -127,3 +128,58 @@ class TestAPI(TestGL):
         self.assertEqual(request.responseCode, 302)
         self.assertEqual(request.responseHeaders.getRawHeaders('location')[0], 'https://www.globaleaks.org/public')
         State.tenant_cache[1].https_enabled = False
+
+
+class TestRouteDispatcher(TestGL):
+    def setUp(self):
+        self.api = api.APIResourceWrapper()
+
+    def linear_match(self, path):
+        for regexp, handler, args in self.api._registry:
+            match = regexp.match(path)
+            if match:
+                return handler, args, match.groups()
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix('^/api/public$'), ('/api/public', True))
+        self.assertEqual(literal_prefix('^/api/rtip/([a-f0-9]+)/comments$'), ('/api/rtip/', False))
+        self.assertEqual(literal_prefix(r'^/api/admin/auditlog/stats/(\d+)$'), ('/api/admin/auditlog/stats/', False))
+        self.assertEqual(literal_prefix(r'^/robots\.txt$'), ('/robots.txt', True))
+        self.assertEqual(literal_prefix('^/api/files?$'), ('/api/file', False))
+        self.assertEqual(literal_prefix('^/admin|/login$'), ('', False))
+        self.assertEqual(literal_prefix('^(/admin|/login)$'), ('', False))
+
+    def test_equivalence_with_ordered_registry(self):
+        uuid = '8a3c6f2e-4b1d-4e9a-9c7f-1d2e3f4a5b6c'
+
+        suffixes = ['', '/', '\n', 'x', '/x', '.js', uuid, uuid + '/', uuid + 'x',
+                    uuid + '/comments', uuid + '/messages', uuid + '/export', uuid + '/img',
+                    uuid + '/wbfile', uuid + '/identityaccessrequests',
+                    uuid + '/provideidentityinformation', uuid + '/update',
+                    uuid + '/substatuses', uuid + '/substatuses/' + uuid,
+                    'closed/substatuses', 'closed/substatuses/' + uuid,
+                    'users/' + uuid + '/img', 'contexts/' + uuid + '/img',
+                    '2', '12345678901234567890', 'en', 'it', 'zz', 'logo', 'css', 'cert', 'csr',
+                    'default', 'duplicate', 'run', 'tls/files/chain', 'a' * 43, 'a' * 64, 'a' * 64 + '/file',
+                    'admin', 'login', 'submission', 'index.html', 'js/scripts.min.js', 'a b', '@x',
+                    '.txt', '.xml', '.well-known/acme-challenge/' + 'a' * 43]
+
+        prefixes = {'/', ''}
+        for regexp, _, _ in self.api._registry:
+            prefix, _ = literal_prefix(regexp.pattern)
+            prefixes.add(prefix)
+            prefixes.add(prefix[:-1])
+            prefixes.add(prefix.rstrip('/').rsplit('/', 1)[0] + '/')
+
+        selected = set()
+        for prefix in prefixes:
+            for suffix in suffixes:
+                path = prefix + suffix
+
+                expected = self.linear_match(path)
+                self.assertEqual(self.api._dispatcher.match(path), expected, path)
+
+                if expected is not None:
+                    selected.add(expected[0])
+
+        self.assertEqual(selected, set(x[1] for x in self.api._registry))
@@ -7,11 +7,13 @@ for each version one an empty and a populated db must be sessiond in directories
 """
 import os
 import shutil
+import sqlite3
 
 from twisted.trial import unittest
 
 from globaleaks import DATABASE_VERSION, FIRST_DATABASE_VERSION_SUPPORTED, models
 from globaleaks.db import update_db
+from globaleaks.db.migrations.update import MigrationBase
 from globaleaks.orm import set_db_uri
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
@@ -52,6 +54,24 @@ class TestMigrationRoutines(unittest.TestCase):
 
         self.assertNotEqual(ret, -1)
 
+    def preconditions_52(self):
+        with sqlite3.connect(os.path.join(Settings.working_path, 'globaleaks.db')) as conn:
+            conn.execute("INSERT INTO mail (id, tid, creation_date, address, subject, body, processing_attempts) "
+                         "VALUES ('mail', 1, '2020-01-01 00:00:00', 'receiver@example.net', 'subject', 'body', 10000)")
+
+    def postconditions_52(self):
+        with sqlite3.connect(os.path.join(Settings.working_path, 'globaleaks.db')) as conn:
+            self.assertEqual(conn.execute("SELECT attempts FROM mail WHERE id = 'mail'").fetchall(), [(0,)])
+
+    def test_db_migration_in_batches(self):
+        self.patch(MigrationBase, 'bulk_batch_size', 2)
+        self._test(path, 44)
+
+    def test_db_migration_without_bulk_copy(self):
+        self.patch(MigrationBase, 'bulk_migration', False)
+        self._test(path, 44)
+
+
 def test(path, version):
     return lambda self: self._test(path, version)
 
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
-from globaleaks.models import Tenant
-from globaleaks.orm import get_session, transact
+import sqlite3
+
+from globaleaks.models import Mail, Tenant
+from sqlalchemy.exc import OperationalError
+
+from globaleaks import orm
+from globaleaks.orm import get_session, transact, transact_batch, transact_ro, WriteScheduler
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
 
@@ -24,6 +29,34 @@ class TestORM(helpers.TestGL):
         self.db_add_config(session)
         raise Exception("antani")
 
+    @transact_batch
+    def _transact_batch_with_success(self, session):
+        self.db_add_config(session)
+
+    @transact_ro
+    def _transact_ro_count(self, session):
+        return session.query(Tenant).count()
+
+    @transact_ro
+    def _transact_ro_with_write(self, session):
+        self.db_add_config(session)
+        session.flush()
+
+    @transact_ro
+    def _verify_journal_mode(self, session):
+        return session.execute("PRAGMA journal_mode").fetchone()[0]
+
+    @transact
+    def _transact_check_write_lock(self, session):
+        session.query(Tenant).count()
+
+        # the write lock is acquired as soon as the transaction begins
+        conn = sqlite3.connect(orm.get_writer_engine().url.database, timeout=0)
+        try:
+            self.assertRaises(sqlite3.OperationalError, conn.execute, 'BEGIN IMMEDIATE')
+        finally:
+            conn.close()
+
     def db_add_config(self, session):
         session.add(Tenant())
 
@@ -56,3 +89,112 @@ class TestORM(helpers.TestGL):
             self.assertTrue(getattr(session, 'query'))
 
         return transaction()
+
+    def test_writer_engine(self):
+        pool = orm.get_writer_engine().pool
+        self.assertEqual(pool.size(), 1)
+        self.assertEqual(pool._max_overflow, 0)
+
+        return self._transact_check_write_lock()
+
+    @inlineCallbacks
+    def test_transact_ro(self):
+        count1 = yield self._transact_ro_count()
+
+        yield self._transact_with_success()
+
+        count2 = yield self._transact_ro_count()
+
+        self.assertEqual(count1 + 1, count2)
+
+        journal_mode = yield self._verify_journal_mode()
+        self.assertEqual(journal_mode, 'wal')
+
+    @inlineCallbacks
+    def test_transact_ro_with_write(self):
+        yield self.assertFailure(self._transact_ro_with_write(), OperationalError)
+
+        count = yield self._transact_ro_count()
+        self.assertEqual(count, 1)
+
+    @inlineCallbacks
+    def test_transact_batch(self):
+        write_scheduler = WriteScheduler()
+        write_scheduler.start()
+        orm.set_write_scheduler(write_scheduler)
+
+        try:
+            yield self._transact_batch_with_success()
+            yield self._transact_batch_with_success()
+        finally:
+            orm.set_write_scheduler(None)
+            write_scheduler.stop()
+
+        count = yield self._transact_ro_count()
+        self.assertEqual(count, 3)
+
+    @inlineCallbacks
+    def test_write_scheduler_group_commit(self):
+        def failure(session):
+            self.db_add_config(session)
+            raise Exception("antani")
+
+        batch = [(None, self.db_add_config, (), {}),
+                 (None, failure, (), {}),
+                 (None, self.db_add_config, (), {})]
+
+        write_scheduler = WriteScheduler()
+        results = write_scheduler.execute(batch)
+
+        self.assertEqual([x[1] for x in results], [True, False, True])
+        self.assertEqual(write_scheduler.batches, 1)
+        self.assertEqual(write_scheduler.transactions, 3)
+
+        count = yield self._transact_ro_count()
+        self.assertEqual(count, 3)
+
+    @inlineCallbacks
+    def test_write_scheduler_batch_commit_failure(self):
+        def failure(session):
+            # violates a deferred foreign key checked only at commit
+            session.add(Mail({'tid': 1000, 'address': 'a@b.c', 'subject': '', 'body': ''}))
+
+        batch = [(None, self.db_add_config, (), {}),
+                 (None, failure, (), {}),
+                 (None, self.db_add_config, (), {})]
+
+        write_scheduler = WriteScheduler()
+        results = write_scheduler.execute(batch)
+
+        self.assertEqual([x[1] for x in results], [True, False, True])
+        self.assertEqual(write_scheduler.batches, 4)
+
+        count = yield self._transact_ro_count()
+        self.assertEqual(count, 3)
+
+    @inlineCallbacks
+    def test_write_scheduler_recovers_from_errors(self):
+        get_writer_engine = orm.get_writer_engine
+        failures = [Exception("antani")]
+
+        def failing_get_writer_engine():
+            if failures:
+                raise failures.pop()
+
+            return get_writer_engine()
+
+        self.patch(orm, 'get_writer_engine', failing_get_writer_engine)
+
+        write_scheduler = WriteScheduler()
+        write_scheduler.start()
+        orm.set_write_scheduler(write_scheduler)
+
+        try:
+            yield self.assertFailure(self._transact_batch_with_success(), Exception)
+            yield self._transact_batch_with_success()
+        finally:
+            orm.set_write_scheduler(None)
+            write_scheduler.stop()
+
+        count = yield self._transact_ro_count()
+        self.assertEqual(count, 2)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from twisted.trial import unittest
+
+from globaleaks.utils.counters import EventCounters
+
+
+class Event(object):
+    def __init__(self, event_type):
+        self.event_type = event_type
+
+
+class TestEventCounters(unittest.TestCase):
+    def test_sliding_window(self):
+        counters = EventCounters(bucket_size=60, buckets=60, sample_size=10)
+
+        # one failed login per minute for two hours
+        for i in range(120):
+            counters.add(Event('failed_logins'), now=i * 60)
+
+        counters.add(Event('successful_logins'), now=119 * 60)
+
+        now = 119 * 60 + 30
+        self.assertEqual(counters.count('failed_logins', now=now), 60)
+        self.assertEqual(counters.count('failed_logins', 600, now=now), 10)
+        self.assertEqual(counters.count('failed_logins', 1, now=now), 1)
+        self.assertEqual(counters.count('completed_submissions', now=now), 0)
+        self.assertEqual(counters.counts(3600, now=now), {'failed_logins': 60, 'successful_logins': 1})
+
+        # the buckets of the past rounds of the ring are not counted
+        self.assertEqual(counters.count('failed_logins', now=now + 1800), 30)
+        self.assertEqual(counters.counts(now=now + 7200), {})
+
+        self.assertEqual(len(counters.sample), 10)
+        self.assertEqual(counters.collect(), {'failed_logins': 120, 'successful_logins': 1})
+        self.assertEqual(counters.collect(), {})
@@ -76,6 +76,26 @@ class TestCryptoUtils(helpers.TestGL):
         self.assertFalse(filecmp.cmp(a, b, False))
         self.assertTrue(filecmp.cmp(a, c, False))
 
+    def test_seek_and_read_file(self):
+        prv_key, pub_key = GCE.generate_keypair()
+        b = os.path.join(Settings.tmp_path, 'b')
+
+        data = os.urandom(1000)
+
+        with GCE.streaming_encryption_open('ENCRYPT', pub_key, b) as seo:
+            for i in range(0, len(data), 100):
+                seo.encrypt_chunk(data[i:i + 100], i + 100 >= len(data))
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, b) as seo:
+            self.assertEqual(seo.get_plaintext_size(), len(data))
+
+            for offset in (0, 1, 99, 100, 550, 999, 1000):
+                seo.seek(offset)
+                self.assertEqual(seo.read(), data[offset:])
+
+            seo.seek(250)
+            self.assertEqual(seo.read(10), data[250:260])
+
     def test_recovery_key(self):
         prv_key, _ = GCE.generate_keypair()
         bck_key, rec_key = GCE.generate_recovery_key(prv_key)
@@ -0,0 +1,32 @@
+from nacl.exceptions import CryptoError
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from globaleaks.tests import helpers
+from globaleaks.utils.crypto import GCE
+from globaleaks.utils.decryption import DecryptionPool
+
+
+class TestDecryptionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = DecryptionPool(concurrency=2, chunk_size=3)
+        self.pool.set_thread_pool(helpers.FakeThreadPool())
+
+    @inlineCallbacks
+    def test_map(self):
+        x = yield self.pool.map(lambda x: x * 2, list(range(10)))
+        self.assertEqual(x, [x * 2 for x in range(10)])
+
+        x = yield self.pool.map(lambda x: x, [])
+        self.assertEqual(x, [])
+
+    @inlineCallbacks
+    def test_decrypt(self):
+        prv_key, pub_key = GCE.generate_keypair()
+
+        items = [GCE.asymmetric_encrypt(pub_key, str(i)) for i in range(10)]
+
+        x = yield self.pool.decrypt(prv_key, items)
+        self.assertEqual(x, [str(i).encode() for i in range(10)])
+
+        yield self.assertFailure(self.pool.decrypt(prv_key, items + [b'\0' * 64]), CryptoError)
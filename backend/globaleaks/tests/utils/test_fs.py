@@ -4,7 +4,7 @@ import os
 from globaleaks.rest import errors
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
-from globaleaks.utils.fs import directory_traversal_check
+from globaleaks.utils.fs import directory_traversal_check, overwrite_and_remove
 
 
 class TestFilesystemAccess(helpers.TestGL):
@@ -18,3 +18,16 @@ class TestFilesystemAccess(helpers.TestGL):
     def test_directory_traversal_check_allowed(self):
         valid_access = os.path.join(Settings.files_path, "valid.txt")
         directory_traversal_check(Settings.files_path, valid_access)
+
+    def test_overwrite_and_remove(self):
+        path = os.path.join(Settings.tmp_path, 'file')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 100000)
+
+        blocks = []
+        written = overwrite_and_remove(path, block_size=4096, throttle=blocks.append)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(written >= 100000)
+        self.assertEqual(sum(blocks), written)
+        self.assertTrue(all(x <= 4096 for x in blocks))
@@ -21,3 +21,27 @@ class TestIPUtils(unittest.TestCase):
         # Now confirm we properly fail when garbage is appended
         ip_str = ip_str + ",abcdef"
         self.assertEqual(ip.parse_csv_ip_ranges_to_ip_networks(ip_str), [])
+
+    def test_ip_filter(self):
+        ip_filter = ip.IPFilter("192.168.1.1,10.0.0.0/8,10.1.0.0/16,11.0.0.0/8,::1,2001:db8::/32")
+
+        for x in ["192.168.1.1", "10.0.0.0", "10.255.255.255", "11.1.2.3", "::1", "2001:db8::1"]:
+            self.assertTrue(ip.check_ip(x, ip_filter))
+
+        for x in ["192.168.1.2", "9.255.255.255", "12.0.0.0", "::2", "2001:db9::1", "garbage"]:
+            self.assertFalse(ip.check_ip(x, ip_filter))
+
+        # Adjacent networks are merged in a single interval
+        self.assertEqual(ip_filter.starts[4], [int(ipaddress.ip_address("10.0.0.0")),
+                                               int(ipaddress.ip_address("192.168.1.1"))])
+
+        # Strings are still accepted by check_ip
+        self.assertTrue(ip.check_ip(b"10.1.1.1", "10.0.0.0/8"))
+        self.assertFalse(ip.check_ip("10.1.1.1", "10.0.0.0/8,garbage"))
+
+    def test_ip_filter_large(self):
+        ip_filter = ip.IPFilter(",".join("10.%d.%d.0/24" % (i // 256, i % 256) for i in range(0, 20000, 2)))
+
+        self.assertTrue(ip.check_ip("10.0.0.1", ip_filter))
+        self.assertFalse(ip.check_ip("10.0.1.1", ip_filter))
+        self.assertTrue(ip.check_ip("10.78.30.254", ip_filter))
@@ -0,0 +1,41 @@
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from globaleaks.rest import errors
+from globaleaks.tests import helpers
+from globaleaks.utils.crypto import GCE
+from globaleaks.utils.kdf import KDFPool
+
+
+class TestKDFPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = KDFPool(concurrency=2, memory_budget=1 << 30, queue_limit=2)
+        self.pool.set_thread_pool(helpers.FakeThreadPool())
+
+    @inlineCallbacks
+    def test_hash_password(self):
+        x = yield self.pool.hash_password(helpers.VALID_PASSWORD1, helpers.VALID_SALT1)
+        self.assertEqual(x, helpers.VALID_HASH1)
+
+        x = yield self.pool.check_password('ARGON2', helpers.VALID_PASSWORD1, helpers.VALID_SALT1, helpers.VALID_HASH1)
+        self.assertTrue(x)
+
+        x = yield self.pool.derive_key(helpers.VALID_PASSWORD1, helpers.VALID_SALT1)
+        self.assertEqual(x, helpers.USER_KEY)
+
+        metrics = self.pool.get_metrics()
+        self.assertEqual(metrics['executed'], 3)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+    def test_workers_bounded_by_memory_budget(self):
+        memory = 1 << GCE.ALGORITM_CONFIGURATION['ARGON2']['MEMLIMIT']
+
+        self.assertEqual(KDFPool(8, memory * 3).get_workers(), 3)
+        self.assertEqual(KDFPool(2, memory * 3).get_workers(), 2)
+        self.assertEqual(KDFPool(8, 0).get_workers(), 1)
+
+    def test_admission_control(self):
+        self.pool.pending = self.pool.queue_limit
+
+        return self.assertFailure(self.pool.hash_password(helpers.VALID_PASSWORD1, helpers.VALID_SALT1),
+                                  errors.ServiceOverloaded)
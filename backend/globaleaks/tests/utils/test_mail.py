@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from twisted.internet import defer, reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.mail import smtp
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial import unittest
+from zope.interface import implementer
+
+from globaleaks.utils import mail
+
+
+@implementer(smtp.IMessage)
+class Message(object):
+    def __init__(self, server, recipient):
+        self.server = server
+        self.recipient = recipient
+        self.lines = []
+
+    def lineReceived(self, line):
+        self.lines.append(line)
+
+    def eomReceived(self):
+        if self.recipient == b'rejected':
+            return defer.fail(Exception('rejected'))
+
+        self.server.messages.append(b'\n'.join(self.lines))
+        return defer.succeed(None)
+
+    def connectionLost(self):
+        pass
+
+
+@implementer(smtp.IMessageDelivery)
+class MessageDelivery(object):
+    def __init__(self, server):
+        self.server = server
+
+    def receivedHeader(self, helo, origin, recipients):
+        return b'Received: test'
+
+    def validateFrom(self, helo, origin):
+        return origin
+
+    def validateTo(self, user):
+        if user.dest.local == b'refused':
+            raise smtp.SMTPBadRcpt(user)
+
+        return lambda: Message(self.server, user.dest.local)
+
+
+class SMTPServerFactory(smtp.SMTPFactory):
+    def __init__(self):
+        smtp.SMTPFactory.__init__(self)
+        self.connections = 0
+        self.messages = []
+        self.delivery = MessageDelivery(self)
+
+    def buildProtocol(self, addr):
+        self.connections += 1
+        p = smtp.ESMTP()
+        p.factory = self
+        p.delivery = self.delivery
+        return p
+
+
+class TestSendmails(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPServerFactory()
+        self.port = reactor.listenTCP(0, self.server, interface='127.0.0.1')
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    def sendmails(self, mails, concurrency=1):
+        return mail.sendmails(1, '127.0.0.1', self.port.getHost().port, 'PLAIN', False, '', '',
+                              'GlobaLeaks', 'notifications@example.net', mails, concurrency, False)
+
+    @inlineCallbacks
+    def test_sendmails_reusing_connection(self):
+        mails = [{'id': i, 'address': 'user%d@example.net' % i, 'subject': 'subject', 'body': 'body'} for i in range(5)]
+
+        sent, error = yield self.sendmails(mails)
+
+        self.assertEqual(sorted(sent), list(range(5)))
+        self.assertIsNone(error)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    @inlineCallbacks
+    def test_sendmails_concurrently(self):
+        mails = [{'id': i, 'address': 'user%d@example.net' % i, 'subject': 'subject', 'body': 'body'} for i in range(6)]
+
+        sent, error = yield self.sendmails(mails, 3)
+
+        self.assertEqual(sorted(sent), list(range(6)))
+        self.assertEqual(self.server.connections, 3)
+
+    @inlineCallbacks
+    def test_sendmails_with_refused_recipient(self):
+        mails = [{'id': 0, 'address': 'refused@example.net', 'subject': 'subject', 'body': 'body'},
+                 {'id': 1, 'address': 'user@example.net', 'subject': 'subject', 'body': 'body'}]
+
+        sent, error = yield self.sendmails(mails)
+
+        self.assertEqual(sent, [1])
+        self.assertIsNone(error)
+
+    @inlineCallbacks
+    def test_sendmails_with_refused_message(self):
+        mails = [{'id': 0, 'address': 'rejected@example.net', 'subject': 'subject', 'body': 'body'},
+                 {'id': 1, 'address': 'user@example.net', 'subject': 'subject', 'body': 'body'}]
+
+        sent, error = yield self.sendmails(mails)
+
+        self.assertEqual(sent, [1])
+        self.assertIsNone(error)
+        self.assertEqual(self.server.connections, 1)
+        self.flushLoggedErrors(Exception)
+
+    def test_mail_error_does_not_fail_the_connection(self):
+        queue = [{'id': 0, 'address': 'user@example.net', 'subject': 'subject', 'body': 'body'}]
+        factory = mail.MultipleMailsSenderFactory(None, None, 'GlobaLeaks', 'notifications@example.net',
+                                                  queue, None, False, 'PLAIN', 30)
+        transport = StringTransport()
+        p = factory.buildProtocol(None)
+        p.makeConnection(transport)
+        p._from = p.getMailFrom()
+
+        p.sendError(smtp.SMTPDeliveryError(554, b'Transaction failed'))
+        self.assertIsNone(factory.error)
+        self.assertIsNone(p.current)
+        self.assertTrue(transport.value().endswith(b'RSET\r\n'))
+
+        p._from = p.getMailFrom()
+        p.sendError(smtp.AUTHDeclinedError(535, b'Authentication failed'))
+        self.assertIsNotNone(factory.error)
+
+        p.connectionLost()
+
+    @inlineCallbacks
+    def test_sendmails_with_unreachable_server(self):
+        port = self.port.getHost().port
+        yield self.port.stopListening()
+
+        sent, error = yield mail.sendmails(1, '127.0.0.1', port, 'PLAIN', False, '', '',
+                                           'GlobaLeaks', 'notifications@example.net',
+                                           [{'id': 0, 'address': 'user@example.net', 'subject': 'subject', 'body': 'body'}],
+                                           1, False)
+
+        self.assertEqual(sent, [])
+        self.assertIsNotNone(error)
+
+        self.port = reactor.listenTCP(0, self.server, interface='127.0.0.1')
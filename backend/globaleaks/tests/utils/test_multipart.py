@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.trial import unittest
+
+from globaleaks.utils.multipart import MultipartParser, parse_content_disposition, parse_header
+
+
+def forge_multipart_body(boundary, fields, file_content):
+    body = b''
+
+    for name, value in fields:
+        body += b'--' + boundary + b'\r\n'
+        body += b'Content-Disposition: form-data; name="' + name + b'"\r\n\r\n'
+        body += value + b'\r\n'
+
+    body += b'--' + boundary + b'\r\n'
+    body += b'Content-Disposition: form-data; name="file"; filename="blob"\r\n'
+    body += b'Content-Type: application/octet-stream\r\n\r\n'
+    body += file_content + b'\r\n'
+    body += b'--' + boundary + b'--\r\n'
+
+    return body
+
+
+class TestMultipartParser(unittest.TestCase):
+    def parse(self, body, boundary, step):
+        parts = []
+
+        def part_begin(headers):
+            parts.append([parse_content_disposition(headers), []])
+
+        def part_data(data):
+            parts[-1][1].append(data)
+
+        def part_end():
+            parts[-1][1] = b''.join(parts[-1][1])
+
+        parser = MultipartParser(boundary, part_begin, part_data, part_end)
+
+        for i in range(0, len(body), step):
+            parser.feed(body[i:i + step])
+
+            # only a tail of the size of the delimiter is kept in memory
+            self.assertLessEqual(len(parser.buffer), max(step, 1024) + len(parser.delimiter))
+
+        parser.close()
+
+        return parts
+
+    def test_parse(self):
+        boundary = b'----WebKitFormBoundary7MA4YWxkTrZu0gW'
+        file_content = os.urandom(100000) + b'\r\n--' + boundary[:-1]
+        fields = [(b'flowChunkNumber', b'1'), (b'flowIdentifier', b'123-blob')]
+
+        body = forge_multipart_body(boundary, fields, file_content)
+
+        for step in (1, 7, 1000, len(body)):
+            parts = self.parse(body, boundary, step)
+            self.assertEqual(parts, [[('flowChunkNumber', None), b'1'],
+                                     [('flowIdentifier', None), b'123-blob'],
+                                     [('file', 'blob'), file_content]])
+
+    def test_incomplete_body(self):
+        boundary = b'xyz'
+        body = forge_multipart_body(boundary, [], b'content')
+
+        parser = MultipartParser(boundary, lambda x: None, lambda x: None, lambda: None)
+        parser.feed(body[:-10])
+        self.assertRaises(ValueError, parser.close)
+
+    def test_invalid_delimiter(self):
+        parser = MultipartParser(b'xyz', lambda x: None, lambda x: None, lambda: None)
+        self.assertRaises(ValueError, parser.feed, b'--xyzinvalid')
+
+    def test_parse_header(self):
+        self.assertEqual(parse_header('multipart/form-data; boundary=----xyz'),
+                         ('multipart/form-data', {'boundary': '----xyz'}))
+        self.assertEqual(parse_header(''), ('', {}))
+
+    def test_parse_content_disposition(self):
+        self.assertEqual(parse_content_disposition({'content-disposition': 'form-data; name="flowChunkNumber"'}),
+                         ('flowChunkNumber', None))
+        self.assertEqual(parse_content_disposition({'content-disposition': 'form-data; name="file"; filename="a;\\"b\\".txt"'}),
+                         ('file', 'a;"b".txt'))
+        self.assertEqual(parse_content_disposition({'content-disposition': "form-data; name=file; filename*=UTF-8''%e2%82%ac.txt"}),
+                         ('file', '€.txt'))
+        self.assertEqual(parse_content_disposition({}), ('', None))
@@ -1,9 +1,10 @@
 # -*- coding: utf-8
+import gc
 import os
 from datetime import datetime
 
 from globaleaks.tests import helpers
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import get_armored_key_fingerprint, PGPContext, PGPKeyring
 
 
 class TestPGP(helpers.TestGL):
@@ -55,3 +56,48 @@ class TestPGP(helpers.TestGL):
 
         self.assertEqual(pgpctx.load_key(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB'])['expiration'],
                          datetime.utcfromtimestamp(1391012793))
+
+
+class TestPGPKeyring(helpers.TestGL):
+    def test_load_key_once(self):
+        keyring = PGPKeyring()
+
+        k1 = keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        pgpctx = keyring.pgpctx
+
+        self.patch(pgpctx, 'load_key', lambda key: self.fail("Key imported again"))
+
+        k2 = keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+
+        self.assertEqual(k1, k2)
+        self.assertEqual(len(keyring.keys), 1)
+        self.assertIs(keyring.pgpctx, pgpctx)
+
+    def test_max_keys(self):
+        keyring = PGPKeyring()
+        keyring.max_keys = 1
+
+        keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        pgpctx = keyring.pgpctx
+
+        # the keyring is recreated once full
+        keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY2_PUB'])
+        self.assertIsNot(keyring.pgpctx, pgpctx)
+        self.assertEqual(len(keyring.keys), 1)
+
+        # the previous keyring is removed once no more in use
+        gnupghome = pgpctx.gnupg.gnupghome
+        del pgpctx
+        gc.collect()
+        self.assertFalse(os.path.exists(gnupghome))
+
+        gnupghome = keyring.pgpctx.gnupg.gnupghome
+        keyring.close()
+        self.assertFalse(os.path.exists(gnupghome))
+
+    def test_get_armored_key_fingerprint(self):
+        self.assertEqual(get_armored_key_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']),
+                         'BFB3C82D1B5F6A94BDAC55C6E70460ABF9A4C8C1')
+        self.assertEqual(get_armored_key_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY2_PUB']),
+                         'CECDC5D2B721900E65639268846C82DB1F9B45E2')
+        self.assertIsNone(get_armored_key_fingerprint('antani'))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8
+import os
+import time
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.securedelete import RateLimiter, SecureDeletionWorker
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_consume(self):
+        limiter = RateLimiter(1000, 100)
+
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.consume(100)
+
+        # the burst is consumed immediately and the rest at the rate
+        self.assertTrue(time.monotonic() - start >= 0.19)
+
+    def test_unlimited(self):
+        limiter = RateLimiter(0)
+
+        start = time.monotonic()
+        limiter.consume(1 << 30)
+        self.assertTrue(time.monotonic() - start < 0.1)
+
+
+class TestSecureDeletionWorker(helpers.TestGL):
+    @inlineCallbacks
+    def test_delete(self):
+        worker = SecureDeletionWorker(block_size=4096)
+        worker.set_thread_pool(helpers.FakeThreadPool())
+
+        paths = []
+        for i in range(3):
+            path = os.path.join(Settings.tmp_path, 'file%d' % i)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10000)
+
+            paths.append(path)
+
+        ret = yield worker.delete(paths)
+
+        self.assertEqual(ret, paths)
+
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+        stats = worker.get_stats()
+        self.assertEqual(stats['files'], 3)
+        self.assertTrue(stats['bytes'] >= 3 * 10000)
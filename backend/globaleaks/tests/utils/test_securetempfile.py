@@ -16,3 +16,17 @@ class TestSecureTemporaryFiles(helpers.TestGL):
         with a.open('r') as f:
             for x in range(1000):
                 self.assertTrue(antani == f.read(10).decode())
+
+    def test_truncate(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        with a.open('w') as f:
+            f.write(b'a' * 1000)
+            f.write(b'b' * 1000)
+            f.truncate(1003)
+            f.write(b'c' * 1000)
+            f.finalize_write()
+
+        self.assertEqual(a.size, 2003)
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), b'a' * 1000 + b'b' * 3 + b'c' * 1000)
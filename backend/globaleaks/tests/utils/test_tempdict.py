@@ -1,4 +1,10 @@
+import os
+
+from globaleaks.sessions import SessionsFactory
+from globaleaks.settings import Settings
+from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.utils.securetempfile import SecureTemporaryFile
 from globaleaks.utils.tempdict import TempDict
 
 
@@ -9,6 +15,12 @@ class TestObject(object):
         self.id = obj_id
 
 
+class IndexedTempDict(TempDict):
+    indexes = {
+        'id': lambda item: item.id
+    }
+
+
 def expireCallback(self):
     TestObject.callbacks_count += 1
     if self.id != TestObject.callbacks_count:
@@ -35,3 +47,131 @@ class TestTempDict(helpers.TestGL):
         self.assertEqual(len(xxx), 0)
 
         self.assertEqual(TestObject.callbacks_count, timeout)
+
+    def test_touch(self):
+        xxx = TempDict(timeout=10)
+
+        for x in range(1000):
+            xxx.set(x, TestObject(x))
+
+        # a single call is scheduled independently of the number of entries
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 1)
+
+        self.test_reactor.advance(5.5)
+
+        for x in range(500):
+            xxx.get(x)
+
+        del xxx[999]
+        xxx.pop(998)
+        xxx.delete(997)
+
+        self.test_reactor.advance(5)
+        self.assertEqual(len(xxx), 500)
+        self.assertEqual(xxx[0].expireTime, 15.5)
+
+        self.test_reactor.advance(6)
+        self.assertEqual(len(xxx), 0)
+        self.assertEqual(xxx.slots, {})
+        self.assertEqual(xxx.wheel, {})
+        self.assertEqual(self.test_reactor.getDelayedCalls(), [])
+
+    def test_expire_callback_accessing_the_bucket(self):
+        xxx = TempDict(timeout=10)
+
+        for x in range(4):
+            xxx.set(x, TestObject(x))
+
+        def expire(item):
+            # touch and delete the other keys expiring on the same tick
+            if item.id == 0:
+                xxx.get(1)
+                xxx.delete(2)
+
+        xxx.expireCallback = expire
+
+        self.test_reactor.advance(10)
+        self.assertEqual(list(xxx), [1])
+
+        self.test_reactor.advance(10)
+        self.assertEqual(len(xxx), 0)
+        self.assertEqual(xxx.wheel, {})
+
+
+class TestTempDictIndexes(helpers.TestGL):
+    def test_sessions_index(self):
+        sessions = SessionsFactory(timeout=60)
+
+        for i in range(50000):
+            sessions.new(1 + i % 10, str(i), 1, 'receiver', False, False, '', '')
+
+        self.assertEqual(len(sessions), 50000)
+
+        # a new session of a user revokes the previous one
+        for i in range(0, 50000, 5):
+            session = sessions.new(1 + i % 10, str(i), 1, 'receiver', False, False, '', '')
+            self.assertEqual(sessions.lookup('user', (1 + i % 10, str(i))), [session.id])
+
+        self.assertEqual(len(sessions), 50000)
+
+        session = sessions.regenerate(session.id)
+        self.assertEqual(sessions.lookup('user', (session.tid, session.user_id)), [session.id])
+
+        sessions.revoke(session.tid, session.user_id)
+        self.assertEqual(sessions.lookup('user', (session.tid, session.user_id)), [])
+        self.assertEqual(len(sessions), 49999)
+
+        self.test_reactor.advance(61)
+        self.assertEqual(len(sessions), 0)
+        self.assertEqual(sessions.index, {'user': {}})
+
+    def test_sessions_regenerate(self):
+        sessions = SessionsFactory(timeout=60)
+
+        session = sessions.new(1, 'user', 1, 'receiver', False, False, '', '')
+        sessions.regenerate(session.id)
+        session = sessions.new(1, 'user', 1, 'receiver', False, False, '', '')
+
+        self.assertEqual(list(sessions), [session.id])
+        self.assertEqual(sessions.lookup('user', (1, 'user')), [session.id])
+
+    def test_mapping_methods(self):
+        xxx = IndexedTempDict(timeout=10)
+
+        for x in range(4):
+            xxx.set(x, TestObject(x))
+
+        xxx.update({4: TestObject(4)}, x5=TestObject(5))
+        self.assertEqual(xxx.lookup('id', 5), ['x5'])
+
+        self.assertEqual(xxx.setdefault(0, None).id, 0)
+        self.assertEqual(xxx.setdefault(6, TestObject(6)).id, 6)
+        self.assertEqual(xxx.lookup('id', 6), [6])
+
+        self.assertEqual(xxx.pop(0).id, 0)
+        self.assertIsNone(xxx.pop(0, None))
+        self.assertRaises(KeyError, xxx.pop, 0)
+        self.assertEqual(xxx.popitem(last=False)[0], 1)
+        self.assertEqual(xxx.popitem()[0], 6)
+
+        self.assertEqual(sorted(xxx.slots), [2, 3])
+        self.assertEqual(xxx.lookup('id', 0), [])
+        self.assertEqual(xxx.lookup('id', 1), [])
+        self.assertEqual(xxx.lookup('id', 6), [])
+        self.assertEqual(sorted(xxx.indexed_values, key=str), [2, 3, 4, 'x5'])
+
+    def test_uploads_index(self):
+        State.TempUploadFiles.clear()
+
+        files = []
+        for i in range(10000):
+            f = SecureTemporaryFile(Settings.tmp_path)
+            State.TempUploadFiles.set(str(i), f)
+            files.append(f)
+
+        for f in files[::-1]:
+            self.assertIs(State.get_tmp_file_by_name(os.path.basename(f.filepath)), f)
+
+        self.assertEqual(len(State.TempUploadFiles), 0)
+        self.assertEqual(State.TempUploadFiles.index, {'filename': {}})
+        self.assertIsNone(State.get_tmp_file_by_name('unexistent'))
@@ -4,7 +4,7 @@ from globaleaks.handlers import admin, rtip, user
 from globaleaks.jobs.delivery import Delivery
 from globaleaks.orm import tw
 from globaleaks.tests import helpers
-from globaleaks.utils.templating import Templating, supported_template_types
+from globaleaks.utils.templating import compile_template, Templating, supported_template_types, TipKeyword
 
 
 class notifTemplateTest(helpers.TestGLWithPopulatedDB):
@@ -43,3 +43,9 @@ class notifTemplateTest(helpers.TestGLWithPopulatedDB):
             data['type'] = key
             template = ''.join(supported_template_types[key].keyword_list)
             Templating().format_template(template, data)
+
+    def test_compile_template(self):
+        template = compile_template('{TipNum} {Blank} {Unknown} {TipNum}', TipKeyword)
+
+        self.assertIs(template, compile_template('{TipNum} {Blank} {Unknown} {TipNum}', TipKeyword))
+        self.assertEqual([x[1] for x in template.keywords], ['{TipNum}', '{TipNum}'])
@@ -3,7 +3,7 @@ import os
 
 from io import BytesIO
 from twisted.internet.defer import inlineCallbacks
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from globaleaks.tests import helpers
 from globaleaks.utils.zipstream import ZipStream
@@ -39,3 +39,42 @@ class TestZipStream(helpers.TestGL):
                     self.assertTrue(ff.file_size == len(self.unicode_seq.encode()))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_zipstream_read(self):
+        data = os.urandom(100000)
+
+        files = [
+          {'name': 'file.txt', 'fo': BytesIO(b'a' * 100000)},
+          {'name': 'file.pgp', 'fo': open(os.path.abspath(__file__), 'rb')},
+          {'name': 'image.JPG', 'fo': BytesIO(data)}
+        ]
+
+        zipstream = ZipStream(files)
+
+        output = BytesIO()
+        while True:
+            chunk = zipstream.read(1000)
+            self.assertLessEqual(len(chunk), 1000)
+            if not chunk:
+                break
+
+            output.write(chunk)
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual(f.getinfo('file.txt').compress_type, ZIP_DEFLATED)
+            self.assertEqual(f.getinfo('file.pgp').compress_type, ZIP_DEFLATED)
+            self.assertEqual(f.getinfo('image.JPG').compress_type, ZIP_STORED)
+            self.assertEqual(f.read('image.JPG'), data)
+            self.assertEqual(f.read('file.txt'), b'a' * 100000)
+
+            # streamed content not worth compressing is deflated without compression
+            self.assertGreaterEqual(f.getinfo('file.pgp').compress_size, f.getinfo('file.pgp').file_size)
+
+        # entries available in memory do not need a data descriptor
+        # while the streamed ones, using it, are never stored
+        for zinfo in zipstream.filelist:
+            self.assertTrue(zinfo.compress_type == ZIP_DEFLATED or not zinfo.flag_bits & 0x08)
+
+        self.assertFalse(zipstream.filelist[0].flag_bits & 0x08)
+        self.assertTrue(zipstream.filelist[1].flag_bits & 0x08)
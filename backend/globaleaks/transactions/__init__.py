@@ -3,6 +3,7 @@
 ORM Transactions definitions.
 """
 from globaleaks import models
+from globaleaks.orm import transact_batch
 
 
 def db_schedule_email(session, tid, address, subject, body):
@@ -13,3 +14,8 @@ def db_schedule_email(session, tid, address, subject, body):
                                    'body': body,
                                    'tid': tid,
                                })
+
+
+@transact_batch
+def schedule_email(session, tid, address, subject, body):
+    return db_schedule_email(session, tid, address, subject, body)
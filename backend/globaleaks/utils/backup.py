@@ -1,7 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# Backup utilities
+#
+# A backup is a tar.gz archive containing a manifest, a consistent snapshot
+# of the database taken with the SQLite online backup API and the files of
+# the working directory; the attachments, already encrypted and immutable,
+# are stored once in a content addressed directory shared by all the
+# backups and are referenced by the manifest.
 import calendar
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tarfile
+import tempfile
 
 from datetime import datetime, timedelta
 
+MANIFEST_VERSION = 1
+
+# Entries of the working directory not included in the archive
+excluded_entries = {
+    'attachments',
+    'backups',
+    'globaleaks.db',
+    'globaleaks.db-journal',
+    'globaleaks.db-shm',
+    'globaleaks.db-wal',
+    'log',
+    'tmp'
+}
+
 
 def backup_name(id, timestamp):
     """
@@ -73,4 +104,281 @@ def get_records_to_delete(d, w, m, records):
         if to_delete:
             ret.append(record)
 
-    return ret
\ No newline at end of file
+    return ret
+
+
+def get_object_path(objects_path, digest):
+    return os.path.join(objects_path, digest[:2], digest)
+
+
+def store_object(objects_path, src):
+    """
+    Store a file in the content addressed directory
+
+    :param objects_path: The path of the content addressed directory
+    :param src: The path of the file
+    :return: The sha256 digest of the file
+    """
+    h = hashlib.sha256()
+
+    fd, tmp = tempfile.mkstemp(dir=objects_path)
+    try:
+        with open(src, 'rb') as f, os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+                out.write(chunk)
+
+        digest = h.hexdigest()
+        path = get_object_path(objects_path, digest)
+
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.rename(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return digest
+
+
+def read_manifest(path):
+    """
+    Read the manifest of a backup
+
+    :param path: The path of the backup archive
+    :return: The manifest or None for the archives without a manifest
+    """
+    with tarfile.open(path, 'r:gz') as tf:
+        member = tf.next()
+        if member is None or member.name != 'manifest.json':
+            return None
+
+        return json.loads(tf.extractfile(member).read().decode())
+
+
+def get_latest_manifest(backup_path):
+    archives = [os.path.join(backup_path, f) for f in os.listdir(backup_path)
+                if f.endswith('.tar.gz') and not f.startswith('.')]
+
+    for path in sorted(archives, key=os.path.getmtime, reverse=True):
+        try:
+            manifest = read_manifest(path)
+            if manifest is not None:
+                return manifest
+        except Exception:
+            continue
+
+    return None
+
+
+def get_referenced_attachments(db_path):
+    """
+    Return the names of the attachments referenced by a database
+
+    :param db_path: The path of the database
+    :return: The set of the names of the attachments
+    """
+    ret = set()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for table in ('internalfile', 'receiverfile', 'whistleblowerfile'):
+            ret.update(os.path.basename(x[0]) for x in conn.execute('SELECT filename FROM %s' % table) if x[0])
+    finally:
+        conn.close()
+
+    return ret
+
+
+def perform_backup(working_path, backup_path, filename, database_version):
+    """
+    Create a backup of the working directory
+
+    The attachments already stored by the previous backup are not read
+    again as their content never changes.
+
+    :param working_path: The path of the working directory
+    :param backup_path: The path of the directory of the backups
+    :param filename: The filename of the backup archive
+    :param database_version: The version of the database
+    :return: The manifest of the backup
+    """
+    objects_path = os.path.join(backup_path, 'objects')
+    attachments_path = os.path.join(working_path, 'attachments')
+    os.makedirs(objects_path, exist_ok=True)
+
+    dst = os.path.join(backup_path, filename)
+    tmp = os.path.join(backup_path, '.' + filename)
+    db_snapshot = os.path.join(backup_path, '.' + filename + '.db')
+
+    try:
+        # The snapshot is copied in a single step so that it is consistent
+        src = sqlite3.connect(os.path.join(working_path, 'globaleaks.db'))
+        try:
+            snapshot = sqlite3.connect(db_snapshot)
+            try:
+                src.backup(snapshot, pages=-1)
+            finally:
+                snapshot.close()
+        finally:
+            src.close()
+
+        # The attachments referenced by the snapshot are then stored;
+        # as the files are written before the records referencing them
+        # are committed, all of them are available
+        previous = get_latest_manifest(backup_path)
+        previous = previous['attachments'] if previous is not None else {}
+
+        attachments = {}
+        for name in sorted(get_referenced_attachments(db_snapshot)):
+            path = os.path.join(attachments_path, name)
+
+            try:
+                digest = previous.get(name)
+                if digest is None or \
+                   os.path.getsize(get_object_path(objects_path, digest)) != os.path.getsize(path):
+                    digest = store_object(objects_path, path)
+            except OSError:
+                # the file is not yet processed or was deleted in the meantime
+                continue
+
+            attachments[name] = digest
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'database_version': database_version,
+            'creation_date': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'attachments': attachments
+        }
+
+        with tarfile.open(tmp, 'w:gz') as tf:
+            data = json.dumps(manifest).encode()
+            info = tarfile.TarInfo('manifest.json')
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+            tf.add(db_snapshot, arcname='globaleaks.db')
+
+            for name in sorted(os.listdir(working_path)):
+                if name not in excluded_entries:
+                    tf.add(os.path.join(working_path, name), arcname=name)
+
+        os.rename(tmp, dst)
+    finally:
+        for path in (tmp, db_snapshot):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return manifest
+
+
+def get_referenced_objects(backup_path, filenames):
+    """
+    Return the digests of the attachments referenced by a set of backups
+
+    :param backup_path: The path of the directory of the backups
+    :param filenames: The filenames of the backup archives
+    :return: The set of the digests referenced
+    """
+    ret = set()
+
+    for filename in filenames:
+        try:
+            manifest = read_manifest(os.path.join(backup_path, filename))
+        except Exception:
+            continue
+
+        if manifest is not None:
+            ret.update(manifest['attachments'].values())
+
+    return ret
+
+
+def get_objects(backup_path):
+    """
+    Return the paths of the objects stored by the backups by digest
+    """
+    ret = {}
+
+    objects_path = os.path.join(backup_path, 'objects')
+    if not os.path.isdir(objects_path):
+        return ret
+
+    for d in os.listdir(objects_path):
+        path = os.path.join(objects_path, d)
+        if os.path.isdir(path):
+            for digest in os.listdir(path):
+                ret[digest] = os.path.join(path, digest)
+
+    return ret
+
+
+def restore_backup(path, objects_path, working_path):
+    """
+    Restore a backup in a working directory
+
+    :param path: The path of the backup archive
+    :param objects_path: The path of the content addressed directory
+    :param working_path: The path of the working directory
+    """
+    manifest = read_manifest(path)
+
+    with tarfile.open(path, 'r:gz') as tf:
+        if manifest is not None:
+            members = [m for m in tf.getmembers() if m.name != 'manifest.json']
+        else:
+            # The legacy archives store the files under the directory of the
+            # working directory, or under '.' for those created by gl-admin
+            members = []
+            for m in tf.getmembers():
+                parts = m.name.split('/', 1)
+                if len(parts) == 1 or not parts[1]:
+                    continue
+
+                m.name = parts[1]
+                if m.islnk():
+                    m.linkname = m.linkname.split('/', 1)[-1]
+
+                members.append(m)
+
+        for m in members:
+            target = os.path.abspath(os.path.join(working_path, m.name))
+            if os.path.commonpath([os.path.abspath(working_path), target]) != os.path.abspath(working_path):
+                raise Exception("Invalid path in backup archive: %s" % m.name)
+
+        tf.extractall(working_path, members)
+
+    if manifest is None:
+        return
+
+    attachments_path = os.path.join(working_path, 'attachments')
+    os.makedirs(attachments_path, exist_ok=True)
+
+    for name, digest in manifest['attachments'].items():
+        src = get_object_path(objects_path, digest)
+        dst = os.path.join(attachments_path, os.path.basename(name))
+
+        h = hashlib.sha256()
+        with open(src, 'rb') as f, open(dst, 'wb') as out:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+                out.write(chunk)
+
+        if h.hexdigest() != digest:
+            raise Exception("Corrupted backup object: %s" % digest)
+
+
+def main(argv):
+    # Entry point used to run the backups in a separate process
+    working_path, backup_path, filename, database_version = argv
+
+    os.nice(19)
+
+    perform_backup(working_path, backup_path, filename, int(database_version))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Implement counters of events over sliding windows
+import time
+from collections import deque
+
+
+class RingCounter(object):
+    """
+    Counter split in a fixed number of buckets of fixed duration
+
+    Each bucket records the epoch it refers to so that the buckets of
+    the past rounds of the ring are reset lazily when reused.
+    """
+    __slots__ = ['counts', 'epochs']
+
+    def __init__(self, buckets):
+        self.counts = [0] * buckets
+        self.epochs = [-1] * buckets
+
+
+class EventCounters(object):
+    """
+    Counters of the events of a tenant by event type
+
+    The increments are O(1) and the count of the events of a sliding
+    window is O(buckets); the totals since the last collection and a
+    bounded sample of the most recent events are kept as well.
+    """
+    def __init__(self, bucket_size=60, buckets=60, sample_size=100):
+        """
+        :param bucket_size: The duration of a bucket in seconds
+        :param buckets: The number of buckets, i.e. the maximum window
+        :param sample_size: The number of the most recent events kept
+        """
+        self.bucket_size = bucket_size
+        self.buckets = buckets
+        self.counters = {}
+        self.totals = {}
+        self.sample = deque(maxlen=sample_size)
+
+    def add(self, event, now=None):
+        """
+        Record an event
+
+        :param event: An object with the attribute event_type
+        :param now: The time of the event; defaults to the current time
+        """
+        if now is None:
+            now = time.time()
+
+        epoch = int(now // self.bucket_size)
+        i = epoch % self.buckets
+
+        counter = self.counters.get(event.event_type)
+        if counter is None:
+            counter = self.counters[event.event_type] = RingCounter(self.buckets)
+
+        if counter.epochs[i] != epoch:
+            counter.epochs[i] = epoch
+            counter.counts[i] = 0
+
+        counter.counts[i] += 1
+
+        self.totals[event.event_type] = self.totals.get(event.event_type, 0) + 1
+
+        self.sample.append(event)
+
+    def count(self, event_type, window=None, now=None):
+        """
+        Count the events of a type within a sliding window
+
+        :param event_type: The type of the events
+        :param window: The window in seconds rounded to the buckets; defaults to the whole ring
+        :param now: The end of the window; defaults to the current time
+        :return: The number of the events
+        """
+        counter = self.counters.get(event_type)
+        if counter is None:
+            return 0
+
+        if now is None:
+            now = time.time()
+
+        buckets = self.buckets if window is None else min(self.buckets, max(1, -(-window // self.bucket_size)))
+
+        epoch = int(now // self.bucket_size)
+
+        return sum(count for count, x in zip(counter.counts, counter.epochs) if epoch - buckets < x <= epoch)
+
+    def counts(self, window=None, now=None):
+        """
+        Count the events of each type within a sliding window
+
+        :return: A dictionary mapping the event types to the number of events
+        """
+        ret = {}
+
+        for event_type in self.counters:
+            count = self.count(event_type, window, now)
+            if count:
+                ret[event_type] = count
+
+        return ret
+
+    def collect(self):
+        """
+        Return and reset the totals of the events since the last collection
+
+        :return: A dictionary mapping the event types to the number of events
+        """
+        totals, self.totals = self.totals, {}
+        return totals
@@ -106,12 +106,24 @@ def _hash_argon2(password, salt):
 
 
 class _StreamingEncryptionObject(object):
+    """
+    File encrypted in chunks with XSalsa20-Poly1305
+
+    The file is composed by a header of 96 bytes (the encrypted key and the
+    partial nonce) followed by the chunks; each chunk is composed by a flag
+    signaling the last chunk, the length of the chunk and the ciphertext.
+    """
+    header_size = 96
+    chunk_overhead = 21
+
     def __init__(self, mode, user_key, filepath):
         self.mode = mode
         self.user_key = user_key
         self.filepath = filepath
         self.key = None
         self.EOF = False
+        self.buffer = b''
+        self.size = None
 
         self.index = 0
 
@@ -162,9 +174,133 @@ class _StreamingEncryptionObject(object):
         chunk = self.fd.read(chunkLen + 16)
         return last, self.box.decrypt(chunk, chunkNonce)
 
-    def read(self, a):
-        if not self.EOF:
+    def read(self, a=-1):
+        while not self.EOF and (a < 0 or len(self.buffer) < a):
+            self.buffer += self.decrypt_chunk()[1]
+
+        if a < 0:
+            a = len(self.buffer)
+
+        data, self.buffer = self.buffer[:a], self.buffer[a:]
+
+        return data
+
+    def scan(self, position, offset, limit=None):
+        """
+        Index the chunks reading only their headers
+
+        :param position: The position of the first chunk to be read
+        :param offset: The offset in the plaintext of the first chunk to be read
+        :param limit: The maximum number of chunks to be read
+        :return: A list of tuples (position, plaintext offset, length, last)
+        """
+        chunks = []
+
+        while limit is None or len(chunks) < limit:
+            self.fd.seek(position)
+            header = self.fd.read(5)
+            if len(header) < 5:
+                break
+
+            last, length = struct.unpack('>BI', header)
+            chunks.append((position, offset, length, last))
+
+            if last:
+                break
+
+            position += self.chunk_overhead + length
+            offset += length
+
+        return chunks
+
+    def load_chunk(self, position, index):
+        """
+        Position the object on a chunk and decrypt it
+
+        As the nonce depends on the index of the chunk the decryption
+        authenticates also the position of the chunk in the file.
+
+        :return: The plaintext of the chunk or None on failure
+        """
+        self.fd.seek(position)
+        self.index = index
+        self.EOF = False
+
+        try:
             return self.decrypt_chunk()[1]
+        except Exception:
+            return None
+
+    def get_chunk_size(self):
+        chunks = self.scan(self.header_size, 0, 1)
+        return chunks[0][2] if chunks else 0
+
+    def get_plaintext_size(self):
+        """
+        Return the size of the plaintext
+
+        The chunks have a fixed size except the last ones and so the
+        size is computed reading only the headers of the last chunks.
+        """
+        if self.size is not None:
+            return self.size
+
+        state = self.fd.tell(), self.index, self.EOF
+
+        filesize = os.fstat(self.fd.fileno()).st_size
+        chunk_size = self.get_chunk_size()
+
+        if chunk_size:
+            m = (filesize - self.header_size) // (chunk_size + self.chunk_overhead)
+            for k in (m, m - 1):
+                position = self.header_size + k * (chunk_size + self.chunk_overhead)
+                if k < 0 or position >= filesize:
+                    continue
+
+                tail = self.scan(position, k * chunk_size, 3)
+                if tail and tail[-1][3] and \
+                   tail[-1][0] + self.chunk_overhead + tail[-1][2] == filesize and \
+                   (tail[0][3] or self.load_chunk(position, k) is not None):
+                    self.size = k * chunk_size + sum(x[2] for x in tail)
+                    break
+
+        if self.size is None:
+            chunks = self.scan(self.header_size, 0)
+            self.size = chunks[-1][1] + chunks[-1][2] if chunks else 0
+
+        self.fd.seek(state[0])
+        self.index, self.EOF = state[1], state[2]
+
+        return self.size
+
+    def seek(self, offset):
+        """
+        Position the object on an offset of the plaintext
+
+        The chunk covering the offset is located directly thanks to the
+        fixed size of the chunks; when the verification of the chunk fails
+        the position is searched reading the headers of all the chunks.
+        """
+        self.buffer = b''
+
+        chunk_size = self.get_chunk_size()
+
+        if chunk_size:
+            k = offset // chunk_size
+            chunk = self.load_chunk(self.header_size + k * (chunk_size + self.chunk_overhead), k)
+            if chunk is not None and len(chunk) > offset - k * chunk_size:
+                self.buffer = chunk[offset - k * chunk_size:]
+                return
+
+        for k, (position, chunk_offset, length, _) in enumerate(self.scan(self.header_size, 0)):
+            if chunk_offset <= offset < chunk_offset + length:
+                self.fd.seek(position)
+                self.index = k
+                self.EOF = False
+                self.buffer = self.decrypt_chunk()[1][offset - chunk_offset:]
+                return
+
+        self.EOF = True
 
     def close(self):
         if self.fd is not None:
@@ -309,6 +445,17 @@ class _GCE(object):
         data = _convert_to_bytes(data)
         return SealedBox(prv_key).decrypt(data)
 
+    @staticmethod
+    def asymmetric_decryptor(prv_key):
+        """
+        Return a function performing asymmetric decryption with the given key
+
+        The sealedbox is initialized once so that the derivation of the public
+        key is not repeated when decrypting many items with the same key.
+        """
+        box = SealedBox(PrivateKey(prv_key, Base64Encoder))
+        return lambda data: box.decrypt(_convert_to_bytes(data))
+
     @staticmethod
     def streaming_encryption_open(mode, user_key, filepath):
         return _StreamingEncryptionObject(mode, user_key, filepath)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8
+# Implement a pool dedicated to the decryption of batches of items
+#
+# The tips are composed of many small items encrypted with the same tip key
+# (answers, identity, comments, messages, files metadata); their decryption
+# is fanned out in chunks to a pool of threads as libsodium releases the GIL.
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.utils.crypto import GCE
+
+
+def run_chunk(function, chunk):
+    return [function(x) for x in chunk]
+
+
+class DecryptionPool(object):
+    """
+    Pool of workers for the decryption of batches of items
+
+    The items are split in chunks executed concurrently on the pool and
+    the results are returned in the same order of the items.
+    """
+    def __init__(self, concurrency=4, chunk_size=64):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.thread_pool = ThreadPool(1, concurrency, 'DecryptionPool')
+
+    def set_thread_pool(self, thread_pool):
+        self.thread_pool = thread_pool
+
+    def start(self):
+        self.thread_pool.start()
+
+    def stop(self):
+        self.thread_pool.stop()
+
+    def map(self, function, items):
+        """
+        Apply the function to each of the items on the pool
+
+        :param function: The function to be applied
+        :param items: A list of items
+        :return: A deferred fired with the list of the results
+        """
+        dl = []
+
+        for i in range(0, len(items), self.chunk_size):
+            dl.append(deferToThreadPool(reactor, self.thread_pool, run_chunk, function, items[i:i + self.chunk_size]))
+
+        d = defer.gatherResults(dl, consumeErrors=True)
+
+        d.addCallback(lambda results: [x for chunk in results for x in chunk])
+        d.addErrback(lambda failure: failure.value.subFailure)
+
+        return d
+
+    def decrypt(self, key, items):
+        """
+        Decrypt a list of items encrypted with the same key
+
+        :param key: The private key
+        :param items: A list of encrypted items
+        :return: A deferred fired with the list of the decrypted items
+        """
+        return self.map(GCE.asymmetric_decryptor(key), items)
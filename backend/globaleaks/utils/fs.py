@@ -2,15 +2,14 @@
 import io
 import json
 import os
-import random
 
 from globaleaks.rest import errors
 from globaleaks.utils.utility import log
 
 
-def overwrite_and_remove(absolutefpath, iterations_number=1):
+def overwrite_and_remove(absolutefpath, iterations_number=1, block_size=1024 * 1024, throttle=None):
     """
-    Overwrite the file with all_zeros, all_ones, random patterns
+    Overwrite the file with random data and remove it
 
     This feature is a legacy security measure known to has important
     drawbacks and to not be effective on all the situations as it
@@ -20,41 +19,43 @@ def overwrite_and_remove(absolutefpath, iterations_number=1):
     and this feature is maintained just as additional countermeasure
     and for educational and historical reasons.
 
+    The whole length of the file, rounded up to the block size of the
+    filesystem, is overwritten in large blocks and synced to the disk
+    at the end of each iteration.
+
     :param absolutefpath: the absolute path of the file to overwrite
     :param iterations_number: the number of overwrite operations
+    :param block_size: the size of the blocks written
+    :param throttle: an optional function invoked with the size of each block written
+    :return: the number of bytes overwritten
     """
     log.debug("Starting secure deletion of file %s", absolutefpath)
 
-    def _overwrite(absolutefpath, pattern):
-        count = 0
-        length = len(pattern)
-
-        with open(absolutefpath, 'w+') as f:
-            f.seek(0)
-            while count < length:
-                f.write(pattern)
-                count += len(pattern)
-
-    randomgen = random.SystemRandom()
+    written = 0
 
     try:
-        # in the following loop, the file is open and closed on purpose, to trigger flush operations
-        all_zeros = "\0\0\0\0" * 1024               # 4kb of zeros
-        all_ones = "\xFF" * 4096
+        with open(absolutefpath, 'r+b') as f:
+            stat = os.fstat(f.fileno())
+            fs_block_size = getattr(stat, 'st_blksize', 4096) or 4096
+            length = -(-stat.st_size // fs_block_size) * fs_block_size
 
-        for iteration in range(iterations_number):
-            OPTIMIZATION_RANDOM_BLOCK = randomgen.randint(4096, 4096 * 2)
+            for iteration in range(iterations_number):
+                log.debug("Excecuting rewrite iteration (%d out of %d)",
+                          iteration, iterations_number)
 
-            random_pattern = ""
-            for _ in range(OPTIMIZATION_RANDOM_BLOCK):
-                random_pattern += str(randomgen.randrange(256))
+                f.seek(0)
+                offset = 0
+                while offset < length:
+                    size = min(block_size, length - offset)
+                    f.write(os.urandom(size))
+                    offset += size
+                    written += size
 
-            log.debug("Excecuting rewrite iteration (%d out of %d)",
-                      iteration, iterations_number)
+                    if throttle is not None:
+                        throttle(size)
 
-            _overwrite(absolutefpath, all_zeros)
-            _overwrite(absolutefpath, all_ones)
-            _overwrite(absolutefpath, random_pattern)
+                f.flush()
+                os.fsync(f.fileno())
 
     except Exception as excep:
         log.err("Unable to perform secure overwrite for file %s: %s",
@@ -69,6 +70,8 @@ def overwrite_and_remove(absolutefpath, iterations_number=1):
 
     log.debug("Performed deletion of file: %s", absolutefpath)
 
+    return written
+
 
 def directory_traversal_check(trusted_absolute_prefix, untrusted_path):
     """
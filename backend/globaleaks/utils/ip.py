@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import bisect
 import ipaddress
 
 
@@ -39,19 +40,54 @@ def parse_csv_ip_ranges_to_ip_networks(ip_str):
         return []
 
 
+class IPFilter(object):
+    """
+    Precompiled index of an IP filter
+
+    The networks of the filter are converted to sorted and merged intervals
+    of integers, one list per IP version, so that each lookup costs O(log n)
+    independently of the number of networks configured.
+    """
+    def __init__(self, ip_str):
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+
+        intervals = {4: [], 6: []}
+        for ip_network in parse_csv_ip_ranges_to_ip_networks(ip_str):
+            intervals[ip_network.version].append((int(ip_network.network_address),
+                                                  int(ip_network.broadcast_address)))
+
+        for version in intervals:
+            for start, end in sorted(intervals[version]):
+                if self.ends[version] and start <= self.ends[version][-1] + 1:
+                    self.ends[version][-1] = max(self.ends[version][-1], end)
+                else:
+                    self.starts[version].append(start)
+                    self.ends[version].append(end)
+
+    def __contains__(self, client_ip_obj):
+        x = int(client_ip_obj)
+        i = bisect.bisect_right(self.starts[client_ip_obj.version], x) - 1
+        return i >= 0 and x <= self.ends[client_ip_obj.version][i]
+
+
 def check_ip(client_ip, ip_filter):
+    """
+    Check if an IP address is matched by an IP filter
+
+    :param client_ip: the IP address to be checked
+    :param ip_filter: an IPFilter or a string of comma separated IPs/CIDRs
+    :return: True if the IP is matched by the filter, False otherwise
+    """
     try:
-        ip_networks = parse_csv_ip_ranges_to_ip_networks(ip_filter)
+        if not isinstance(ip_filter, IPFilter):
+            ip_filter = IPFilter(ip_filter)
 
         if isinstance(client_ip, bytes):
             client_ip = client_ip.decode()
 
         client_ip_obj = ipaddress.ip_address(client_ip)
 
-        for ip_network in ip_networks:
-            if client_ip_obj in ip_network:
-                return True
+        return client_ip_obj in ip_filter
     except:
         return False
-
-    return False
@@ -0,0 +1,109 @@
+# -*- coding: utf-8
+# Implement a bounded executor dedicated to password hashing and key derivation
+#
+# Argon2 is memory and cpu intensive and so it is kept out of the ORM thread pool
+# in order to avoid holding the database lock for the whole duration of the KDF.
+import time
+
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.rest import errors
+from globaleaks.utils.crypto import GCE
+
+
+def argon2_memory_usage():
+    """
+    Return the amount of memory in bytes required by a single Argon2 execution
+    """
+    return 1 << GCE.ALGORITM_CONFIGURATION['ARGON2']['MEMLIMIT']
+
+
+class KDFPool(object):
+    """
+    Bounded pool of workers for the execution of the KDF functions.
+
+    The number of workers is limited by the configured concurrency and by the
+    memory budget available for Argon2; requests exceeding the queue limit are
+    rejected in order to protect the platform from resources exhaustion.
+
+    The pool relies on threads as libsodium releases the GIL during the
+    execution of the Argon2 primitives.
+    """
+    def __init__(self, concurrency=2, memory_budget=1 << 29, queue_limit=64):
+        self.concurrency = concurrency
+        self.memory_budget = memory_budget
+        self.queue_limit = queue_limit
+
+        self.pending = 0
+        self.executed = 0
+        self.rejected = 0
+        self.mean_time = -1
+        self.high_time = -1
+
+        self.thread_pool = ThreadPool(1, self.get_workers(), 'KDFPool')
+
+    def get_workers(self):
+        return max(1, min(self.concurrency, self.memory_budget // argon2_memory_usage()))
+
+    def set_thread_pool(self, thread_pool):
+        self.thread_pool = thread_pool
+
+    def start(self):
+        self.thread_pool.start()
+
+    def stop(self):
+        self.thread_pool.stop()
+
+    def run(self, function, *args, **kwargs):
+        """
+        Schedule the execution of the function on the pool
+
+        :return: A deferred fired with the result of the function
+        """
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            return defer.fail(errors.ServiceOverloaded())
+
+        self.pending += 1
+
+        d = deferToThreadPool(reactor, self.thread_pool, function, *args, **kwargs)
+
+        return d.addBoth(self._done, time.time())
+
+    def _done(self, result, start_time):
+        current_run_time = int((time.time() - start_time) * 1000)
+
+        self.pending -= 1
+        self.executed += 1
+
+        if self.mean_time == -1:
+            self.mean_time = current_run_time
+        else:
+            self.mean_time = (self.mean_time * 0.7) + (current_run_time * 0.3)
+
+        if current_run_time > self.high_time:
+            self.high_time = current_run_time
+
+        return result
+
+    def hash_password(self, password, salt, algorithm='ARGON2'):
+        return self.run(GCE.hash_password, password, salt, algorithm)
+
+    def check_password(self, algorithm, password, salt, hash):
+        return self.run(GCE.check_password, algorithm, password, salt, hash)
+
+    def derive_key(self, password, salt):
+        return self.run(GCE.derive_key, password, salt)
+
+    def get_metrics(self):
+        return {
+            'workers': self.get_workers(),
+            'queue_depth': self.pending,
+            'queue_limit': self.queue_limit,
+            'executed': self.executed,
+            'rejected': self.rejected,
+            'latency_mean': self.mean_time,
+            'latency_high': self.high_time
+        }
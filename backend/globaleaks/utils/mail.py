@@ -7,9 +7,11 @@ from email.header import Header
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from twisted.internet import reactor, defer
+from twisted.internet import reactor, defer, protocol
 from twisted.internet.endpoints import TCP4ClientEndpoint
-from twisted.mail.smtp import ESMTPSenderFactory
+from twisted.internet.protocol import connectionDone
+from twisted.mail.smtp import DNSNAME, ESMTPClientError, ESMTPSender, SMTPClient, \
+    SMTPClientError, SMTPConnectError, SMTPTimeoutError, SUCCESS
 from twisted.protocols import tls
 
 from globaleaks.utils.socks import SOCKS5ClientEndpoint
@@ -39,9 +41,119 @@ def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, mail_subject, mail
     return BytesIO(multipart.as_bytes())  # pylint: disable=no-member
 
 
-def sendmail(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, to_address, subject, body, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+class MultipleMailsSender(ESMTPSender):
     """
-    Send an email using SMTPS/SMTP+TLS and maybe torify the connection.
+    ESMTP client sending over the same connection the mails queued on its factory
+    """
+    current = None
+
+    def getMailFrom(self):
+        self.current = self.factory.get_next_mail()
+        if self.current is None:
+            return None
+
+        return self.factory.from_address
+
+    def getMailTo(self):
+        return [self.current['address']]
+
+    def getMailData(self):
+        return self.current['message']
+
+    def sentMail(self, code, resp, numOk, addresses, smtp_log):
+        if code in SUCCESS:
+            self.factory.sent.append(self.current['id'])
+        else:
+            log.err("SMTP server refused mail to %s (%d: %s)", self.current['address'], code, resp)
+
+        self.current = None
+
+    def is_mail_error(self, exc):
+        """
+        Tell if an error concerns only the mail being sent and not the
+        connection to the server, the authentication or the transport security
+        """
+        return self.current is not None and \
+               isinstance(exc, SMTPClientError) and \
+               not exc.isFatal and \
+               not isinstance(exc, (ESMTPClientError, SMTPConnectError, SMTPTimeoutError))
+
+    def sendError(self, exc):
+        if self.is_mail_error(exc):
+            # Record the failure of the current mail, reset the SMTP
+            # transaction and continue with the next mail
+            self.smtpState_msgSent(exc.code, exc.resp)
+            return
+
+        self.factory.error = exc
+        SMTPClient.sendError(self, exc)
+
+    def connectionLost(self, reason=connectionDone):
+        ESMTPSender.connectionLost(self, reason)
+
+        if self.current is not None and self.factory.error is None:
+            self.factory.error = reason.value
+
+        self.factory.done()
+
+
+class MultipleMailsSenderFactory(protocol.ClientFactory):
+    """
+    Factory of the SMTP connections delivering a shared queue of mails
+    """
+    protocol = MultipleMailsSender
+
+    def __init__(self, username, password, from_name, from_address, queue, context_factory, authentication, security, timeout):
+        self.username = username
+        self.password = password
+        self.from_name = from_name
+        self.from_address = from_address
+        self.queue = queue
+        self.context_factory = context_factory
+        self.authentication = authentication
+        self.security = security
+        self.timeout = timeout
+
+        self.sent = []
+        self.error = None
+        self.deferred = defer.Deferred()
+
+    def get_next_mail(self):
+        if self.error is not None or not self.queue:
+            return None
+
+        mail = dict(self.queue.pop(0))
+        mail['message'] = MIME_mail_build(self.from_name,
+                                          self.from_address,
+                                          mail['address'],
+                                          mail['address'],
+                                          mail['subject'],
+                                          mail['body'])
+
+        return mail
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.username, self.password, self.context_factory, DNSNAME)
+        p.requireAuthentication = self.authentication
+        p.requireTransportSecurity = (self.security == 'TLS')
+        p.factory = self
+        p.timeout = self.timeout
+        return p
+
+    def done(self, error=None):
+        if error is not None and self.error is None:
+            self.error = error
+
+        if not self.deferred.called:
+            self.deferred.callback((self.sent, self.error))
+
+
+def sendmails(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, mails, concurrency=1, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+    """
+    Send a list of emails using SMTPS/SMTP+TLS and maybe torify the connections.
+
+    The mails are delivered over up to `concurrency` connections,
+    each of them sending multiple messages.
 
     :param tid: A tenant id
     :param smtp_host: A SMTP host
@@ -52,79 +164,101 @@ def sendmail(tid, smtp_host, smtp_port, security, authentication, username, pass
     :param password: A mail account password
     :param from_name: A from name
     :param from_address: A from address
-    :param to_address:  The to address
-    :param subject: A mail subject
-    :param body: A mail body
+    :param mails: A list of dicts with the id, address, subject and body of each mail
+    :param concurrency: The maximum number of connections to be opened
     :param anonymize: A boolean to enable anonymous mail connection
     :param socks_host: A socks host to be used for the mail connection
     :param socks_port: A socks port to be used for the mail connection
-    :return: A deferred resource resolving at the end of the connection
+    :return: A deferred resolving at the end of the connections with
+             the list of the ids of the mails sent and the last connection error
     """
-    try:
-        timeout = 30
+    timeout = 30
 
-        message = MIME_mail_build(from_name,
-                                  from_address,
-                                  to_address,
-                                  to_address,
-                                  subject,
-                                  body)
+    queue = list(mails)
 
-        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]',
-                  to_address,
-                  smtp_host,
-                  smtp_port,
-                  security,
-                  tid=tid)
+    log.debug('Sending %d emails using SMTP server [%s:%d] [%s]',
+              len(queue),
+              smtp_host,
+              smtp_port,
+              security,
+              tid=tid)
 
-        context_factory = TLSClientContextFactory()
+    context_factory = TLSClientContextFactory()
 
-        smtp_deferred = defer.Deferred()
-
-        factory = ESMTPSenderFactory(
+    factories = []
+    for _ in range(max(1, min(concurrency, len(queue)))):
+        factory = MultipleMailsSenderFactory(
             username.encode() if authentication else None,
             password.encode() if authentication else None,
+            from_name,
             from_address,
-            to_address,
-            message,
-            smtp_deferred,
-            contextFactory=context_factory,
-            requireAuthentication=authentication,
-            requireTransportSecurity=(security == 'TLS'),
-            retries=0,
-            timeout=timeout)
-
-        if security == "SSL":
-            factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
-
-        if anonymize:
-            socksProxy = TCP4ClientEndpoint(reactor, socks_host, socks_port, timeout=timeout)
-            endpoint = SOCKS5ClientEndpoint(smtp_host, smtp_port, socksProxy)
-        else:
-            endpoint = TCP4ClientEndpoint(reactor, smtp_host, smtp_port, timeout=timeout)
+            queue,
+            context_factory,
+            authentication,
+            security,
+            timeout)
+
+        try:
+            wrapped_factory = factory
+            if security == "SSL":
+                wrapped_factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
+
+            if anonymize:
+                socksProxy = TCP4ClientEndpoint(reactor, socks_host, socks_port, timeout=timeout)
+                endpoint = SOCKS5ClientEndpoint(smtp_host, smtp_port, socksProxy)
+            else:
+                endpoint = TCP4ClientEndpoint(reactor, smtp_host, smtp_port, timeout=timeout)
 
-        conn_deferred = endpoint.connect(factory)
+            endpoint.connect(wrapped_factory).addErrback(lambda failure, factory=factory: factory.done(failure.value))
+        except Exception as e:
+            # avoids raising an exception inside email logic to avoid chained errors
+            log.err("Unexpected exception in sendmail: %s", e, tid=tid)
+            factory.done(e)
 
-        final = defer.DeferredList([conn_deferred, smtp_deferred], fireOnOneErrback=True, consumeErrors=True)
+        factories.append(factory)
 
-        def failure_cb(failure):
-            """
-            :param failure {Failure {twisted.internet.FirstError {Failure}}}
-            """
-            log.err("SMTP connection failed (Exception: %s)",
-                    failure.value.subFailure.value, tid=tid)
-            log.debug(failure)
-            return False
+    def collect_results(results):
+        sent, error = [], None
+        for _, (x, y) in results:
+            sent.extend(x)
+            error = y if y is not None else error
 
-        def success_cb(results):
-            """
-            :param results {list of (success, return_val) tuples}
-            """
-            return True
+        if error is not None:
+            log.err("SMTP connection failed (Exception: %s)", error, tid=tid)
 
-        return final.addCallbacks(success_cb, failure_cb)
+        return sent, error
+
+    return defer.DeferredList([f.deferred for f in factories]).addCallback(collect_results)
+
+
+def sendmail(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, to_address, subject, body, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+    """
+    Send an email using SMTPS/SMTP+TLS and maybe torify the connection.
+
+    :param tid: A tenant id
+    :param smtp_host: A SMTP host
+    :param smtp_port: A SMTP port
+    :param security: A type of security to be applied (SMTPS/SMTP+TLS)
+    :param authentication: A boolean to enable authentication
+    :param username: A mail account username
+    :param password: A mail account password
+    :param from_name: A from name
+    :param from_address: A from address
+    :param to_address:  The to address
+    :param subject: A mail subject
+    :param body: A mail body
+    :param anonymize: A boolean to enable anonymous mail connection
+    :param socks_host: A socks host to be used for the mail connection
+    :param socks_port: A socks port to be used for the mail connection
+    :return: A deferred resolving at the end of the connection
+    """
+    mail = {
+        'id': to_address,
+        'address': to_address,
+        'subject': subject,
+        'body': body
+    }
 
-    except Exception as e:
-        # avoids raising an exception inside email logic to avoid chained errors
-        log.err("Unexpected exception in sendmail: %s", e, tid=tid)
-        return defer.succeed(False)
+    return sendmails(tid, smtp_host, smtp_port, security, authentication, username, password,
+                     from_name, from_address, [mail], 1, anonymize, socks_host, socks_port) \
+        .addCallback(lambda result: len(result[0]) == 1)
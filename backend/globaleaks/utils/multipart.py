@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Incremental parser of multipart/form-data bodies
+from email.message import Message
+from email.utils import collapse_rfc2231_value
+
+# Maximum size of the headers of a part
+max_headers_size = 8 * 1024
+
+
+class MultipartParser(object):
+    """
+    Parser of a multipart/form-data body fed as its bytes arrive
+
+    The content of the parts is passed to the callbacks as soon as it is
+    known not to be part of a delimiter, so that only a tail of the size
+    of the delimiter is kept in memory independently of the size of the
+    parts.
+    """
+    def __init__(self, boundary, part_begin, part_data, part_end):
+        """
+        :param boundary: The boundary declared in the Content-Type header
+        :param part_begin: The callback receiving the headers of each part
+        :param part_data: The callback receiving the content of the part being parsed
+        :param part_end: The callback signaling the end of the part being parsed
+        """
+        self.delimiter = b'\r\n--' + boundary
+        self.part_begin = part_begin
+        self.part_data = part_data
+        self.part_end = part_end
+
+        # The first delimiter is not preceded by a newline
+        self.buffer = b'\r\n'
+        self.state = 'preamble'
+
+    def feed(self, data):
+        self.buffer += data
+
+        while True:
+            if self.state == 'preamble':
+                i = self.buffer.find(self.delimiter)
+                if i < 0:
+                    self.buffer = self.buffer[-len(self.delimiter) + 1:]
+                    return
+
+                self.buffer = self.buffer[i + len(self.delimiter):]
+                self.state = 'delimiter'
+
+            elif self.state == 'delimiter':
+                if len(self.buffer) < 2:
+                    return
+
+                if self.buffer[:2] == b'--':
+                    self.buffer = b''
+                    self.state = 'end'
+                elif self.buffer[:2] == b'\r\n':
+                    self.buffer = self.buffer[2:]
+                    self.state = 'headers'
+                else:
+                    raise ValueError("Invalid multipart delimiter")
+
+            elif self.state == 'headers':
+                i = self.buffer.find(b'\r\n\r\n')
+                if i < 0:
+                    if len(self.buffer) > max_headers_size:
+                        raise ValueError("Multipart headers too long")
+
+                    return
+
+                headers = {}
+                for line in self.buffer[:i].decode('utf-8', 'surrogateescape').split('\r\n'):
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                self.buffer = self.buffer[i + 4:]
+                self.state = 'body'
+                self.part_begin(headers)
+
+            elif self.state == 'body':
+                i = self.buffer.find(self.delimiter)
+                if i < 0:
+                    n = len(self.buffer) - len(self.delimiter) + 1
+                    if n > 0:
+                        self.part_data(self.buffer[:n])
+                        self.buffer = self.buffer[n:]
+
+                    return
+
+                if i:
+                    self.part_data(self.buffer[:i])
+
+                self.buffer = self.buffer[i + len(self.delimiter):]
+                self.state = 'delimiter'
+                self.part_end()
+
+            else:
+                # epilogue
+                self.buffer = b''
+                return
+
+    def close(self):
+        if self.state != 'end':
+            raise ValueError("Incomplete multipart body")
+
+
+def parse_header(value):
+    """
+    Parse a header made of a value followed by its parameters,
+    e.g. Content-Type and Content-Disposition
+
+    :param value: The value of the header
+    :return: A tuple (value, params) with the dict of the parameters
+    """
+    message = Message()
+    message['content-type'] = value
+
+    params = message.get_params(header='content-type')
+    if not params:
+        return '', {}
+
+    return params[0][0].lower(), {k.lower(): collapse_rfc2231_value(v) for k, v in params[1:]}
+
+
+def parse_content_disposition(headers):
+    """
+    Parse the Content-Disposition header of a part
+
+    :param headers: The headers of the part
+    :return: A tuple (name, filename) where filename is None for the form fields
+    """
+    _, params = parse_header(headers.get('content-disposition', ''))
+
+    return params.get('name', ''), params.get('filename')
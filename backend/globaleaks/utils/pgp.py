@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
+import base64
+import binascii
+import hashlib
 import os
 import shutil
+import subprocess
 import tempfile
+import threading
 
 from datetime import datetime
 
@@ -9,6 +14,77 @@ from gnupg import GPG
 
 from globaleaks.rest import errors
 from globaleaks.utils.log import log
+from globaleaks.utils.utility import datetime_now
+
+
+def get_armored_key_fingerprint(key):
+    """
+    Compute the fingerprint of an ASCII armored OpenPGP v4 public key
+
+    :param key: An ASCII armored PGP key
+    :return: The fingerprint of the primary key or None if it could not be computed
+    """
+    lines = [l.strip() for l in key.strip().splitlines()]
+
+    try:
+        start = lines.index('-----BEGIN PGP PUBLIC KEY BLOCK-----') + 1
+        start = lines.index('', start) + 1
+    except ValueError:
+        return None
+
+    data = []
+    for l in lines[start:]:
+        if l.startswith('=') or l.startswith('-----'):
+            break
+
+        data.append(l)
+
+    try:
+        data = base64.b64decode(''.join(data))
+    except (binascii.Error, ValueError):
+        return None
+
+    if len(data) < 6:
+        return None
+
+    if data[0] & 0x40:
+        # new format packet
+        tag = data[0] & 0x3f
+        if data[1] < 192:
+            offset, length = 2, data[1]
+        elif data[1] < 224:
+            offset, length = 3, ((data[1] - 192) << 8) + data[2] + 192
+        elif data[1] == 255:
+            offset, length = 6, int.from_bytes(data[2:6], 'big')
+        else:
+            return None
+    else:
+        # old format packet
+        tag = (data[0] >> 2) & 0x0f
+        size = {0: 1, 1: 2, 2: 4}.get(data[0] & 0x03)
+        if size is None:
+            return None
+
+        offset, length = 1 + size, int.from_bytes(data[1:1 + size], 'big')
+
+    body = data[offset:offset + length]
+
+    # public key packet of version 4
+    if tag != 6 or len(body) != length or body[0] != 4:
+        return None
+
+    return hashlib.sha1(b'\x99' + length.to_bytes(2, 'big') + body).hexdigest().upper()
+
+
+def kill_gpg_agent(gnupghome):
+    """
+    Terminate the GnuPG agent eventually started for a GnuPG home
+    """
+    try:
+        subprocess.call(['gpgconf', '--homedir', gnupghome, '--kill', 'gpg-agent'],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except Exception:
+        pass
 
 
 class PGPContext(object):
@@ -80,7 +156,109 @@ class PGPContext(object):
         return str(encrypted_obj)
 
     def __del__(self):
+        kill_gpg_agent(self.gnupg.gnupghome)
+
         try:
             shutil.rmtree(self.gnupg.gnupghome)
         except Exception as excep:
             log.err("Unable to clean temporary PGP environment: %s: %s", self.gnupg.gnupghome, excep)
+
+
+class PGPKeyring(object):
+    """
+    Long-lived GnuPG keyring caching the imported keys by fingerprint
+
+    Each key is imported only once and reused until it is changed or expired,
+    avoiding the creation of a GnuPG home for every encryption.
+    """
+    # Maximum number of keys imported before the keyring is recreated
+    max_keys = 1000
+
+    def __init__(self, tempdirprefix=None):
+        self.tempdirprefix = tempdirprefix
+        self.pgpctx = None
+        self.keys = {}
+        self.lock = threading.RLock()
+
+    def get_context(self):
+        with self.lock:
+            if self.pgpctx is None or not os.path.exists(self.pgpctx.gnupg.gnupghome):
+                self.pgpctx = PGPContext(self.tempdirprefix)
+                self.keys = {}
+
+            return self.pgpctx
+
+    def close(self):
+        """
+        Terminate the GnuPG agent serving the keyring and remove the keyring
+        """
+        with self.lock:
+            if self.pgpctx is None:
+                return
+
+            gnupghome = self.pgpctx.gnupg.gnupghome
+
+            kill_gpg_agent(gnupghome)
+
+            shutil.rmtree(gnupghome, True)
+
+            self.pgpctx = None
+            self.keys = {}
+
+    def get_key(self, key):
+        """
+        Import the key if not already available in the keyring
+
+        When the number of keys imported reaches max_keys a new keyring is
+        created; the previous one, together with its GnuPG agent, is removed
+        as soon as the encryptions in progress on it are completed.
+
+        :param key: A PGP key to be loaded
+        :return: A tuple (context, key) where context is the GnuPG context
+                 holding the key and key is a dict with the expiration date
+                 and the key fingerprint
+        """
+        fingerprint = get_armored_key_fingerprint(key)
+
+        # the digest of the key detects the updates of a key already imported
+        digest = hashlib.sha256(key.encode()).hexdigest()
+
+        with self.lock:
+            pgpctx = self.get_context()
+
+            k = self.keys.get(fingerprint)
+            if k is None or k['digest'] != digest or \
+               datetime_now() > k['expiration'] > datetime.utcfromtimestamp(0):
+                if k is None and len(self.keys) >= self.max_keys:
+                    self.pgpctx = None
+                    pgpctx = self.get_context()
+
+                k = pgpctx.load_key(key)
+                k['digest'] = digest
+
+                self.keys[k['fingerprint']] = k
+
+            return pgpctx, {'fingerprint': k['fingerprint'], 'expiration': k['expiration']}
+
+    def load_key(self, key):
+        """
+        Import the key if not already available in the keyring
+
+        :param key: A PGP key to be loaded
+        :return: a dict with the expiration date and the key fingerprint
+        """
+        return self.get_key(key)[1]
+
+    def encrypt_file(self, key, input_file, output_path):
+        """
+        Encrypt a file with the specified PGP key
+        """
+        pgpctx, k = self.get_key(key)
+        return pgpctx.encrypt_file(k['fingerprint'], input_file, output_path)
+
+    def encrypt_message(self, key, plaintext):
+        """
+        Encrypt a text message with the specified PGP key
+        """
+        pgpctx, k = self.get_key(key)
+        return pgpctx.encrypt_message(k['fingerprint'], plaintext)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8
+# Implement a worker dedicated to the secure deletion of files
+#
+# The overwrite of large files is I/O bound and could saturate the disk;
+# the files are thus processed by a single thread limiting its write rate
+# so that the deletion does not slow down the rest of the application.
+import threading
+import time
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.utils.fs import overwrite_and_remove
+
+
+class RateLimiter(object):
+    """
+    Limiter of the rate of an operation implemented as a token bucket
+
+    The calls consuming more than the tokens available block the calling
+    thread until the bucket is refilled; a rate of 0 disables the limit.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: The number of units allowed per second
+        :param burst: The capacity of the bucket; defaults to one second of rate
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+
+class SecureDeletionWorker(object):
+    """
+    Worker performing the secure deletion of files at a limited rate
+
+    The files are overwritten on a single dedicated thread; the number of
+    files and bytes processed and the time spent are accounted in order to
+    report the throughput of the deletion.
+    """
+    def __init__(self, rate=0, block_size=1024 * 1024):
+        """
+        :param rate: The maximum number of bytes overwritten per second; 0 for no limit
+        :param block_size: The size of the blocks written
+        """
+        self.block_size = block_size
+        self.limiter = RateLimiter(rate, block_size)
+        self.thread_pool = ThreadPool(1, 1, 'SecureDeletion')
+        self.files = 0
+        self.bytes = 0
+        self.time = 0.0
+
+    def set_thread_pool(self, thread_pool):
+        self.thread_pool = thread_pool
+
+    def start(self):
+        self.thread_pool.start()
+
+    def stop(self):
+        self.thread_pool.stop()
+
+    def _delete(self, paths):
+        start = time.monotonic()
+
+        for path in paths:
+            self.bytes += overwrite_and_remove(path,
+                                               block_size=self.block_size,
+                                               throttle=self.limiter.consume)
+            self.files += 1
+
+        self.time += time.monotonic() - start
+
+        return paths
+
+    def delete(self, paths):
+        """
+        Securely delete a list of files
+
+        :param paths: A list of absolute paths
+        :return: A deferred fired with the list of the paths processed
+        """
+        return deferToThreadPool(reactor, self.thread_pool, self._delete, list(paths))
+
+    def get_stats(self):
+        """
+        :return: A dictionary with the files and bytes processed and the throughput in bytes per second
+        """
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'throughput': int(self.bytes / self.time) if self.time else 0
+        }
@@ -10,7 +10,16 @@ crypto_backend = default_backend()
 
 
 class SecureTemporaryFile(object):
-    file = None
+    """
+    Temporary file encrypted with AES-CTR with an ephemeral key
+
+    The file is written sequentially by means of write(); the descriptor
+    is kept open across the writes so that a file uploaded in many chunks
+    is not reopened for each of them.
+    """
+    fd = None
+    mode = None
+    writer = None
 
     def __init__(self, filesdir):
         """
@@ -23,15 +32,20 @@ class SecureTemporaryFile(object):
         self.filepath = os.path.join(filesdir, "%s.aes" % self.key_id)
         self.enc = self.cipher.encryptor()
         self.dec = None
+        self.size = 0
 
     def open(self, mode):
-        if self.file is None:
+        if self.fd is None or self.mode != mode:
+            self.close()
+
             if mode == 'w':
                 self.fd = open(self.filepath, 'ab+')
             else:
                 self.fd = open(self.filepath, 'rb')
                 self.dec = self.cipher.decryptor()
 
+            self.mode = mode
+
         return self
 
     def write(self, data):
@@ -39,10 +53,27 @@ class SecureTemporaryFile(object):
             data = data.encode()
 
         self.fd.write(self.enc.update(data))
+        self.size += len(data)
 
     def finalize_write(self):
         self.fd.write(self.enc.finalize())
 
+    def truncate(self, size):
+        """
+        Discard the data written after the specified size
+
+        :param size: The size to be restored
+        """
+        self.open('w')
+        self.fd.truncate(size)
+
+        # CTR allows to restart the keystream from any block of the file
+        counter = (int.from_bytes(self.key_counter_nonce, 'big') + size // 16) % (1 << 128)
+        cipher = Cipher(algorithms.AES(self.key), modes.CTR(counter.to_bytes(16, 'big')), backend=crypto_backend)
+        self.enc = cipher.encryptor()
+        self.enc.update(b'\0' * (size % 16))
+        self.size = size
+
     def read(self, c=None):
         if c is None:
             data = self.fd.read()
@@ -58,6 +89,7 @@ class SecureTemporaryFile(object):
         if self.fd is not None:
             self.fd.close()
             self.fd = None
+            self.mode = None
 
     def __enter__(self):
         return self
@@ -3,44 +3,207 @@ from collections import OrderedDict
 
 from twisted.internet import reactor
 
+from globaleaks.utils.log import log
+
+
 class TempDict(OrderedDict):
+    """
+    Dictionary whose entries expire after a timeout since their last access
+
+    The expiration is implemented by means of a timing wheel: the entries
+    are kept in buckets by the tick of their expiration so that inserting
+    and touching an entry cost O(1) and a single periodic call, active only
+    while the dictionary is not empty, expires the due buckets.
+
+    Subclasses could declare secondary indexes mapping a name to a function
+    of the items; the indexes are kept updated on insert, delete and expire
+    and allow to find the keys of the items by the value of the function.
+    """
     expireCallback = None
     reactor = reactor
 
+    # Duration of a tick of the wheel in seconds
+    resolution = 1
+
+    # Secondary indexes: name -> function computing the indexed value of an item
+    indexes = {}
+
     def __init__(self, timeout=None):
         self.timeout = timeout
+        self.slots = {}
+        self.wheel = {}
+        self.tick_call = None
+        self.last_tick = None
+        self.index = {name: {} for name in self.indexes}
+        self.indexed_values = {}
         OrderedDict.__init__(self)
 
     def get_timeout(self):
         return self.timeout
 
+    def schedule(self, key, item):
+        now = self.reactor.seconds()
+        deadline = now + self.get_timeout()
+        slot = int(-(-deadline // self.resolution))
+
+        item.expireTime = deadline
+
+        if self.slots.get(key) != slot:
+            self.unschedule(key)
+            self.slots[key] = slot
+            self.wheel.setdefault(slot, {})[key] = None
+
+        if self.tick_call is None:
+            if self.last_tick is None:
+                self.last_tick = int(now // self.resolution)
+
+            self.tick_call = self.reactor.callLater((self.last_tick + 1) * self.resolution - now, self.tick)
+
+    def unschedule(self, key):
+        slot = self.slots.pop(key, None)
+        bucket = self.wheel.get(slot)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.wheel[slot]
+
+    def tick(self):
+        self.tick_call = None
+
+        now = int(self.reactor.seconds() // self.resolution)
+
+        if now - self.last_tick > len(self.wheel):
+            # after a long pause only the existing buckets are visited
+            due = sorted(slot for slot in self.wheel if slot <= now)
+        else:
+            due = range(self.last_tick + 1, now + 1)
+
+        self.last_tick = now
+
+        for slot in due:
+            # The keys are expired one at a time while their bucket is still
+            # registered as the expire callbacks could touch or delete the
+            # other keys of the bucket
+            while slot in self.wheel:
+                key = next(iter(self.wheel[slot]))
+                self.unschedule(key)
+                self._expire(key)
+
+        # The next tick could have already been scheduled by the callbacks
+        if self.slots:
+            if self.tick_call is None:
+                self.tick_call = self.reactor.callLater((now + 1) * self.resolution - self.reactor.seconds(), self.tick)
+        else:
+            if self.tick_call is not None:
+                self.tick_call.cancel()
+                self.tick_call = None
+
+            self.last_tick = None
+
     def set(self, key, item):
-        timeout = self.get_timeout()
-        item.expireCall = self.reactor.callLater(timeout, self._expire, key)
+        self.schedule(key, item)
         self[key] = item
 
     def get(self, key):
+        item = OrderedDict.get(self, key)
+        if item is not None:
+            self.schedule(key, item)
+
+        return item
+
+    def delete(self, key):
+        self.pop(key, None)
+
+    def lookup(self, name, value):
+        """
+        Find the keys of the items by means of a secondary index
+
+        :param name: The name of the index
+        :param value: The indexed value
+        :return: The list of the keys of the matching items
+        """
+        return list(self.index[name].get(value, ()))
+
+    def index_add(self, key, item):
+        values = self.indexed_values[key] = {}
+
+        for name, function in self.indexes.items():
+            value = values[name] = function(item)
+            self.index[name].setdefault(value, {})[key] = None
+
+    def index_remove(self, key):
+        for name, value in self.indexed_values.pop(key, {}).items():
+            keys = self.index[name][value]
+            del keys[key]
+            if not keys:
+                del self.index[name][value]
+
+    def __setitem__(self, key, item):
+        if self.indexes:
+            self.index_remove(key)
+            self.index_add(key, item)
+
+        OrderedDict.__setitem__(self, key, item)
+
+    def __delitem__(self, key):
+        OrderedDict.__delitem__(self, key)
+        self.unschedule(key)
+        self.index_remove(key)
+
+    # The following methods are implemented by means of __setitem__ and
+    # __delitem__ as OrderedDict does not necessarily invoke them
+
+    def pop(self, key, *default):
         if key not in self:
-            return
+            if default:
+                return default[0]
 
-        if self[key].expireCall is not None:
-            self[key].expireCall.reset(self.get_timeout())
+            raise KeyError(key)
 
-        return self[key]
+        item = OrderedDict.__getitem__(self, key)
+        del self[key]
+        return item
 
-    def delete(self, key):
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError('dictionary is empty')
+
+        key = next(reversed(self)) if last else next(iter(self))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
         if key not in self:
-            return
+            self[key] = default
+
+        return OrderedDict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, item in OrderedDict(*args, **kwargs).items():
+            self[key] = item
+
+    def clear(self):
+        OrderedDict.clear(self)
+        self.slots.clear()
+        self.wheel.clear()
+        self.indexed_values.clear()
+
+        for index in self.index.values():
+            index.clear()
+
+        if self.tick_call is not None:
+            self.tick_call.cancel()
+            self.tick_call = None
 
-        item = self.pop(key)
-        item.expireCall.cancel()  # pylint: disable=no-member
-        self._expire(key)
+        self.last_tick = None
 
     def _expire(self, key):
         if key not in self:
             return
 
-        if self.expireCallback is not None:
-            self.expireCallback(self[key])  #pylint: disable=now-callable
+        try:
+            if self.expireCallback is not None:
+                self.expireCallback(self[key])  #pylint: disable=now-callable
+        except Exception as e:
+            log.err("Error while expiring a temporary entry: %s", e)
 
         del self[key]
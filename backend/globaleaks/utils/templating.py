@@ -4,6 +4,7 @@
 # mainly in mail notifications.
 import collections
 import copy
+import re
 
 from datetime import datetime, timedelta
 
@@ -141,6 +142,58 @@ def indent_text(text, n=1):
     return '\n'.join([('  ' * n if not l.isspace() else '') + l for l in text.splitlines()])
 
 
+keyword_regexp = re.compile(r'(\{[A-Za-z]+\})')
+
+
+class CompiledTemplate(object):
+    """
+    Template parsed into a list of literal and keyword segments
+    """
+    def __init__(self, template, keyword_list):
+        self.segments = keyword_regexp.split(template)
+        keywords = set(keyword_list)
+        self.keywords = [(i, x) for i, x in enumerate(self.segments) if i % 2 and x in keywords]
+
+    def render(self, keyword_converter, values):
+        """
+        Render the template
+
+        :param keyword_converter: The keyword converter providing the values
+        :param values: A dict of the values already resolved, updated with the new ones
+        :return: The rendered text
+        """
+        segments = list(self.segments)
+
+        for i, kw in self.keywords:
+            if kw not in values:
+                # if {SomeKeyword} matches, call keyword_converter.SomeKeyword function
+                values[kw] = getattr(keyword_converter, kw[1:-1])()
+
+            segments[i] = values[kw]
+
+        return ''.join(segments)
+
+
+compiled_templates = {}
+
+
+def compile_template(template, keyword_class):
+    """
+    Return the compiled representation of a template, parsing it only once
+    for each template text and keyword class
+    """
+    key = (template, keyword_class)
+
+    compiled_template = compiled_templates.get(key)
+    if compiled_template is None:
+        if len(compiled_templates) >= 4096:
+            compiled_templates.clear()
+
+        compiled_template = compiled_templates[key] = CompiledTemplate(template, keyword_class.keyword_list)
+
+    return compiled_template
+
+
 class Keyword(object):
     keyword_list = []
     data_keys = []
@@ -721,17 +774,21 @@ supported_template_types = {
 
 class Templating(object):
     def format_template(self, raw_template, data):
-        keyword_converter = supported_template_types[data['type']](data)
-        for _ in range(3):
-            count = 0
+        keyword_class = supported_template_types[data['type']]
+        keyword_converter = keyword_class(data)
+        values = {}
+
+        for i in range(3):
+            # only the original template is cached; the following passes
+            # resolve the keywords eventually contained in the values
+            if i == 0:
+                template = compile_template(raw_template, keyword_class)
+            else:
+                template = CompiledTemplate(raw_template, keyword_class.keyword_list)
 
-            for kw in keyword_converter.keyword_list:
-                if raw_template.count(kw):
-                    # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
-                    variable_content = getattr(keyword_converter, kw[1:-1])()
-                    raw_template = raw_template.replace(kw, variable_content)
+            count = len(template.keywords)
 
-                    count += 1
+            raw_template = template.render(keyword_converter, values)
 
             # remove lines with only {Blank}
             raw_template = raw_template.replace('\n{Blank}\n', '\n')
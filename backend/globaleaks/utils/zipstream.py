@@ -11,18 +11,28 @@ import os
 import struct
 import time
 import zlib
+from io import BytesIO
 
 __all__ = ["ZipStream"]
 
 ZIP64_LIMIT = (1 << 31) - 1
+ZIP_STORED = 0
 ZIP_DEFLATED = 8
 
+# Content already compressed or encrypted that is stored without deflating it
+incompressible_extensions = ('.pgp', '.gpg', '.asc',
+                             '.7z', '.bz2', '.gz', '.rar', '.tgz', '.xz', '.zip',
+                             '.docx', '.odp', '.ods', '.odt', '.pptx', '.xlsx',
+                             '.gif', '.heic', '.jpeg', '.jpg', '.png', '.webp',
+                             '.aac', '.flac', '.m4a', '.mp3', '.oga', '.ogg', '.opus',
+                             '.avi', '.m4v', '.mkv', '.mov', '.mp4', '.ogv', '.webm')
+
 # Here are some struct module formats for reading headers
 structEndArchive = b"<4s4H2lH"     # 9 items, end of archive, 22 bytes
 stringEndArchive = b"PK\005\006"   # magic number for end of archive record
 structCentralDir = b"<4s4B4HLLL5HLl"  # 19 items, central directory, 46 bytes
 stringCentralDir = b"PK\001\002"   # magic number for central directory
-structFileHeader = b"<4s2B4HlLL2H"  # 12 items, file header record, 30 bytes
+structFileHeader = b"<4s2B4HLLL2H"  # 12 items, file header record, 30 bytes
 stringFileHeader = b"PK\003\004"   # magic number for file header
 structEndArchive64Locator = b"<4slql"  # 4 items, locate Zip64 header, 20 bytes
 stringEndArchive64Locator = b"PK\x06\x07"  # magic token for locator header
@@ -83,6 +93,10 @@ class ZipInfo(object):
         self.compress_size = 0
         self.file_size = 0
 
+        if compression == ZIP_STORED:
+            # Stored entries are supported by extractors unaware of the deflate method
+            self.create_version = self.extract_version = 10
+
     def _encodeFilenameFlags(self):
         if isinstance(self.filename, str):
             try:
@@ -137,7 +151,30 @@ class ZipInfo(object):
         return header + filename + extra
 
 
+def get_compression(arcname):
+    """
+    Select the compression method of an entry on the base of its name
+
+    :param arcname: The name of the entry in the archive
+    :return: ZIP_STORED for content that would not benefit of the compression, else ZIP_DEFLATED
+    """
+    return ZIP_STORED if arcname.lower().endswith(incompressible_extensions) else ZIP_DEFLATED
+
+
 class ZipStream(object):
+    """
+    Generator of a ZIP archive of a list of files
+
+    Each file is described by a dictionary with the name of the entry and
+    either the file object ('fo') or the path ('path') of the content; the
+    content is read once and the archive is produced sequentially so that
+    it could be streamed while it is generated.
+
+    The archive is available by iterating the object or, as a file object,
+    by means of read().
+    """
+    chunk_size = 64 * 1024
+
     def __init__(self, files):
         self.files = files
 
@@ -146,6 +183,10 @@ class ZipStream(object):
 
         self.time = time.gmtime()[0:6]  # Security: Forced Time
 
+        self.iterator = None
+        self.buffer = []
+        self.buffer_size = 0
+
     def update_data_ptr(self, data):
         """
         As data is added to the archive, update a pointer so we can determine
@@ -158,11 +199,11 @@ class ZipStream(object):
         self.data_ptr += len(data)
         return data
 
-    def zipinfo_open(self, arcname):
+    def zipinfo_open(self, arcname, level=zlib.Z_DEFAULT_COMPRESSION):
         zinfo = ZipInfo(arcname, self.time, ZIP_DEFLATED)
         zinfo.header_offset = self.data_ptr
 
-        cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        cmpr = zlib.compressobj(level, zlib.DEFLATED, -15)
 
         header = zinfo.FileHeader()
 
@@ -177,6 +218,7 @@ class ZipStream(object):
         zinfo.CRC = binascii.crc32(chunk, zinfo.CRC) & 0xffffffff
 
         chunk = cmpr.compress(chunk)
+
         zinfo.compress_size += len(chunk)
 
         self.update_data_ptr(chunk)
@@ -193,14 +235,59 @@ class ZipStream(object):
 
         return buf + trailer
 
+    def zip_data(self, data, arcname):
+        """
+        Add an entry whose content is available in memory
+
+        The sizes and the CRC of the entry are computed in advance and
+        written in the file header without the need of a data descriptor.
+        """
+        compression = get_compression(arcname)
+
+        zinfo = ZipInfo(arcname, self.time, compression)
+        zinfo.header_offset = self.data_ptr
+        zinfo.flag_bits &= ~0x08
+        zinfo.file_size = len(data)
+        zinfo.CRC = binascii.crc32(data) & 0xffffffff
+
+        if compression == ZIP_DEFLATED:
+            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            data = cmpr.compress(data) + cmpr.flush()
+
+        zinfo.compress_size = len(data)
+
+        self.filelist.append(zinfo)
+
+        yield self.update_data_ptr(zinfo.FileHeader())
+        yield self.update_data_ptr(data)
+
     def zip_fo(self, fo, arcname):
-        zipinfo, cmpr, header = self.zipinfo_open(arcname)
+        if isinstance(fo, BytesIO):
+            return self.zip_data(fo.getvalue(), arcname)
+
+        return self.zip_stream(fo, arcname)
+
+    def zip_stream(self, fo, arcname):
+        """
+        Add an entry whose content is read sequentially
+
+        As the CRC of the entry is known only at its end it is written in a
+        data descriptor, that extractors like the java ZipInputStream accept
+        only for deflated entries; the content that would not benefit of the
+        compression is therefore deflated without compression (stored blocks).
+        """
+        if get_compression(arcname) == ZIP_STORED:
+            level = zlib.Z_NO_COMPRESSION
+        else:
+            level = zlib.Z_DEFAULT_COMPRESSION
+
+        zipinfo, cmpr, header = self.zipinfo_open(arcname, level)
 
         yield header
 
         with fo:
             while True:
-                buf = fo.read(8 * 1024)
+                buf = fo.read(self.chunk_size)
                 if not buf:
                     break
 
@@ -310,3 +397,39 @@ class ZipStream(object):
                     yield data
 
         yield self.archive_footer()
+
+    def read(self, size=-1):
+        """
+        Read the archive as a file object
+
+        :param size: The maximum number of bytes to be returned
+        :return: The next data of the archive; b'' once the archive is complete
+        """
+        if self.iterator is None:
+            self.iterator = iter(self)
+
+        while size < 0 or self.buffer_size < size:
+            data = next(self.iterator, None)
+            if data is None:
+                break
+
+            if data:
+                self.buffer.append(data)
+                self.buffer_size += len(data)
+
+        data = b''.join(self.buffer)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self.buffer, self.buffer_size = [rest], len(rest)
+        else:
+            self.buffer, self.buffer_size = [], 0
+
+        return data
+
+    def close(self):
+        if self.iterator is not None:
+            self.iterator.close()
+
+        for f in self.files:
+            if 'fo' in f:
+                f['fo'].close()